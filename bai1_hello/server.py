@@ -1,8 +1,13 @@
 import grpc
 from concurrent import futures
+import os
+import sys
 import hello_pb2
 import hello_pb2_grpc
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.metrics import MetricsInterceptor, start_metrics_server
+
 
 class GreeterServicer(hello_pb2_grpc.GreeterServicer):
     def SayHello(self, request, context):
@@ -11,10 +16,13 @@ class GreeterServicer(hello_pb2_grpc.GreeterServicer):
 
 
 def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=10), interceptors=[MetricsInterceptor()]
+    )
     hello_pb2_grpc.add_GreeterServicer_to_server(GreeterServicer(), server)
     server.add_insecure_port('[::]:50051')
     server.start()
+    start_metrics_server(50051)
     print("Server started on port 50051")
     server.wait_for_termination()
 
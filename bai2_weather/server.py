@@ -1,9 +1,14 @@
 import grpc
 from concurrent import futures
 import time
+import os
+import sys
 import weather_pb2
 import weather_pb2_grpc
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.metrics import MetricsInterceptor, start_metrics_server
+
 
 class WeatherServiceServicer(weather_pb2_grpc.WeatherServiceServicer):
     def GetWeatherForecast(self, request, context):
@@ -32,12 +37,15 @@ class WeatherServiceServicer(weather_pb2_grpc.WeatherServiceServicer):
 
 
 def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=10), interceptors=[MetricsInterceptor()]
+    )
     weather_pb2_grpc.add_WeatherServiceServicer_to_server(
         WeatherServiceServicer(), server
     )
     server.add_insecure_port('[::]:50052')
     server.start()
+    start_metrics_server(50052)
     print("Weather Server started on port 50052")
     server.wait_for_termination()
 
@@ -1,52 +1,137 @@
 import grpc
+import os
 import sys
 import time
 import log_pb2
 import log_pb2_grpc
 
+# Kích thước tối đa mỗi chunk (byte, đã encode), phải nhỏ hơn giới hạn message 4 MB mặc định
+# của gRPC; chừa chỗ cho line_count, timestamp và tag của field
+DEFAULT_CHUNK_BYTES = 64 * 1024
+MAX_CHUNK_BYTES = 4 * 1024 * 1024 - 1024
+MODES = ("line", "lines", "bytes")
+
+
+def generate_log_requests(lines):
+    """UploadLog: mỗi dòng một LogRequest"""
+    for line in lines:
+        request = log_pb2.LogRequest(
+            line=line.strip(),
+            timestamp=time.time_ns()
+        )
+        yield request
+
+
+def _field_size(size):
+    """Số byte một phần tử của repeated string chiếm khi encode: tag + độ dài (varint) + UTF-8"""
+    return 1 + max(1, (size.bit_length() + 6) // 7) + size
+
+
+def generate_line_chunks(log_file, chunk_bytes):
+    """UploadLogChunks: gom các dòng vào LogChunk.lines, mỗi chunk không quá chunk_bytes khi
+    encode (kể cả dòng rỗng); dòng dài hơn chunk_bytes thì báo lỗi"""
+    with open(log_file, 'r', encoding='utf-8', newline='\n') as f:
+        lines, size = [], 0
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            field_size = _field_size(len(line.encode('utf-8')))
+            if size + field_size > chunk_bytes:
+                if field_size > chunk_bytes:
+                    raise ValueError(f"Line {number} is longer than chunk_bytes ({chunk_bytes})")
+                yield log_pb2.LogChunk(lines=lines, timestamp=time.time_ns())
+                lines, size = [], 0
+            lines.append(line)
+            size += field_size
+        if lines:
+            yield log_pb2.LogChunk(lines=lines, timestamp=time.time_ns())
+
+
+def generate_byte_chunks(log_file, chunk_bytes):
+    """UploadLogChunks: đọc file theo block, cắt ở "\\n" cuối cùng của block (phần dòng dở dang
+    nối vào đầu block sau, block sau đọc ít đi để chunk không quá chunk_bytes), gửi nguyên bytes
+    kèm số dòng, không tách từng dòng; dòng dài hơn chunk_bytes thì báo lỗi"""
+    with open(log_file, 'rb') as f:
+        rest, offset = b"", 0
+        while True:
+            block = f.read(chunk_bytes - len(rest))
+            if not block:
+                break
+            data = rest + block if rest else block
+            end = data.rfind(b"\n") + 1
+            if not end:
+                if len(data) >= chunk_bytes:
+                    raise ValueError(f"Line at byte {offset} is longer than chunk_bytes ({chunk_bytes})")
+                rest = data
+                continue
+            offset += end
+            data, rest = data[:end], data[end:]
+            yield log_pb2.LogChunk(data=data, line_count=data.count(b"\n"), timestamp=time.time_ns())
+        if rest:  # dòng cuối không có "\n"
+            yield log_pb2.LogChunk(data=rest + b"\n", line_count=1, timestamp=time.time_ns())
+
+
+def _record_errors(chunks, errors):
+    """gRPC chỉ báo "Exception iterating requests!" khi generator lỗi: giữ lại lỗi để in ra"""
+    try:
+        yield from chunks
+    except ValueError as e:
+        errors.append(e)
+        raise
+
 
 def run():
     if len(sys.argv) < 2:
-        print("Usage: python client.py <log_file.txt>")
+        print("Usage: python client.py <log_file.txt> [line|lines|bytes] [chunk_bytes]")
         sys.exit(1)
-    
+
     log_file = sys.argv[1]
-    
-    try:
-        with open(log_file, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-    except FileNotFoundError:
+    mode = sys.argv[2] if len(sys.argv) > 2 else "bytes"
+    chunk_bytes = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_CHUNK_BYTES
+    if mode not in MODES:
+        print(f"Error: mode must be one of {', '.join(MODES)}")
+        sys.exit(1)
+    if not 0 < chunk_bytes <= MAX_CHUNK_BYTES:
+        print(f"Error: chunk_bytes must be between 1 and {MAX_CHUNK_BYTES}")
+        sys.exit(1)
+
+    if not os.path.isfile(log_file):
         print(f"Error: File '{log_file}' not found")
         sys.exit(1)
-    
+
     channel = grpc.insecure_channel('localhost:50053')
     stub = log_pb2_grpc.LogServiceStub(channel)
-    
-    def generate_log_requests():
-        start_time = time.time_ns()
-        for line in lines:
-            request = log_pb2.LogRequest(
-                line=line.strip(),
-                timestamp=time.time_ns()
-            )
-            yield request
-    
-    print(f"Uploading {len(lines)} lines from {log_file}...\n")
-    
+
+    errors = []
+    start = time.perf_counter()
     try:
-        response = stub.UploadLog(generate_log_requests())
+        if mode == "line":
+            # RPC cũ, mỗi dòng một message
+            # Chỉ "\n" kết thúc dòng (như chế độ bytes), "\r" của CRLF bị strip() bỏ
+            with open(log_file, 'r', encoding='utf-8', newline='\n') as f:
+                lines = f.readlines()
+            print(f"Uploading {len(lines)} lines from {log_file}...\n")
+            response = stub.UploadLog(generate_log_requests(lines))
+        else:
+            print(f"Uploading {os.path.getsize(log_file)} bytes from {log_file} "
+                  f"in {chunk_bytes}-byte chunks ({mode})...\n")
+            if mode == "lines":
+                chunks = generate_line_chunks(log_file, chunk_bytes)
+            else:
+                chunks = generate_byte_chunks(log_file, chunk_bytes)
+            response = stub.UploadLogChunks(_record_errors(chunks, errors))
+        elapsed = time.perf_counter() - start
         print("\n" + "="*50)
         print("Upload Summary:")
         print(f"Total lines received: {response.total_lines}")
         print(f"Total size: {response.total_size} bytes ({response.total_size/1024:.2f} KB)")
         print(f"Duration: {response.duration_seconds:.2f} seconds")
+        print(f"Throughput: {response.total_size / elapsed / 1e6:.2f} MB/s")
         print("="*50)
     except grpc.RpcError as e:
-        print(f"Error: {e.code()}")
-    
+        print(f"Error: {errors[0] if errors else e.code()}")
+
     channel.close()
 
 
 if __name__ == '__main__':
     run()
-
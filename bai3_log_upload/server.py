@@ -1,9 +1,31 @@
 import grpc
 from concurrent import futures
 import time
+import os
+import sys
 import log_pb2
 import log_pb2_grpc
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.metrics import MetricsInterceptor, start_metrics_server
+
+# Khoảng trắng ASCII mà str.strip() bỏ (bytes.strip() mặc định không bỏ \x1c-\x1f)
+_ASCII_WHITESPACE = b" \t\r\x0b\x0c\x1c\x1d\x1e\x1f"
+
+
+def stripped_size(data, lines):
+    """Số byte của block như khi strip() từng dòng (như UploadLog / lines): bỏ "\\n" và khoảng
+    trắng đầu / cuối dòng (kể cả "\\r" của CRLF). Tách dòng và strip trên bytes, chỉ decode
+    những dòng có ký tự non-ASCII ở đầu / cuối (có thể là khoảng trắng Unicode như U+00A0)"""
+    stripped = [line.strip(_ASCII_WHITESPACE) for line in data.split(b"\n", lines)[:lines]]
+    size = sum(map(len, stripped))
+    if not data.isascii():
+        for line in stripped:
+            if line and (line[0] >= 0x80 or line[-1] >= 0x80):
+                size -= len(line) - len(line.decode("utf-8", "surrogateescape").strip()
+                                        .encode("utf-8", "surrogateescape"))
+    return size
+
 
 class LogServiceServicer(log_pb2_grpc.LogServiceServicer):
     def UploadLog(self, request_iterator, context):
@@ -37,15 +59,61 @@ class LogServiceServicer(log_pb2_grpc.LogServiceServicer):
             end_time=end_time,
             duration_seconds=duration
         )
+    
+    def UploadLogChunks(self, request_iterator, context):
+        total_lines = 0
+        total_size = 0
+        total_chunks = 0
+        start_time = None
+        end_time = None
+        
+        print("Receiving chunked log stream...")
+        
+        for chunk in request_iterator:
+            if start_time is None:
+                start_time = chunk.timestamp
+            
+            if chunk.data:
+                # Block bytes thô: không decode / tách dòng, chỉ đếm
+                lines = chunk.line_count or chunk.data.count(b"\n")
+                size = stripped_size(chunk.data, lines)
+            else:
+                lines = len(chunk.lines)
+                size = sum(len(line.encode('utf-8')) for line in chunk.lines)
+            
+            total_chunks += 1
+            total_lines += lines
+            total_size += size
+            end_time = chunk.timestamp
+            
+            print(f"Received chunk {total_chunks}: {lines} lines, {size} bytes")
+        
+        duration = (end_time - start_time) / 1e9 if start_time else 0.0
+        
+        print(f"\nUpload complete!")
+        print(f"Total chunks: {total_chunks}")
+        print(f"Total lines: {total_lines}")
+        print(f"Total size: {total_size} bytes")
+        
+        return log_pb2.LogResponse(
+            total_lines=total_lines,
+            total_size=total_size,
+            start_time=start_time,
+            end_time=end_time,
+            duration_seconds=duration
+        )
 
 
 def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=10), interceptors=[MetricsInterceptor()]
+    )
     log_pb2_grpc.add_LogServiceServicer_to_server(
         LogServiceServicer(), server
     )
     server.add_insecure_port('[::]:50053')
     server.start()
+    start_metrics_server(50053)
     print("Log Server started on port 50053")
     server.wait_for_termination()
 
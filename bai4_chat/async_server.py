@@ -0,0 +1,179 @@
+"""
+Chat Server - chế độ async
+grpc.aio server: mỗi stream là một coroutine chờ trên asyncio.Queue thay vì giữ một
+worker thread trong suốt thời gian kết nối, nên số client kết nối đồng thời chỉ bị
+giới hạn bởi bộ nhớ chứ không phải số thread. Log trên đĩa (CHAT_LOG_DIR) được ghi và đọc
+trong worker thread, fsync hay đọc segment lạnh không chặn event loop
+"""
+import asyncio
+import grpc
+import time
+import os
+import sys
+from concurrent import futures
+import chat_pb2
+import chat_pb2_grpc
+from bus import ChatRouter, create_bus
+from chat_log import open_chat_log
+from history import HistoryStore
+from hub import (CHAT_BATCH_FLUSH_MS, CHAT_BATCH_MAX, CHAT_BATCH_MAX_BYTES, AsyncOutbox, ChatHub, add_chat_handler,
+                 encode, encode_batch)
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.metrics import REGISTRY, AsyncMetricsInterceptor, start_metrics_server
+
+# Thông báo join/leave tới mọi client, tắt (0) khi có rất nhiều client vì mỗi lần join là O(clients)
+CHAT_PRESENCE = os.getenv("CHAT_PRESENCE", "1") == "1"
+
+
+class AsyncChatServiceServicer(chat_pb2_grpc.ChatServiceServicer):
+    def __init__(self):
+        # client_id -> AsyncOutbox (có giới hạn) các message (bytes) chờ gửi
+        self.hub = ChatHub(AsyncOutbox)
+        # room_id -> ring buffer, log trên đĩa nếu có CHAT_LOG_DIR; một thread ghi log nên giữ đúng thứ tự
+        log = open_chat_log()
+        self.log_executor = futures.ThreadPoolExecutor(max_workers=1) if log is not None else None
+        self.history = HistoryStore(log=log, log_executor=self.log_executor)
+        # Client ở node này đi qua hub, client ở process khác (CHAT_BUS) đi qua bus
+        self.router = ChatRouter(self.hub, self.history, create_bus())
+
+    async def Chat(self, request_iterator, context):
+        # Nhận message đầu tiên để lấy client_id
+        try:
+            first_request = await request_iterator.__anext__()
+        except (StopAsyncIteration, grpc.RpcError):
+            return
+
+        client_id = first_request.client_id
+        outbox = self.hub.outbox()
+        await self._replay(outbox, "", first_request, lambda: self.hub.subscribe(client_id, outbox))
+        self.router.announce(client_id)
+        if CHAT_PRESENCE:
+            print(f"Client {client_id} joined the chat")
+            self._broadcast(self._server_message(f"{client_id} joined the chat", chat_pb2.MessageType.JOIN),
+                            exclude_client=client_id)
+
+        reader = asyncio.create_task(self._read_messages(client_id, first_request, request_iterator, outbox))
+        try:
+            # Client mới (supports_batch) nhận nhiều message trong một envelope, client cũ nhận từng message
+            batching = CHAT_BATCH_MAX > 1 and first_request.supports_batch
+            while True:
+                msg = await outbox.get()
+                if msg is None:  # client đóng stream hoặc bị ngắt vì đọc chậm
+                    break
+                if batching:
+                    if CHAT_BATCH_FLUSH_MS and len(outbox) < CHAT_BATCH_MAX:
+                        await asyncio.sleep(CHAT_BATCH_FLUSH_MS / 1000)  # chờ gom thêm message
+                    msg = encode_batch(outbox.drain(msg, CHAT_BATCH_MAX, CHAT_BATCH_MAX_BYTES))
+                yield msg
+            if outbox.evicted:
+                await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED,
+                                    f"Client {client_id} is too slow, message queue is full")
+        finally:
+            reader.cancel()
+            self.router.unsubscribe(client_id, outbox)
+            if CHAT_PRESENCE:
+                self._broadcast(self._server_message(f"{client_id} left the chat", chat_pb2.MessageType.LEAVE),
+                                exclude_client=client_id)
+                print(f"Client {client_id} left the chat")
+
+    async def _read_messages(self, client_id, first_request, request_iterator, outbox):
+        try:
+            await self._handle_message(client_id, first_request)
+            async for request in request_iterator:
+                await self._handle_message(client_id, request)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error in chat stream: {e}")
+        finally:
+            outbox.close()
+
+    async def _handle_message(self, client_id, request):
+        if request.type == chat_pb2.MessageType.PRIVATE:
+            if not self._send_private(request, request.target_client_id):
+                self._send_error(client_id, f"User {request.target_client_id} not found")
+        elif request.type == chat_pb2.MessageType.JOIN_ROOM:
+            await self._join_room(client_id, request)
+        elif request.type == chat_pb2.MessageType.LEAVE_ROOM:
+            self._leave_room(client_id, request.room_id)
+        elif request.message:
+            # Broadcast message (message rỗng đầu tiên chỉ dùng để join), room_id rỗng là toàn cục
+            if request.room_id and not self.hub.in_room(request.room_id, client_id):
+                self._send_error(client_id, f"You are not in room {request.room_id}")
+            else:
+                self.router.publish(client_id, request)
+
+    async def _join_room(self, client_id, request):
+        room_id = request.room_id
+        if not room_id:
+            self._send_error(client_id, "room_id is required")
+        elif await self._replay(self.hub.get(client_id), room_id, request,
+                          lambda: self.hub.join_room(room_id, client_id)):
+            # Thông báo trong room là O(room), không bị ảnh hưởng bởi CHAT_PRESENCE
+            self._broadcast(self._server_message(f"{client_id} joined room {room_id}",
+                                                 chat_pb2.MessageType.JOIN_ROOM, room_id), room_id=room_id)
+
+    def _leave_room(self, client_id, room_id):
+        if not self.hub.in_room(room_id, client_id):
+            self._send_error(client_id, f"You are not in room {room_id}")
+            return
+        self._broadcast(self._server_message(f"{client_id} left room {room_id}",
+                                             chat_pb2.MessageType.LEAVE_ROOM, room_id), room_id=room_id)
+        self.hub.leave_room(room_id, client_id)
+
+    async def _replay(self, outbox, room_id, request, subscribe):
+        """Đăng ký nhận broadcast (subscribe) rồi gửi lại các message client bỏ lỡ (since_seq /
+        since_timestamp trong message join); False nếu subscribe không thành công.
+        Phần cũ hơn ring được đọc từ log trong worker thread trước khi đăng ký; từ lúc đăng ký tới
+        lúc lấy replay không có await nên broadcast mới không chen vào trước hay trùng với replay"""
+        cold = None
+        if self.history.needs_log(room_id, request.since_seq, request.since_timestamp):
+            cold = await asyncio.to_thread(self.history.read_log, room_id, request.since_timestamp)
+        items = self.history.replay(room_id, request.since_seq, request.since_timestamp, subscribe, cold,
+                                    outbox)
+        return items is not None
+
+    @staticmethod
+    def _server_message(text, message_type, room_id=""):
+        return chat_pb2.ChatMessage(
+            client_id="SERVER",
+            message=text,
+            timestamp=int(time.time() * 1000),
+            type=message_type,
+            room_id=room_id
+        )
+
+    def _send_error(self, client_id, text):
+        self._send_private(self._server_message(text, chat_pb2.MessageType.BROADCAST), client_id)
+
+    def _broadcast(self, message, exclude_client=None, room_id=""):
+        # Serialize một lần cho mọi người nhận
+        self.router.broadcast(encode(message), exclude_client, room_id)
+
+    def _send_private(self, message, target_client_id):
+        return self.router.send(encode(message), target_client_id)
+
+
+async def serve():
+    server = grpc.aio.server(interceptors=[AsyncMetricsInterceptor()])
+    servicer = AsyncChatServiceServicer()
+    add_chat_handler(servicer, server)
+    REGISTRY.add_collector(servicer.hub.collect)
+    REGISTRY.add_collector(servicer.router.bus.collect)
+    server.add_insecure_port('[::]:50054')
+    await server.start()
+    servicer.router.start_async(asyncio.get_running_loop())
+    start_metrics_server(50054)
+    print(f"Async Chat Server {servicer.router.node_id} started on port 50054")
+    try:
+        await server.wait_for_termination()
+    finally:
+        servicer.router.bus.close()
+        if servicer.history.log is not None:
+            servicer.log_executor.shutdown()  # ghi nốt các record đang chờ
+            servicer.history.log.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(serve())
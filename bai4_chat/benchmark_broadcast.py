@@ -0,0 +1,197 @@
+"""
+Benchmark fan-out broadcast trong process (không qua mạng), so sánh:
+- locked: cách cũ, một lock toàn cục giữ suốt vòng lặp broadcast, mỗi stream người nhận
+  tự serialize lại ChatMessage
+- hub:    ChatHub + Outbox, snapshot copy-on-write không giữ lock khi fan-out, serialize một lần
+- router: đường đi thật của broadcast toàn cục: ChatRouter.publish -> HistoryStore (gán seq
+  trong lock của room "") -> fan-out ngoài lock theo thứ tự seq; join/leave đi qua
+  HistoryStore.replay như server nên phải chờ fan-out các message xếp trước nó (để replay không
+  bị message mới chen vào trước). Đây là cái giá của thứ tự seq theo người nhận: sender không
+  chờ nhau, join chờ các fan-out đã xếp hàng
+Vài thread gửi broadcast song song trong khi một thread khác liên tục join/leave để đo
+thời gian chờ lock của thay đổi membership; cuối cùng drain mọi queue như stream gRPC
+(locked phải SerializeToString từng message, hub lấy thẳng bytes).
+Phần rooms: với nhiều client cùng kết nối, broadcast trong room chỉ tốn theo số thành viên
+của room, join/leave room tốn thời gian như nhau bất kể room lớn hay nhỏ
+
+Usage: python benchmark_broadcast.py [deliveries] [senders] [room_clients]
+"""
+import functools
+import queue
+import sys
+import threading
+import time
+import chat_pb2
+from bus import ChatRouter, LocalBus
+from history import HistoryStore
+from hub import ChatHub, Outbox, encode
+
+
+class LockedRegistry:
+    def __init__(self):
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, client_id, outbox):
+        with self.lock:
+            self.clients[client_id] = outbox
+
+    def unsubscribe(self, client_id, outbox):
+        with self.lock:
+            if self.clients.get(client_id) is outbox:
+                del self.clients[client_id]
+
+    def broadcast(self, message, exclude_client=None):
+        with self.lock:
+            for cid, outbox in self.clients.items():
+                if cid != exclude_client:
+                    outbox.put(message)
+
+
+class RouterRegistry:
+    """ChatRouter + HistoryStore + ChatHub, join/leave room chung như server"""
+
+    def __init__(self):
+        self.hub = ChatHub(maxsize=0)
+        self.history = HistoryStore()
+        self.router = ChatRouter(self.hub, self.history, LocalBus())
+
+    def subscribe(self, client_id, outbox):
+        self.history.replay("", subscribe=lambda: self.hub.subscribe(client_id, outbox), outbox=outbox)
+
+    def unsubscribe(self, client_id, outbox):
+        self.hub.unsubscribe(client_id, outbox)
+
+
+def send_router(registry, message):
+    request = chat_pb2.ChatMessage()
+    request.CopyFrom(message)  # publish gán seq vào message, mỗi lần gửi một message riêng
+    registry.router.publish(request.client_id, request)
+
+
+def send_locked(registry, message):
+    registry.broadcast(message)
+
+
+def send_hub(hub, message):
+    hub.broadcast(encode(message))
+
+
+def drain_locked(outbox):
+    count = 0
+    while True:
+        try:
+            outbox.get_nowait().SerializeToString()
+        except queue.Empty:
+            return count
+        count += 1
+
+
+def drain_hub(outbox):
+    count = 0
+    while len(outbox):
+        outbox.get()
+        count += 1
+    return count
+
+
+def run(registry, outbox_class, send, drain, clients, messages_per_sender, senders):
+    outboxes = [outbox_class() for _ in range(clients)]
+    for i, outbox in enumerate(outboxes):
+        registry.subscribe(f"client{i}", outbox)
+
+    message = chat_pb2.ChatMessage(client_id="sender", message="x" * 100,
+                                   timestamp=int(time.time() * 1000))
+    stop = threading.Event()
+    join_waits = []
+
+    def churn():
+        outbox = outbox_class()
+        while not stop.is_set():
+            start = time.perf_counter()
+            registry.subscribe("churn", outbox)
+            registry.unsubscribe("churn", outbox)
+            join_waits.append(time.perf_counter() - start)
+            time.sleep(0.001)
+
+    def sender():
+        for _ in range(messages_per_sender):
+            send(registry, message)
+
+    churn_thread = threading.Thread(target=churn, daemon=True)
+    churn_thread.start()
+    threads = [threading.Thread(target=sender) for _ in range(senders)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    broadcast_seconds = time.perf_counter() - start
+    stop.set()
+    churn_thread.join()
+
+    delivered = sum(drain(outbox) for outbox in outboxes)
+    total_seconds = time.perf_counter() - start
+    return {
+        "delivered": delivered,
+        "broadcast_seconds": broadcast_seconds,
+        "total_seconds": total_seconds,
+        "max_join_wait": max(join_waits) if join_waits else 0.0,
+    }
+
+
+def run_rooms(clients, room_size, deliveries):
+    hub = ChatHub(maxsize=0)
+    outboxes = [Outbox(0) for _ in range(clients)]
+    for i, outbox in enumerate(outboxes):
+        hub.subscribe(f"client{i}", outbox)
+    for i in range(room_size):
+        hub.join_room("room", f"client{i}")
+
+    data = encode(chat_pb2.ChatMessage(client_id="sender", message="x" * 100, room_id="room"))
+    messages = max(1, deliveries // room_size)
+    start = time.perf_counter()
+    for _ in range(messages):
+        hub.broadcast(data, room_id="room")
+    broadcast_seconds = time.perf_counter() - start
+
+    # join + leave của một client khác, room đã có room_size thành viên
+    hub.subscribe("churn", Outbox(0))
+    rounds = 10000
+    start = time.perf_counter()
+    for _ in range(rounds):
+        hub.join_room("room", "churn")
+        hub.leave_room("room", "churn")
+    membership_seconds = (time.perf_counter() - start) / rounds
+    return messages / broadcast_seconds, membership_seconds
+
+
+def main():
+    deliveries = int(sys.argv[1]) if len(sys.argv) > 1 else 400000
+    senders = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    room_clients = int(sys.argv[3]) if len(sys.argv) > 3 else 20000
+
+    print(f"{'clients':>8} {'impl':>7} {'deliveries/s':>13} {'broadcasts/s':>13} {'max join wait':>14}")
+    for clients in (10, 100, 1000, 5000, 20000):
+        messages_per_sender = max(1, deliveries // (clients * senders))
+        for name, registry, outbox_class, send, drain in (
+            ("locked", LockedRegistry(), queue.Queue, send_locked, drain_locked),
+            ("hub", ChatHub(maxsize=0), functools.partial(Outbox, 0), send_hub, drain_hub),
+            ("router", RouterRegistry(), functools.partial(Outbox, 0), send_router, drain_hub),
+        ):
+            result = run(registry, outbox_class, send, drain, clients, messages_per_sender, senders)
+            broadcasts = messages_per_sender * senders
+            print(f"{clients:>8} {name:>7} "
+                  f"{result['delivered'] / result['total_seconds']:>13,.0f} "
+                  f"{broadcasts / result['broadcast_seconds']:>13,.1f} "
+                  f"{result['max_join_wait'] * 1000:>11.2f} ms")
+
+    print(f"\nRooms, {room_clients} clients connected")
+    print(f"{'room size':>10} {'broadcasts/s':>13} {'join+leave':>12}")
+    for room_size in (10, 100, 1000, room_clients):
+        broadcasts_per_second, membership_seconds = run_rooms(room_clients, room_size, deliveries)
+        print(f"{room_size:>10} {broadcasts_per_second:>13,.1f} {membership_seconds * 1e6:>9.2f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark log chat trên đĩa (chat_log.py)
+- append: số record/s khi ghi qua HistoryStore (ring buffer + log) với các CHAT_LOG_FSYNC_MS
+  khác nhau, so với chỉ ring buffer
+- read: mở lại log (recovery), bỏ page cache của các segment (posix_fadvise DONTNEED) rồi đo
+  read_since từ các mốc thời gian khác nhau, lọc theo room, lần đọc lạnh và lần đọc lại (ấm)
+
+Usage: python benchmark_log.py [records] [directory]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import chat_pb2
+from chat_log import ChatLog
+from history import HistoryStore
+
+ROOMS = 100
+
+
+def message(i):
+    return chat_pb2.ChatMessage(client_id=f"client{i % 1000}", message="x" * 100,
+                                timestamp=int(time.time() * 1000), room_id=f"room{i % ROOMS}")
+
+
+def bench_append(directory, records, fsync_ms):
+    """records/s qua HistoryStore.append; fsync_ms=None là không có log"""
+    shutil.rmtree(directory, ignore_errors=True)
+    log = ChatLog(directory, fsync_ms=fsync_ms) if fsync_ms is not None else None
+    store = HistoryStore(log=log)
+    messages = [message(i) for i in range(records)]
+    start = time.perf_counter()
+    for msg in messages:
+        store.append(msg.room_id, msg)
+    if log is not None:
+        log.close()
+    return records / (time.perf_counter() - start)
+
+
+def drop_page_cache(log):
+    for segment in log.segments:
+        fd = os.open(segment.path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def bench_read(directory, records):
+    shutil.rmtree(directory, ignore_errors=True)
+    # Segment nhỏ để có nhiều segment; timestamp giả lập 1 message / ms
+    log = ChatLog(directory, segment_bytes=4 * 1024 * 1024, fsync_ms=50)
+    base = int(time.time() * 1000) - records
+    for i in range(records):
+        msg = message(i)
+        log.append(msg.room_id, msg.SerializeToString(), base + i)
+    log.close()
+
+    start = time.perf_counter()
+    log = ChatLog(directory, segment_bytes=4 * 1024 * 1024, fsync_ms=50)
+    reopen_seconds = time.perf_counter() - start
+    size = sum(segment.size for segment in log.segments)
+    print(f"\n{records} records, {size / 1e6:.0f} MB in {len(log.segments)} segments, "
+          f"reopen {reopen_seconds * 1000:.1f} ms")
+
+    print(f"{'since':>14} {'room':>7} {'limit':>6} {'returned':>9} {'cold':>10} {'warm':>10}")
+    for since, room_id, limit in (
+        (base + records - 1000, None, None),     # 1000 message gần nhất
+        (base + records - 100000, "room7", 1000),  # lịch sử một room, giới hạn như replay
+        (base + records // 2, "room7", None),    # nửa sau của log, một room
+        (base + records // 2, None, None),       # nửa sau của log, mọi room
+    ):
+        drop_page_cache(log)
+        start = time.perf_counter()
+        result = log.read_since(since, room_id, limit)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        log.read_since(since, room_id, limit)
+        warm = time.perf_counter() - start
+        print(f"{'T-' + str(base + records - since):>14} {room_id or 'all':>7} {limit or '-':>6} "
+              f"{len(result):>9} {cold * 1000:>7.2f} ms {warm * 1000:>7.2f} ms")
+    log.close()
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    directory = sys.argv[2] if len(sys.argv) > 2 else os.path.join(tempfile.gettempdir(), "chat_log_bench")
+    try:
+        print(f"{'fsync':>10} {'records/s':>12}")
+        for fsync_ms in (None, 0, 5, 50, 500):
+            # fsync sau mỗi record chậm hơn nhiều bậc, chạy ít record hơn
+            n = min(records, 2000) if fsync_ms == 0 else min(records, 200000)
+            label = "no log" if fsync_ms is None else f"{fsync_ms} ms"
+            print(f"{label:>10} {bench_append(directory, n, fsync_ms):>12,.0f}")
+        bench_read(directory, records)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
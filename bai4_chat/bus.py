@@ -0,0 +1,377 @@
+"""
+Chạy Chat Server nhiều process: các node cùng listen một port (gRPC bật SO_REUSEPORT nên
+kernel chia kết nối cho các process) và trao đổi message qua một bus
+- LocalBus: một process, không có node khác (mặc định)
+- UnixSocketBus (CHAT_BUS=unix): mỗi node một Unix datagram socket <CHAT_BUS_DIR>/<node_id>.sock,
+  publish là gửi frame tới socket của mọi node khác trong thư mục. Server async gửi trên event
+  loop nên không bao giờ chờ: node nhận đầy (net.unix.max_dgram_qlen frame) thì frame vào hàng
+  đợi có giới hạn của node đó, gửi tiếp khi socket ghi được (add_writer); hàng đợi đầy mới bỏ
+  frame và đếm. Server sync gửi từ worker thread (sau khi đã ra khỏi History), chờ tối đa
+  CHAT_BUS_SEND_TIMEOUT
+ChatRouter đứng giữa servicer và ChatHub: broadcast được gửi tới mọi node và mỗi node fan-out
+cho client của mình; private message được gửi thẳng tới node đang giữ client đích, dựa trên
+directory client_id -> node dựng từ các thông báo JOIN / LEAVE / SYNC giữa các node.
+Seq và lịch sử là của từng node: node nhận broadcast từ bus tự gán seq và lưu vào history
+của mình, client reconnect sang node khác nên replay bằng since_timestamp
+"""
+import collections
+import os
+import socket
+import struct
+import threading
+import chat_pb2
+
+CHAT_BUS = os.getenv("CHAT_BUS", "")  # "" = một process, "unix" = Unix datagram sockets
+CHAT_BUS_DIR = os.getenv("CHAT_BUS_DIR", "/tmp/chat_bus")
+CHAT_NODE_ID = os.getenv("CHAT_NODE_ID", f"node{os.getpid()}")
+# Server sync: thời gian tối đa một worker thread chờ khi node khác đầy, quá thì bỏ frame
+CHAT_BUS_SEND_TIMEOUT = float(os.getenv("CHAT_BUS_SEND_TIMEOUT", "0.5"))
+# Server async: số frame tối đa chờ gửi tới một node đang đầy, quá thì bỏ frame
+CHAT_BUS_PENDING_MAX = int(os.getenv("CHAT_BUS_PENDING_MAX", "10000"))
+# Frame lớn nhất nhận được; Unix datagram bị giới hạn bởi buffer của socket
+MAX_FRAME_SIZE = 256 * 1024
+
+# Loại frame
+PUBLISH = 1    # broadcast của client: node nhận gán seq, lưu history rồi fan-out
+BROADCAST = 2  # thông báo của server (join / leave ...), chỉ fan-out
+PRIVATE = 3    # key = client_id đích
+JOIN = 4       # key = client_id vừa kết nối vào node gửi
+LEAVE = 5
+HELLO = 6      # node mới khởi động, các node khác trả lời SYNC
+SYNC = 7       # data = các client_id của node gửi, cách nhau bởi "\n"
+
+_HEADER = struct.Struct("!BBH")  # kind, len(node_id), len(key)
+
+
+def pack(kind, node_id, key="", data=b""):
+    node = node_id.encode("utf-8")
+    key = key.encode("utf-8")
+    return _HEADER.pack(kind, len(node), len(key)) + node + key + data
+
+
+def unpack(frame):
+    kind, node_size, key_size = _HEADER.unpack_from(frame)
+    offset = _HEADER.size
+    node_id = frame[offset:offset + node_size].decode("utf-8")
+    offset += node_size
+    key = frame[offset:offset + key_size].decode("utf-8")
+    return kind, node_id, key, frame[offset + key_size:]
+
+
+class LocalBus:
+    """Bus của một process duy nhất: không có node nào khác để gửi tới"""
+
+    def __init__(self, node_id=CHAT_NODE_ID):
+        self.node_id = node_id
+        self.on_peer_lost = None
+
+    def start(self, handler):
+        pass
+
+    def start_async(self, loop, handler):
+        pass
+
+    def publish(self, frame):
+        pass
+
+    def send(self, node_id, frame):
+        return False
+
+    def collect(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class _Link:
+    """Socket đã connect tới một node: với socket đã connect, kernel báo ghi được theo hàng
+    đợi nhận của node đó. pending: frame chờ gửi khi node đó đầy (server async)"""
+
+    def __init__(self, path, timeout):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.settimeout(timeout)  # 0 = non-blocking
+        try:
+            self.sock.connect(path)
+        except OSError:
+            self.sock.close()
+            raise
+        self.pending = collections.deque()
+
+
+class UnixSocketBus:
+    """Mỗi node bind một Unix datagram socket trong directory; node khác được tìm bằng cách
+    liệt kê thư mục (cache, quét lại khi có node mới gửi tới hoặc node cũ biến mất)"""
+
+    def __init__(self, node_id=CHAT_NODE_ID, directory=CHAT_BUS_DIR, send_timeout=CHAT_BUS_SEND_TIMEOUT,
+                 pending_max=CHAT_BUS_PENDING_MAX):
+        self.node_id = node_id
+        self.directory = directory
+        self.on_peer_lost = None  # callback(node_id) khi node khác không còn
+        os.makedirs(directory, exist_ok=True)
+        self.path = self._path(node_id)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self.sock.bind(self.path)
+        self.send_timeout = send_timeout
+        self.pending_max = pending_max
+        self.loop = None  # event loop của server async, None = server sync
+        self.dropped = 0  # frame bị bỏ vì node nhận đầy
+        self._links = {}  # node_id -> _Link
+        # Server sync gửi từ nhiều worker thread cùng lúc: lock giữ _links và dropped, không giữ
+        # lúc send (send chờ tới send_timeout)
+        self._lock = threading.Lock()
+        self._peers = None
+
+    def _path(self, node_id):
+        return os.path.join(self.directory, f"{node_id}.sock")
+
+    def peers(self):
+        peers = self._peers
+        if peers is None:
+            peers = self._peers = tuple(
+                name[:-len(".sock")] for name in os.listdir(self.directory)
+                if name.endswith(".sock") and name != f"{self.node_id}.sock"
+            )
+        return peers
+
+    def refresh(self):
+        self._peers = None
+
+    def publish(self, frame):
+        for node_id in self.peers():
+            self.send(node_id, frame)
+
+    def send(self, node_id, frame):
+        for _ in range(2):
+            link = None
+            try:
+                link = self._link(node_id)
+                if link.pending:
+                    return self._queue(node_id, link, frame)
+                link.sock.send(frame)
+                return True
+            except BlockingIOError:  # node nhận đầy (server async)
+                return self._queue(node_id, link, frame)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Socket cũ của node đã dừng; connect lại một lần vì node có thể vừa khởi động lại cùng id
+                if link is not None:
+                    self._close_link(node_id, link)
+            except OSError:  # hết CHAT_BUS_SEND_TIMEOUT (server sync)
+                self._drop(1)
+                return False
+        # Node đã dừng (socket file còn sót hoặc đã bị xoá)
+        self._peer_lost(node_id)
+        return False
+
+    def _link(self, node_id):
+        link = self._links.get(node_id)
+        if link is None:
+            with self._lock:  # hai thread cùng connect tới một node mới: chỉ một link được tạo
+                link = self._links.get(node_id)
+                if link is None:
+                    timeout = 0 if self.loop is not None else self.send_timeout
+                    link = self._links[node_id] = _Link(self._path(node_id), timeout)
+        return link
+
+    def _drop(self, count):
+        with self._lock:
+            self.dropped += count
+
+    def _queue(self, node_id, link, frame):
+        if len(link.pending) >= self.pending_max:
+            self._drop(1)
+            return False
+        link.pending.append(frame)
+        if len(link.pending) == 1:
+            self.loop.add_writer(link.sock.fileno(), self._flush, node_id, link)
+        return True
+
+    def _flush(self, node_id, link):
+        """Gọi trên event loop khi node nhận ghi được trở lại"""
+        while link.pending:
+            try:
+                link.sock.send(link.pending[0])
+            except BlockingIOError:
+                return
+            except OSError:  # node đã dừng, send sau sẽ connect lại hoặc bỏ node
+                self._close_link(node_id, link)
+                return
+            link.pending.popleft()
+        self.loop.remove_writer(link.sock.fileno())
+
+    def _close_link(self, node_id, link=None):
+        """Đóng link tới node; link: chỉ đóng nếu đó vẫn là link hiện tại (thread khác có thể
+        vừa connect lại)"""
+        with self._lock:
+            if link is None:
+                link = self._links.pop(node_id, None)
+            elif self._links.get(node_id) is link:
+                del self._links[node_id]
+            else:
+                return
+        if link is not None:
+            if link.pending:
+                self.loop.remove_writer(link.sock.fileno())
+                self._drop(len(link.pending))
+            link.sock.close()
+
+    def _peer_lost(self, node_id):
+        self._close_link(node_id)
+        path = self._path(node_id)
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        self.refresh()
+        if self.on_peer_lost:
+            self.on_peer_lost(node_id)
+
+    def start(self, handler):
+        """Nhận frame trong một daemon thread (sync server)"""
+        def receive():
+            while True:
+                try:
+                    frame = self.sock.recv(MAX_FRAME_SIZE)
+                except OSError:
+                    return
+                handler(frame)
+        threading.Thread(target=receive, daemon=True).start()
+
+    def start_async(self, loop, handler):
+        """Nhận frame ngay trên event loop (grpc.aio server), không cần thread; gửi non-blocking"""
+        self.loop = loop
+        for node_id in list(self._links):
+            self._close_link(node_id)
+        self.sock.setblocking(False)
+
+        def receive():
+            while True:
+                try:
+                    frame = self.sock.recv(MAX_FRAME_SIZE)
+                except (BlockingIOError, InterruptedError):
+                    return
+                handler(frame)
+        loop.add_reader(self.sock.fileno(), receive)
+
+    def collect(self):
+        """Samples cho MetricsRegistry.add_collector"""
+        node = {"node": self.node_id}
+        with self._lock:
+            links = list(self._links.values())
+            dropped = self.dropped
+        return [
+            ("chat_bus_peers", "gauge", "Other chat nodes known on the bus", node, len(self.peers())),
+            ("chat_bus_frames_pending", "gauge", "Bus frames waiting for a full node to read", node,
+             sum(len(link.pending) for link in links)),
+            ("chat_bus_frames_dropped_total", "counter", "Bus frames dropped because the receiving node was full",
+             node, dropped),
+        ]
+
+    def close(self):
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        self.sock.close()
+        for node_id in list(self._links):
+            self._close_link(node_id)
+
+
+def create_bus(kind=CHAT_BUS):
+    if not kind:
+        return LocalBus()
+    if kind == "unix":
+        return UnixSocketBus()
+    raise ValueError(f"Unknown chat bus: {kind}")
+
+
+class ChatRouter:
+    """Gửi message tới client ở node này (ChatHub) hoặc ở node khác (bus)"""
+
+    def __init__(self, hub, history, bus):
+        self.hub = hub
+        self.history = history
+        self.bus = bus
+        self.directory = {}  # client_id -> node_id của các client ở node khác
+        bus.on_peer_lost = self._drop_node
+
+    @property
+    def node_id(self):
+        return self.bus.node_id
+
+    def start(self):
+        self.bus.start(self.handle_frame)
+        self.bus.publish(pack(HELLO, self.node_id))
+
+    def start_async(self, loop):
+        self.bus.start_async(loop, self.handle_frame)
+        self.bus.publish(pack(HELLO, self.node_id))
+
+    def announce(self, client_id):
+        """Báo các node khác client vừa kết nối vào node này; gọi sau khi đã đăng ký ở hub (trong
+        replay của room chung), không gọi trong History vì server sync có thể chờ bus"""
+        self.bus.publish(pack(JOIN, self.node_id, client_id))
+
+    def unsubscribe(self, client_id, outbox):
+        self.hub.unsubscribe(client_id, outbox)
+        if self.hub.get(client_id) is None:
+            self.bus.publish(pack(LEAVE, self.node_id, client_id))
+
+    def publish(self, client_id, request):
+        """Broadcast của client: gán seq, lưu history, fan-out ở node này rồi gửi cho node khác.
+        Fan-out theo thứ tự seq của room, ngoài lock của room (xem history.py), nên các sender
+        đồng thời không bị lẫn thứ tự seq"""
+        data = self.history.append(request.room_id, request,
+                                   lambda data: self.hub.broadcast(data, client_id, request.room_id))
+        self.bus.publish(pack(PUBLISH, self.node_id, request.room_id, data))
+
+    def broadcast(self, data, exclude_client=None, room_id=""):
+        self.hub.broadcast(data, exclude_client, room_id)
+        self.bus.publish(pack(BROADCAST, self.node_id, room_id, data))
+
+    def send(self, data, target_client_id):
+        if self.hub.send(data, target_client_id):
+            return True
+        node_id = self.directory.get(target_client_id)
+        return node_id is not None and self.bus.send(node_id, pack(PRIVATE, self.node_id, target_client_id, data))
+
+    def handle_frame(self, frame):
+        kind, node_id, key, data = unpack(frame)
+        if kind == PUBLISH:
+            message = chat_pb2.ChatMessage.FromString(data)
+            self.history.append(key, message, lambda data: self.hub.broadcast(data, room_id=key))
+        elif kind == BROADCAST:
+            self.hub.broadcast(data, room_id=key)
+        elif kind == PRIVATE:
+            self.hub.send(data, key)
+        elif kind == JOIN:
+            self.directory[key] = node_id
+        elif kind == LEAVE:
+            if self.directory.get(key) == node_id:
+                del self.directory[key]
+        elif kind == HELLO:
+            self.bus.refresh()
+            self._sync(node_id)
+        elif kind == SYNC:
+            for client_id in data.decode("utf-8").split("\n"):
+                if client_id:
+                    self.directory[client_id] = node_id
+
+    def _sync(self, node_id):
+        """Gửi danh sách client của node này cho node mới, chia thành nhiều frame nhỏ"""
+        chunk, size = [], 0
+        for client_id, _ in self.hub.subscribers():
+            chunk.append(client_id)
+            size += len(client_id) + 1
+            if size > 32 * 1024:
+                self.bus.send(node_id, pack(SYNC, self.node_id, data="\n".join(chunk).encode("utf-8")))
+                chunk, size = [], 0
+        if chunk:
+            self.bus.send(node_id, pack(SYNC, self.node_id, data="\n".join(chunk).encode("utf-8")))
+
+    def _drop_node(self, node_id):
+        for client_id in [cid for cid, node in self.directory.items() if node == node_id]:
+            self.directory.pop(client_id, None)
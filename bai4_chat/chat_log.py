@@ -0,0 +1,276 @@
+"""
+Log chat trên đĩa (tuỳ chọn, bật bằng CHAT_LOG_DIR): append-only, chia thành nhiều segment
+- Record: [length uint32][timestamp int64 ms][len(room_id) uint16][room_id][ChatMessage đã serialize],
+  length là độ dài phần sau nó; room_id nằm trong header để lọc theo room mà không parse protobuf
+- Segment <số thứ tự>.log, sang segment mới khi vượt CHAT_LOG_SEGMENT_BYTES
+- Ghi qua buffer của file, một thread nền flush + fsync mỗi CHAT_LOG_FSYNC_MS (gom nhiều record
+  vào một lần fsync); mất tối đa khoảng thời gian đó nếu máy sập. fsync chạy sau khi nhả lock
+  (trên bản dup của fd) nên append không phải chờ đĩa
+- Index thưa <số thứ tự>.idx: cứ mỗi CHAT_LOG_INDEX_INTERVAL byte ghi một cặp (timestamp, offset),
+  đọc lịch sử từ timestamp T chỉ cần bisect index rồi quét tiếp từ offset đó. Bisect và việc bỏ
+  qua segment cần timestamp không giảm theo thứ tự ghi: append kẹp timestamp không nhỏ hơn
+  record trước (kể cả record cuối trên đĩa lúc mở lại log)
+- Đọc bằng mmap, chỉ copy payload của các record được trả về
+"""
+import bisect
+import collections
+import mmap
+import os
+import struct
+import threading
+import time
+
+CHAT_LOG_DIR = os.getenv("CHAT_LOG_DIR", "")
+CHAT_LOG_SEGMENT_BYTES = int(os.getenv("CHAT_LOG_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+CHAT_LOG_FSYNC_MS = int(os.getenv("CHAT_LOG_FSYNC_MS", "50"))  # 0 = fsync sau mỗi record
+CHAT_LOG_INDEX_INTERVAL = int(os.getenv("CHAT_LOG_INDEX_INTERVAL", "4096"))
+# Số segment giữ lại, segment cũ nhất bị xoá khi vượt (0 = giữ tất cả)
+CHAT_LOG_MAX_SEGMENTS = int(os.getenv("CHAT_LOG_MAX_SEGMENTS", "0"))
+
+RECORD_HEADER = struct.Struct("!IqH")   # length, timestamp, len(room_id)
+INDEX_ENTRY = struct.Struct("!qQ")      # timestamp, offset trong segment
+
+
+class Segment:
+    def __init__(self, directory, number):
+        self.number = number
+        self.path = os.path.join(directory, f"{number:010d}.log")
+        self.index_path = os.path.join(directory, f"{number:010d}.idx")
+        self.timestamps = []  # index thưa: timestamp của record đầu mỗi khoảng
+        self.offsets = []
+        self.size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def load_index(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+            usable = len(data) - len(data) % INDEX_ENTRY.size
+            for timestamp, offset in INDEX_ENTRY.iter_unpack(data[:usable]):
+                if offset < self.size:
+                    self.timestamps.append(timestamp)
+                    self.offsets.append(offset)
+
+    def recover(self, index_interval):
+        """Quét từ index entry cuối tới hết file: bỏ record ghi dở (máy sập giữa chừng)
+        và dựng lại các index entry chưa kịp ghi"""
+        start = self.offsets[-1] if self.offsets else 0
+        last_indexed = start if self.offsets else -index_interval
+        new_entries = []
+        valid_end = start
+        if self.size:
+            with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                position = start
+                while position + RECORD_HEADER.size <= self.size:
+                    length, timestamp, _ = RECORD_HEADER.unpack_from(mm, position)
+                    end = position + 4 + length
+                    if length < RECORD_HEADER.size - 4 or end > self.size:
+                        break
+                    if position - last_indexed >= index_interval:
+                        new_entries.append((timestamp, position))
+                        last_indexed = position
+                    position = valid_end = end
+        if valid_end < self.size:
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_end)
+            self.size = valid_end
+            # Index entry trỏ vào phần vừa bị cắt cũng phải bỏ
+            while self.offsets and self.offsets[-1] >= valid_end:
+                self.offsets.pop()
+                self.timestamps.pop()
+            with open(self.index_path, "wb") as f:
+                for timestamp, offset in zip(self.timestamps, self.offsets):
+                    f.write(INDEX_ENTRY.pack(timestamp, offset))
+        if new_entries:
+            with open(self.index_path, "ab") as f:
+                for timestamp, offset in new_entries:
+                    f.write(INDEX_ENTRY.pack(timestamp, offset))
+                    self.timestamps.append(timestamp)
+                    self.offsets.append(offset)
+
+    def first_timestamp(self):
+        return self.timestamps[0] if self.timestamps else None
+
+    def last_timestamp(self):
+        """Timestamp của record cuối (quét từ index entry cuối), 0 nếu segment rỗng"""
+        timestamp = 0
+        position = self.offsets[-1] if self.offsets else 0
+        if self.size:
+            with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                while position + RECORD_HEADER.size <= self.size:
+                    length, timestamp, _ = RECORD_HEADER.unpack_from(mm, position)
+                    position += 4 + length
+        return timestamp
+
+    def start_offset(self, timestamp):
+        """Offset để bắt đầu quét các record có timestamp > timestamp"""
+        i = bisect.bisect_left(self.timestamps, timestamp) - 1
+        return self.offsets[i] if i >= 0 else 0
+
+
+class ChatLog:
+    def __init__(self, directory=CHAT_LOG_DIR, segment_bytes=CHAT_LOG_SEGMENT_BYTES,
+                 fsync_ms=CHAT_LOG_FSYNC_MS, index_interval=CHAT_LOG_INDEX_INTERVAL,
+                 max_segments=CHAT_LOG_MAX_SEGMENTS):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_ms = fsync_ms
+        self.index_interval = index_interval
+        self.max_segments = max_segments
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        numbers = sorted(int(name[:-4]) for name in os.listdir(directory) if name.endswith(".log"))
+        self.segments = [Segment(directory, number) for number in numbers] or [Segment(directory, 1)]
+        self.active = self.segments[-1]
+        for segment in self.segments:
+            segment.load_index()
+            if segment is self.active or (segment.size and not segment.offsets):
+                segment.recover(index_interval)
+        # Timestamp của record cuối trên đĩa: record mới không được nhỏ hơn (xem append)
+        self.last_timestamp = 0
+        for segment in reversed(self.segments):
+            if segment.size:
+                self.last_timestamp = segment.last_timestamp()
+                break
+        self._open_active()
+
+        self.dirty = False
+        self.closed = False
+        if fsync_ms:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    def _open_active(self):
+        self.file = open(self.active.path, "ab")
+        self.index_file = open(self.active.index_path, "ab")
+        self.last_indexed = self.active.offsets[-1] if self.active.offsets else -self.index_interval
+
+    def append(self, room_id, data, timestamp=None):
+        """Ghi một message đã serialize; trả về timestamp (ms) đã ghi, không nhỏ hơn timestamp
+        của record trước"""
+        if timestamp is None:
+            timestamp = int(time.time() * 1000)
+        room = room_id.encode("utf-8")
+        fds = []
+        with self.lock:
+            timestamp = max(timestamp, self.last_timestamp)
+            self.last_timestamp = timestamp
+            header = RECORD_HEADER.pack(RECORD_HEADER.size - 4 + len(room) + len(data), timestamp, len(room))
+            if self.active.size >= self.segment_bytes:
+                fds.append(self._roll())
+            segment = self.active
+            offset = segment.size
+            if offset - self.last_indexed >= self.index_interval:
+                self.index_file.write(INDEX_ENTRY.pack(timestamp, offset))
+                segment.timestamps.append(timestamp)
+                segment.offsets.append(offset)
+                self.last_indexed = offset
+            self.file.write(header)
+            self.file.write(room)
+            self.file.write(data)
+            segment.size += len(header) + len(room) + len(data)
+            self.dirty = True
+            if not self.fsync_ms:
+                fds.append(self._flush())
+        for fd in fds:
+            self._fsync(fd)
+        return timestamp
+
+    def _roll(self):
+        """Sang segment mới; trả về fd của segment cũ để fsync sau khi nhả lock"""
+        fd = self._flush()
+        self.file.close()
+        self.index_file.close()
+        self.active = Segment(self.directory, self.active.number + 1)
+        self.segments.append(self.active)
+        self._open_active()
+        while self.max_segments and len(self.segments) > self.max_segments:
+            oldest = self.segments.pop(0)
+            for path in (oldest.path, oldest.index_path):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+        return fd
+
+    def _flush(self):
+        """Đẩy buffer xuống OS (gọi khi giữ lock); trả về bản dup của fd để fsync sau khi nhả
+        lock, vì file có thể bị đóng (roll / close) trong lúc fsync"""
+        self.file.flush()
+        self.index_file.flush()
+        self.dirty = False
+        return os.dup(self.file.fileno())
+
+    @staticmethod
+    def _fsync(fd):
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _flush_loop(self):
+        while not self.closed:
+            time.sleep(self.fsync_ms / 1000)
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            fd = self._flush() if self.dirty and not self.closed else None
+        if fd is not None:
+            self._fsync(fd)
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            fd = self._flush()
+            self.closed = True
+            self.file.close()
+            self.index_file.close()
+        self._fsync(fd)
+
+    def first_timestamp(self):
+        return self.segments[0].first_timestamp()
+
+    def read_since(self, timestamp, room_id=None, limit=None):
+        """Payload (bytes) các record có timestamp > timestamp theo thứ tự ghi, lọc theo room nếu có.
+        limit: chỉ lấy limit record mới nhất; quét từ segment mới nhất về trước, đủ thì dừng"""
+        with self.lock:
+            # Dữ liệu còn trong buffer của file phải xuống OS thì mmap mới thấy
+            self.file.flush()
+            # Bỏ qua segment mà record đầu của segment sau đã không mới hơn timestamp
+            segments = [
+                (segment, segment.size) for segment, following in zip(self.segments, self.segments[1:] + [None])
+                if segment.size and (following is None or (following.first_timestamp() or 0) > timestamp)
+            ]
+        room = room_id.encode("utf-8") if room_id is not None else None
+        chunks = []  # payload của từng segment, segment mới nhất trước
+        remaining = limit or None
+        for segment, size in reversed(segments):
+            try:
+                f = open(segment.path, "rb")
+            except FileNotFoundError:  # vừa bị xoá do CHAT_LOG_MAX_SEGMENTS
+                continue
+            with f, mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+                # Chỉ giữ vị trí của remaining record cuối, copy payload sau khi quét xong segment
+                matches = collections.deque(maxlen=remaining)
+                position = segment.start_offset(timestamp)
+                while position < size:
+                    length, record_timestamp, room_size = RECORD_HEADER.unpack_from(mm, position)
+                    end = position + 4 + length
+                    if record_timestamp > timestamp:
+                        room_start = position + RECORD_HEADER.size
+                        if room is None or mm[room_start:room_start + room_size] == room:
+                            matches.append((room_start + room_size, end))
+                    position = end
+                chunks.append([mm[start:end] for start, end in matches])
+            if limit:
+                remaining -= len(matches)
+                if not remaining:
+                    break
+        return [data for chunk in reversed(chunks) for data in chunk]
+
+
+def open_chat_log(directory=CHAT_LOG_DIR):
+    """None nếu không cấu hình CHAT_LOG_DIR"""
+    return ChatLog(directory) if directory else None
@@ -0,0 +1,152 @@
+"""
+Kiểm tra Chat Server nhiều process (cluster.py, CHAT_BUS=unix): chạy 2 node cùng port 50054,
+mở client cho tới khi có client ở cả hai node (node của mỗi client xác định qua chat_subscribers
+trên /metrics của từng node), rồi kiểm tra giữa hai client ở hai node khác nhau:
+- broadcast trong room, theo cả hai chiều
+- broadcast toàn cục
+- private message, theo cả hai chiều
+
+Usage: python check_cluster.py [server_script]
+"""
+import asyncio
+import subprocess
+import sys
+import time
+import urllib.request
+import grpc
+import chat_pb2
+import chat_pb2_grpc
+from cluster import start_cluster, stop_cluster
+from soak_test import CHAT_SERVER
+
+NODES = 2
+MAX_CLIENTS = 20
+ROOM = "cluster-room"
+TIMEOUT = 5
+
+
+def subscribers(node):
+    with urllib.request.urlopen(f"http://localhost:{60054 + node}/metrics", timeout=5) as response:
+        for line in response.read().decode("utf-8").splitlines():
+            if line.startswith("chat_subscribers "):
+                return int(float(line.rsplit(" ", 1)[1]))
+    return 0
+
+
+def check(name, condition):
+    print(f"{'OK  ' if condition else 'FAIL'} {name}")
+    return condition
+
+
+class Client:
+    """Một stream Chat trên channel (HTTP/2 connection) riêng, để kernel chia cho node bất kỳ"""
+
+    def __init__(self, client_id, index):
+        self.client_id = client_id
+        self.channel = grpc.aio.insecure_channel(CHAT_SERVER, options=[("grpc.use_local_subchannel_pool", 1),
+                                                                        ("grpc.check_cluster_index", index)])
+        self._requests = asyncio.Queue()
+        self._received = asyncio.Queue()
+        self.call = chat_pb2_grpc.ChatServiceStub(self.channel).Chat(self._request_stream())
+        self._reader = asyncio.create_task(self._read())
+
+    async def _request_stream(self):
+        while True:
+            request = await self._requests.get()
+            if request is None:
+                return
+            yield request
+
+    async def _read(self):
+        try:
+            async for response in self.call:
+                await self._received.put(response)
+        except grpc.aio.AioRpcError:
+            pass
+
+    def send(self, **fields):
+        self._requests.put_nowait(chat_pb2.ChatMessage(client_id=self.client_id, **fields))
+
+    async def expect(self, predicate):
+        """Chờ message thoả predicate (bỏ qua các message khác), False nếu quá TIMEOUT"""
+        deadline = time.perf_counter() + TIMEOUT
+        while True:
+            try:
+                response = await asyncio.wait_for(self._received.get(), deadline - time.perf_counter())
+            except asyncio.TimeoutError:
+                return False
+            if predicate(response):
+                return True
+
+    async def close(self):
+        self._requests.put_nowait(None)
+        self._reader.cancel()
+        await asyncio.gather(self._reader, return_exceptions=True)
+        await self.channel.close()
+
+
+async def connect_on_each_node():
+    """Mở client tới khi mỗi node có ít nhất một client; trả về (client ở node 0, client ở node 1, mọi client)"""
+    clients, by_node = [], {}
+    counts = [0] * NODES
+    for i in range(MAX_CLIENTS):
+        client = Client(f"cluster{i}", i)
+        clients.append(client)
+        client.send()
+        client.send(message="ready", target_client_id=client.client_id, type=chat_pb2.MessageType.PRIVATE)
+        if not await client.expect(lambda m: m.message == "ready"):
+            continue
+        new_counts = [subscribers(node) for node in range(NODES)]
+        node = next(node for node in range(NODES) if new_counts[node] > counts[node])
+        counts = new_counts
+        by_node.setdefault(node, client)
+        if len(by_node) == NODES:
+            break
+    return by_node.get(0), by_node.get(1), clients
+
+
+async def run():
+    first, second, clients = await connect_on_each_node()
+    try:
+        if not check(f"clients on both nodes after {len(clients)} connections",
+                     first is not None and second is not None):
+            return False
+        ok = True
+        for client in (first, second):
+            client.send(room_id=ROOM, type=chat_pb2.MessageType.JOIN_ROOM)
+            ok &= check(f"{client.client_id} joined {ROOM}",
+                        await client.expect(lambda m: m.type == chat_pb2.MessageType.JOIN_ROOM
+                                            and m.message == f"{client.client_id} joined room {ROOM}"))
+
+        for sender, receiver, direction in ((first, second, "node0 -> node1"), (second, first, "node1 -> node0")):
+            text = f"room message from {sender.client_id}"
+            sender.send(room_id=ROOM, message=text)
+            ok &= check(f"room broadcast {direction}",
+                        await receiver.expect(lambda m: m.message == text and m.room_id == ROOM and m.seq))
+
+            text = f"private message from {sender.client_id}"
+            sender.send(message=text, target_client_id=receiver.client_id, type=chat_pb2.MessageType.PRIVATE)
+            ok &= check(f"private message {direction}",
+                        await receiver.expect(lambda m: m.message == text and m.client_id == sender.client_id))
+
+        text = "global message"
+        first.send(message=text)
+        ok &= check("global broadcast node0 -> node1", await second.expect(lambda m: m.message == text))
+    finally:
+        await asyncio.gather(*(client.close() for client in clients))
+    return ok
+
+
+def main():
+    server_script = sys.argv[1] if len(sys.argv) > 1 else "async_server.py"
+    processes = start_cluster(NODES, server_script, stdout=subprocess.DEVNULL)
+    try:
+        time.sleep(1)
+        ok = asyncio.run(run())
+    finally:
+        stop_cluster(processes)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Kiểm tra thứ tự seq của Chat Server (ChatRouter + HistoryStore + ChatHub, không cần chạy server):
+- Nhiều thread cùng gửi vào một room (như server sync): người nhận thấy seq tăng dần, đủ message
+- Client join room giữa chừng với since_seq: replay + message mới liền nhau, không trùng không thiếu
+- Room bị LRU (CHAT_HISTORY_MAX_ROOMS) bỏ rồi dùng lại: seq tiếp tục, không quay về 1
+
+Usage: python check_ordering.py [senders] [messages_per_sender]
+"""
+import sys
+import threading
+import time
+import chat_pb2
+from bus import ChatRouter, LocalBus
+from history import HistoryStore
+from hub import ChatHub
+
+ROOM = "room1"
+
+
+class YieldingHub(ChatHub):
+    """Nhường CPU trước khi fan-out, như worker thread của gRPC bị chen ngang giữa lúc gán seq
+    và lúc đưa vào outbox; fan-out không theo thứ tự seq của room là lẫn thứ tự ngay"""
+
+    def broadcast(self, data, exclude_client=None, room_id=""):
+        time.sleep(0)
+        super().broadcast(data, exclude_client, room_id)
+
+
+def check(name, condition):
+    print(f"{'OK  ' if condition else 'FAIL'} {name}")
+    return condition
+
+
+def seqs(outbox):
+    result = []
+    while len(outbox):
+        data = outbox.get()
+        if data is not None:
+            result.append(chat_pb2.ChatMessage.FromString(data).seq)
+    return result
+
+
+def join(hub, history, client_id, since_seq=0):
+    """Như _replay của server: đăng ký + replay, History đưa replay vào outbox"""
+    outbox = hub.outbox()
+    hub.subscribe(client_id, outbox)
+    history.replay(ROOM, since_seq, subscribe=lambda: hub.join_room(ROOM, client_id), outbox=outbox)
+    return outbox
+
+
+def check_concurrent_senders(senders, per_sender):
+    total = senders * per_sender
+    hub = YieldingHub(maxsize=0)
+    history = HistoryStore(size=total)
+    router = ChatRouter(hub, history, LocalBus())
+    receiver = join(hub, history, "receiver")
+    late = {}
+    start = threading.Barrier(senders + 1)
+
+    def send(i):
+        start.wait()
+        for n in range(per_sender):
+            router.publish(f"sender{i}", chat_pb2.ChatMessage(client_id=f"sender{i}", room_id=ROOM,
+                                                               message=str(n)))
+
+    def join_late():
+        start.wait()
+        while history.get(ROOM) is None or history.get(ROOM).next_seq < total // 2:
+            pass
+        late["outbox"] = join(hub, history, "late", since_seq=1)
+
+    previous = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # đổi thread thường xuyên để dễ lộ race
+    try:
+        threads = [threading.Thread(target=send, args=(i,)) for i in range(senders)]
+        threads.append(threading.Thread(target=join_late))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(previous)
+
+    received = seqs(receiver)
+    out_of_order = sum(1 for a, b in zip(received, received[1:]) if b <= a)
+    ok = check(f"{senders} concurrent senders: {len(received)}/{total} received, {out_of_order} out of order",
+               len(received) == total and out_of_order == 0)
+    late_seqs = seqs(late["outbox"])
+    ok &= check(f"late join with since_seq=1: {len(late_seqs)} messages, replay and live contiguous",
+                late_seqs == list(range(2, total + 1)))
+    return ok
+
+
+def check_eviction():
+    history = HistoryStore(size=10, max_rooms=2)
+    for _ in range(5):
+        history.append("a", chat_pb2.ChatMessage(message="x"))
+    for room_id in ("b", "c"):  # "a" bị LRU bỏ
+        history.append(room_id, chat_pb2.ChatMessage(message="x"))
+    evicted = history.get("a") is None
+    message = chat_pb2.ChatMessage(message="x")
+    history.append("a", message)
+    replayed = [chat_pb2.ChatMessage.FromString(data).seq for data in history.replay("a", since_seq=1)]
+    return check(f"room reused after LRU eviction continues at seq {message.seq}, replay {replayed}",
+                 evicted and message.seq == 6 and replayed == [6])
+
+
+def main():
+    senders = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    per_sender = int(sys.argv[2]) if len(sys.argv) > 2 else 250
+    ok = check_concurrent_senders(senders, per_sender)
+    ok &= check_eviction()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,8 @@ class ChatClient:
         self.channel = grpc.insecure_channel('localhost:50054')
         self.stub = chat_pb2_grpc.ChatServiceStub(self.channel)
         self.running = True
+        self.room_id = ""  # room hiện tại, rỗng = chat chung
+        self.last_seq = {}  # room_id -> seq lớn nhất đã nhận, join lại room sẽ replay phần bỏ lỡ
     
     def send_message(self, message, target_id=None):
         msg_type = chat_pb2.MessageType.PRIVATE if target_id else chat_pb2.MessageType.BROADCAST
@@ -21,25 +23,51 @@ class ChatClient:
             message=message,
             target_client_id=target_id or "",
             timestamp=int(time.time() * 1000),
-            type=msg_type
+            type=msg_type,
+            room_id="" if target_id else self.room_id
         )
     
+    def room_message(self, msg_type, room_id):
+        return chat_pb2.ChatMessage(
+            client_id=self.client_id,
+            timestamp=int(time.time() * 1000),
+            type=msg_type,
+            room_id=room_id,
+            since_seq=self.last_seq.get(room_id, 0) if msg_type == chat_pb2.MessageType.JOIN_ROOM else 0
+        )
+    
+    def show_message(self, response):
+        if response.seq:
+            if response.seq <= self.last_seq.get(response.room_id, 0):
+                return  # đã nhận (trùng giữa replay và broadcast)
+            self.last_seq[response.room_id] = response.seq
+        if response.client_id == "SERVER":
+            print(f"\n[SERVER] {response.message}")
+        elif response.type == chat_pb2.MessageType.PRIVATE:
+            print(f"\n[PRIVATE from {response.client_id}] {response.message}")
+        elif response.room_id:
+            print(f"\n[#{response.room_id}] [{response.client_id}] {response.message}")
+        else:
+            print(f"\n[{response.client_id}] {response.message}")
+    
     def receive_messages(self, request_iterator):
         try:
             for response in self.stub.Chat(request_iterator):
-                if response.client_id == "SERVER":
-                    print(f"\n[SERVER] {response.message}")
-                elif response.type == chat_pb2.MessageType.PRIVATE:
-                    print(f"\n[PRIVATE from {response.client_id}] {response.message}")
+                if response.type == chat_pb2.MessageType.BATCH:
+                    # Server gom nhiều message vào một envelope
+                    for message in response.batch.messages:
+                        self.show_message(message)
                 else:
-                    print(f"\n[{response.client_id}] {response.message}")
+                    self.show_message(response)
         except grpc.RpcError as e:
             print(f"Error receiving messages: {e.code()}")
     
     def start(self):
         def message_generator():
-            # Gửi join message đầu tiên
-            yield self.send_message("", "")
+            # Gửi join message đầu tiên, báo server client nhận được envelope BATCH
+            join = self.send_message("", "")
+            join.supports_batch = True
+            yield join
             
             while self.running:
                 try:
@@ -55,6 +83,16 @@ class ChatClient:
                             yield self.send_message(msg, target_id)
                         else:
                             print("Usage: /private <client_id> <message>")
+                    elif user_input.startswith("/join "):
+                        # Format: /join <room_id>, các message sau đó gửi vào room này
+                        room_id = user_input.split(" ", 1)[1].strip()
+                        if room_id:
+                            self.room_id = room_id
+                            yield self.room_message(chat_pb2.MessageType.JOIN_ROOM, room_id)
+                    elif user_input == "/leave":
+                        if self.room_id:
+                            yield self.room_message(chat_pb2.MessageType.LEAVE_ROOM, self.room_id)
+                            self.room_id = ""
                     elif user_input == "/quit":
                         self.running = False
                         break
@@ -66,6 +104,7 @@ class ChatClient:
         
         print(f"Connected as {self.client_id}")
         print("Type messages to broadcast, or '/private <client_id> <message>' for private chat")
+        print("Type '/join <room_id>' to chat in a room, '/leave' to go back to the global chat")
         print("Type '/quit' to exit\n")
         
         # Thread để nhận messages
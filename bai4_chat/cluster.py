@@ -0,0 +1,53 @@
+"""
+Chạy nhiều process Chat Server trên cùng port 50054 (SO_REUSEPORT), nối với nhau qua Unix socket bus
+Node i có CHAT_NODE_ID=node<i>, metrics ở port 60054 + i và log ở <CHAT_LOG_DIR>/node<i>. Ctrl+C để dừng tất cả
+
+Usage: python cluster.py [nodes] [server_script]
+"""
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+BUS_DIR = os.getenv("CHAT_BUS_DIR", "/tmp/chat_bus")
+
+
+def start_cluster(nodes, server_script="async_server.py", env=None, stdout=None):
+    # Socket file của lần chạy trước (node bị kill) không còn ai nhận
+    shutil.rmtree(BUS_DIR, ignore_errors=True)
+    processes = []
+    for i in range(nodes):
+        node_env = dict(env or os.environ, CHAT_BUS="unix", CHAT_BUS_DIR=BUS_DIR,
+                        CHAT_NODE_ID=f"node{i}", METRICS_PORT=str(60054 + i))
+        if node_env.get("CHAT_LOG_DIR"):
+            # Mỗi node một log riêng, không ghi chung file
+            node_env["CHAT_LOG_DIR"] = os.path.join(node_env["CHAT_LOG_DIR"], f"node{i}")
+        processes.append(subprocess.Popen([sys.executable, server_script], env=node_env, stdout=stdout))
+        time.sleep(0.2)  # node sau gửi HELLO khi node trước đã bind socket
+    return processes
+
+
+def stop_cluster(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+    shutil.rmtree(BUS_DIR, ignore_errors=True)
+
+
+def main():
+    nodes = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    server_script = sys.argv[2] if len(sys.argv) > 2 else "async_server.py"
+    processes = start_cluster(nodes, server_script)
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_cluster(processes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+Lịch sử chat: ring buffer cố định các message broadcast gần nhất của mỗi room (room_id rỗng
+là chat chung). Mỗi message broadcast được server gán seq tăng dần theo room rồi serialize
+một lần; ring buffer giữ chính object bytes đó nên replay chỉ là đưa lại các bytes đã có
+vào outbox, không serialize / copy thêm.
+- since_seq: O(1), vị trí trong ring = seq % size
+- since_timestamp: bisect theo thời điểm server nhận message (ms), các slot trong ring
+  theo thứ tự seq; thời điểm được kẹp trong lock của room để không nhỏ hơn message trước
+  (đồng hồ bị chỉnh lùi, hoặc thread lấy thời điểm trước nhưng vào lock sau) nên cũng tăng dần
+- Khi bật log trên đĩa (CHAT_LOG_DIR, xem chat_log.py) mọi message cũng được ghi vào log;
+  since_timestamp cũ hơn message cũ nhất còn trong ring (hoặc sau khi restart) được đọc từ log.
+  Server async ghi log trong một worker thread (log_executor, một thread nên giữ đúng thứ tự)
+  và đọc log trong thread (read_log) để không chặn event loop
+- Thứ tự: lock của room chỉ giữ lúc gán seq, lưu vào ring, ghi log và xếp (deliver, data) vào
+  hàng đợi pending của room. Fan-out (O(số người nhận)) chạy ngoài lock, mỗi lúc chỉ một thread
+  (_delivering, lấy kiểu try-lock) lấy pending ra theo thứ tự seq; thread khác chỉ xếp hàng rồi
+  về, message của nó được thread đang fan-out gửi tiếp. Join lấy replay trong lock rồi xếp việc
+  đăng ký + đưa replay vào outbox vào cùng hàng pending: người nhận luôn thấy message theo đúng
+  thứ tự seq, không message mới nào chen vào trước hay trùng với phần replay, kể cả khi nhiều
+  thread cùng gửi (server sync). Room chung ("") có mọi client nên mọi broadcast và join đi qua
+  cùng một History; phần giữ lock là O(1), join chỉ chờ fan-out các message xếp trước nó, xem
+  router trong benchmark_broadcast.py
+"""
+import bisect
+import collections
+import os
+import threading
+import time
+
+# Số message giữ lại cho mỗi room (0 = không lưu lịch sử, seq vẫn được gán)
+CHAT_HISTORY_SIZE = int(os.getenv("CHAT_HISTORY_SIZE", "500"))
+# Số room tối đa có lịch sử, room lâu không có message mới bị bỏ trước (LRU)
+CHAT_HISTORY_MAX_ROOMS = int(os.getenv("CHAT_HISTORY_MAX_ROOMS", "1000"))
+# Số message tối đa replay từ log trên đĩa cho một lần join
+CHAT_LOG_REPLAY_MAX = int(os.getenv("CHAT_LOG_REPLAY_MAX", "1000"))
+
+
+class History:
+    def __init__(self, size=CHAT_HISTORY_SIZE, next_seq=1):
+        self.size = size
+        self._data = [None] * size   # slot seq % size -> bytes đã serialize
+        self._times = [0] * size     # slot -> thời điểm server nhận (ms)
+        self._lock = threading.Lock()
+        self._pending = []  # (deliver, data) đã có seq, chờ fan-out theo thứ tự seq
+        self._queued = 0     # số việc đã xếp vào pending
+        self._delivered = 0  # số việc đã fan-out xong
+        self._delivered_changed = threading.Condition(self._lock)
+        self._delivering = threading.Lock()  # người đang fan-out pending
+        # Room bị LRU bỏ rồi dùng lại tiếp tục seq cũ, ring chỉ chứa từ start_seq
+        self.start_seq = next_seq
+        self.next_seq = next_seq
+        self.retired = False  # đã bị HistoryStore bỏ, append phải lấy History mới
+        self.last_timestamp = 0
+
+    @property
+    def first_seq(self):
+        """seq nhỏ nhất còn trong ring"""
+        return max(self.start_seq, self.next_seq - self.size)
+
+    def retire(self):
+        """Gọi khi bị LRU bỏ; trả về seq kế tiếp để History mới của room dùng tiếp"""
+        with self._lock:
+            self.retired = True
+            return self.next_seq
+
+    def oldest_timestamp(self):
+        """Thời điểm nhận message cũ nhất còn trong ring, None nếu ring rỗng"""
+        with self._lock:
+            if not self.size or self.first_seq >= self.next_seq:
+                return None
+            return self._times[self.first_seq % self.size]
+
+    def append(self, message, timestamp=None, deliver=None, record=None):
+        """Gán seq cho message, serialize một lần và lưu lại; trả về bytes để broadcast,
+        None nếu History đã bị bỏ. record(data, timestamp) (ghi log) được gọi trong lock nên theo
+        thứ tự seq; deliver(data) (fan-out) được gọi ngoài lock, theo thứ tự seq"""
+        with self._lock:
+            if self.retired:
+                return None
+            seq = self.next_seq
+            message.seq = seq
+            data = message.SerializeToString()
+            timestamp = max(timestamp or int(time.time() * 1000), self.last_timestamp)
+            self.last_timestamp = timestamp
+            if self.size:
+                slot = seq % self.size
+                self._data[slot] = data
+                self._times[slot] = timestamp
+            self.next_seq = seq + 1
+            if record is not None:
+                record(data, timestamp)
+            if deliver is not None:
+                ticket = self._enqueue(deliver, data)
+        if deliver is not None:
+            self._wait(ticket)
+        return data
+
+    def _enqueue(self, deliver, data):
+        """Gọi trong lock; trả về số thứ tự để chờ bằng _wait"""
+        self._pending.append((deliver, data))
+        self._queued += 1
+        return self._queued
+
+    def _wait(self, ticket):
+        """Fan-out pending hoặc chờ thread đang fan-out làm tới việc ticket: mỗi thread gửi chỉ có
+        một message đang chờ nên pending không dài quá số thread, join không phải chờ lâu"""
+        self._drain()
+        with self._lock:
+            while self._delivered < ticket:
+                self._delivered_changed.wait()
+
+    def _drain(self):
+        """Fan-out pending nếu chưa ai làm; thread đang giữ _delivering kiểm tra lại sau khi nhả
+        nên message xếp hàng trong lúc đó không bị bỏ quên"""
+        while self._pending:
+            if not self._delivering.acquire(blocking=False):
+                return
+            try:
+                self._deliver_pending()
+            finally:
+                self._delivering.release()
+
+    def _deliver_pending(self):
+        """Gọi khi giữ _delivering"""
+        pending = []
+        while True:
+            with self._lock:
+                if pending:
+                    self._delivered += len(pending)
+                    self._delivered_changed.notify_all()
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            for deliver, data in pending:
+                deliver(data)
+
+    def replay(self, since_seq=0, since_timestamp=0, cold=None, subscribe=None, outbox=None):
+        """Các message client yêu cầu khi join, đưa vào outbox (nếu có) trước mọi message mới;
+        subscribe() được gọi cùng lúc, nếu nó trả về False (không đăng ký được) thì trả về False.
+        cold: các message đã đọc trước từ log trên đĩa, được nối với phần mới hơn trong ring.
+        None nếu History đã bị bỏ.
+        Lấy replay trong lock rồi xếp việc đăng ký vào pending ngay sau message cuối của replay:
+        message trước đó fan-out khi client chưa đăng ký, message sau đó tới sau phần replay"""
+        result = [False]
+
+        def join(items):
+            if subscribe is None or subscribe() is not False:
+                result[0] = items
+                if outbox is not None:
+                    for data in items:
+                        outbox.put_nowait(data)
+
+        with self._lock:
+            if self.retired:
+                return None
+            ticket = self._enqueue(join, self._replay(since_seq, since_timestamp, cold))
+        self._wait(ticket)
+        return result[0]
+
+    def _replay(self, since_seq, since_timestamp, cold):
+        if cold is not None:
+            return cold + self._after(cold[-1]) if cold else self._since_timestamp(since_timestamp)
+        if since_seq:
+            return self._range(max(since_seq + 1, self.first_seq))
+        if since_timestamp:
+            return self._since_timestamp(since_timestamp)
+        return []
+
+    def since_seq(self, seq):
+        """Các message có seq > seq theo thứ tự (chỉ những message còn trong ring)"""
+        with self._lock:
+            return self._range(max(seq + 1, self.first_seq))
+
+    def since_timestamp(self, timestamp):
+        """Các message server nhận sau timestamp (ms)"""
+        with self._lock:
+            return self._since_timestamp(timestamp)
+
+    def _since_timestamp(self, timestamp):
+        seqs = range(self.first_seq, self.next_seq)
+        start = bisect.bisect_right(seqs, timestamp, key=lambda s: self._times[s % self.size])
+        return self._range(seqs[start] if start < len(seqs) else self.next_seq)
+
+    def _after(self, data):
+        """Các message trong ring sau message data (tìm từ mới nhất); không có trong ring
+        (cũ hơn cả ring, hoặc trước khi room bị LRU bỏ) thì cả ring"""
+        for seq in range(self.next_seq - 1, self.first_seq - 1, -1):
+            if self._data[seq % self.size] == data:
+                return self._range(seq + 1)
+        return self._range(self.first_seq)
+
+    def _range(self, start_seq):
+        if not self.size or start_seq >= self.next_seq:
+            return []
+        start, end = start_seq % self.size, self.next_seq % self.size
+        if start < end:
+            return self._data[start:end]
+        return self._data[start:] + self._data[:end]
+
+
+class HistoryStore:
+    """room_id -> History, tạo khi room có message hoặc người join đầu tiên; log: ChatLog hoặc None.
+    seq kế tiếp của room bị LRU bỏ được giữ lại (_next_seqs, không bao giờ bị bỏ) để seq của
+    một room không bao giờ lặp lại, client đang ở trong room không bỏ nhầm message mới"""
+
+    def __init__(self, size=CHAT_HISTORY_SIZE, max_rooms=CHAT_HISTORY_MAX_ROOMS, log=None,
+                 log_replay_max=CHAT_LOG_REPLAY_MAX, log_executor=None):
+        self.size = size
+        self.max_rooms = max_rooms
+        self.log = log
+        self.log_executor = log_executor  # None = ghi log ngay trong append
+        self.log_replay_max = log_replay_max
+        self._rooms = collections.OrderedDict()
+        self._next_seqs = {}  # room_id -> seq kế tiếp của room đã bị LRU bỏ
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def get(self, room_id):
+        return self._rooms.get(room_id)
+
+    def _history(self, room_id):
+        with self._lock:
+            history = self._rooms.get(room_id)
+            if history is None:
+                history = self._rooms[room_id] = History(self.size, self._next_seqs.pop(room_id, 1))
+                if len(self._rooms) > self.max_rooms:
+                    evicted_id, evicted = self._rooms.popitem(last=False)
+                    self._next_seqs[evicted_id] = evicted.retire()
+            else:
+                self._rooms.move_to_end(room_id)
+        return history
+
+    def append(self, room_id, message, deliver=None):
+        """Gán seq, lưu và ghi log trong lock của room; deliver(data) (fan-out tới outbox) chạy
+        ngoài lock nhưng vẫn theo thứ tự seq của room"""
+        timestamp = int(time.time() * 1000)
+
+        def record(data, timestamp):
+            if self.log_executor is not None:
+                self.log_executor.submit(self._write_log, room_id, data, timestamp)
+            else:
+                self.log.append(room_id, data, timestamp)
+
+        record = record if self.log is not None else None
+        data = None
+        while data is None:  # History vừa bị LRU bỏ giữa chừng thì lấy lại
+            data = self._history(room_id).append(message, timestamp, deliver, record)
+        return data
+
+    def _write_log(self, room_id, data, timestamp):
+        try:
+            self.log.append(room_id, data, timestamp)
+        except Exception as e:
+            print(f"Error writing chat log: {e}")
+
+    def needs_log(self, room_id, since_seq=0, since_timestamp=0):
+        """since_timestamp cũ hơn message cũ nhất còn trong ring: phải đọc thêm từ log"""
+        if not since_timestamp or since_seq or self.log is None:
+            return False
+        history = self._rooms.get(room_id)
+        oldest = history.oldest_timestamp() if history is not None else None
+        return oldest is None or since_timestamp < oldest
+
+    def read_log(self, room_id, since_timestamp):
+        return self.log.read_since(since_timestamp, room_id, limit=self.log_replay_max)
+
+    def replay(self, room_id, since_seq=0, since_timestamp=0, subscribe=None, cold=None, outbox=None):
+        """Các message (bytes) client yêu cầu khi join, rỗng nếu không yêu cầu replay; đưa vào
+        outbox (nếu có) trước mọi message mới của room.
+        subscribe(): đăng ký nhận broadcast của room, chạy trong lock của room cùng lúc lấy
+        replay; trả về False (ví dụ đã ở trong room) thì replay trả về None.
+        cold: kết quả read_log đã đọc trước (server async đọc trong thread)"""
+        if cold is None and self.needs_log(room_id, since_seq, since_timestamp):
+            # Đọc log ngoài lock, phần đến sau lúc đọc được lấy từ ring
+            cold = self.read_log(room_id, since_timestamp)
+        items = None
+        while items is None:
+            items = self._history(room_id).replay(since_seq, since_timestamp, cold, subscribe, outbox)
+        return items if items is not False else None
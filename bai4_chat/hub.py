@@ -0,0 +1,355 @@
+"""
+Chat hub: danh sách subscriber và fan-out broadcast dùng chung cho server.py và async_server.py
+- Message được serialize một lần, mọi outbox nhận cùng một object bytes bất biến;
+  handler Chat đăng ký với response_serializer=None nên gRPC gửi thẳng bytes đó
+- Broadcast đọc snapshot copy-on-write (tuple) của danh sách subscriber, không giữ lock
+  trong lúc fan-out; join/leave chỉ sửa dict và đánh dấu snapshot cũ, snapshot mới được
+  dựng lại ở lần broadcast kế tiếp
+- Mỗi outbox tự đồng bộ (Outbox / AsyncOutbox), không còn lock toàn cục
+- Room: index room_id -> members riêng, broadcast có room_id chỉ tới thành viên của room
+- Outbox có giới hạn CHAT_QUEUE_MAX message; khi client đọc chậm và queue đầy, áp dụng
+  CHAT_QUEUE_POLICY: drop_oldest, drop_newest hoặc disconnect (ngắt client chậm)
+- Batch: client gửi supports_batch lúc join thì stream gom các message đang chờ (chờ thêm tối đa
+  CHAT_BATCH_FLUSH_MS) vào một envelope type=BATCH, tối đa CHAT_BATCH_MAX message và
+  CHAT_BATCH_MAX_BYTES byte (client mặc định nhận message tối đa 4 MB); envelope được
+  ghép từ các bytes đã serialize, không serialize lại. Client cũ vẫn nhận từng message
+"""
+import asyncio
+import collections
+import os
+import threading
+import grpc
+import chat_pb2
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+DISCONNECT = "disconnect"
+POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT)
+
+# Số message tối đa chờ gửi cho mỗi client (0 = không giới hạn)
+CHAT_QUEUE_MAX = int(os.getenv("CHAT_QUEUE_MAX", "1000"))
+CHAT_QUEUE_POLICY = os.getenv("CHAT_QUEUE_POLICY", DROP_OLDEST)
+# Số message tối đa trong một envelope BATCH (0 = tắt batch) và thời gian chờ gom thêm message
+CHAT_BATCH_MAX = int(os.getenv("CHAT_BATCH_MAX", "256"))
+CHAT_BATCH_FLUSH_MS = float(os.getenv("CHAT_BATCH_FLUSH_MS", "2"))
+# Kích thước tối đa của phần message trong một envelope BATCH; một message lớn hơn vẫn được gửi riêng
+CHAT_BATCH_MAX_BYTES = int(os.getenv("CHAT_BATCH_MAX_BYTES", str(1024 * 1024)))
+
+# Phần đầu của envelope: field type (5) = BATCH, sau đó là field batch (10, length-delimited)
+_BATCH_HEADER = chat_pb2.ChatMessage(type=chat_pb2.MessageType.BATCH).SerializeToString()
+_BATCH_TAG = bytes([10 << 3 | 2])
+_MESSAGES_TAG = bytes([1 << 3 | 2])  # ChatBatch.messages
+
+
+def encode(message):
+    return message.SerializeToString()
+
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def encode_batch(items):
+    """ChatMessage(type=BATCH, batch=ChatBatch(messages=...)) từ các message đã serialize;
+    một message thì gửi nguyên như cũ"""
+    if len(items) == 1:
+        return items[0]
+    parts = []
+    for data in items:
+        parts += (_MESSAGES_TAG, _varint(len(data)), data)
+    body = b"".join(parts)
+    return b"".join((_BATCH_HEADER, _BATCH_TAG, _varint(len(body)), body))
+
+
+def _batch_item_size(data):
+    """Số byte data chiếm trong envelope: tag + độ dài (varint, tối đa 5 byte) + data"""
+    return 6 + len(data)
+
+
+def queue_policy(name):
+    if name not in POLICIES:
+        raise ValueError(f"Unknown chat queue policy: {name}")
+    return name
+
+
+class QueueStats:
+    """Bộ đếm drop / evict, chỉ bị gọi khi queue đầy nên lock không nằm trên đường nóng"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.evicted = 0
+
+    def drop(self):
+        with self.lock:
+            self.dropped += 1
+
+    def evict(self):
+        with self.lock:
+            self.evicted += 1
+
+
+class Outbox:
+    """Queue một consumer cho sync server: put là deque.append (atomic dưới GIL), chỉ set
+    Event khi consumer đang chờ, rẻ hơn nhiều so với queue.Queue (lock + notify mỗi put).
+    Giới hạn maxsize là gần đúng: nhiều thread broadcast cùng lúc có thể vượt vài message"""
+
+    event_class = threading.Event
+
+    def __init__(self, maxsize=CHAT_QUEUE_MAX, policy=CHAT_QUEUE_POLICY, stats=None):
+        self._items = collections.deque()
+        self._ready = self.event_class()
+        self.maxsize = maxsize
+        self.policy = queue_policy(policy)
+        self.stats = stats or QueueStats()
+        self.closed = False
+        self.evicted = False
+
+    def __len__(self):
+        return len(self._items)
+
+    def put_nowait(self, item):
+        """Trả về False nếu message bị bỏ (queue đầy hoặc outbox đã đóng)"""
+        if self.closed:
+            return False
+        if self.maxsize and len(self._items) >= self.maxsize:
+            if self.policy == DROP_NEWEST:
+                self.stats.drop()
+                return False
+            if self.policy == DISCONNECT:
+                self.evict()
+                return False
+            try:
+                self._items.popleft()
+                self.stats.drop()
+            except IndexError:  # consumer vừa lấy hết
+                pass
+        self._items.append(item)
+        self._wake()
+        return True
+
+    def close(self):
+        """Kết thúc stream: None được đưa vào queue bất kể giới hạn"""
+        if not self.closed:
+            self.closed = True
+            self._items.append(None)
+            self._wake()
+
+    def evict(self):
+        """Ngắt client chậm: bỏ mọi message đang chờ, stream nhận None và kết thúc"""
+        if not self.closed:
+            self.evicted = True
+            self.stats.evict()
+            self._items.clear()
+            self.close()
+
+    def _wake(self):
+        if not self._ready.is_set():
+            self._ready.set()
+
+    def get(self):
+        while True:
+            try:
+                return self._items.popleft()
+            except IndexError:
+                pass
+            # clear trước rồi kiểm tra lại: item được append sau đó sẽ set Event
+            self._ready.clear()
+            if not self._items:
+                self._ready.wait()
+
+    def drain(self, first, limit, max_bytes=CHAT_BATCH_MAX_BYTES):
+        """first cùng các message đang chờ, tối đa limit message và max_bytes byte khi ghép bằng
+        encode_batch; dừng trước None để lần get sau vẫn thấy stream kết thúc"""
+        batch = [first]
+        size = _batch_item_size(first)
+        items = self._items
+        while len(batch) < limit:
+            try:
+                item = items.popleft()
+            except IndexError:
+                break
+            if item is None or size + _batch_item_size(item) > max_bytes:
+                items.appendleft(item)
+                break
+            batch.append(item)
+            size += _batch_item_size(item)
+        return batch
+
+
+class AsyncOutbox(Outbox):
+    """Outbox cho grpc.aio server, mọi thao tác chạy trên event loop"""
+
+    event_class = asyncio.Event
+
+    async def get(self):
+        while True:
+            try:
+                return self._items.popleft()
+            except IndexError:
+                pass
+            self._ready.clear()
+            if not self._items:
+                await self._ready.wait()
+
+
+class Subscribers:
+    """client_id -> outbox kèm snapshot copy-on-write; mọi thay đổi phải giữ lock của ChatHub"""
+
+    def __init__(self, lock):
+        self._lock = lock
+        self._clients = {}
+        self._snapshot = ()
+
+    def __len__(self):
+        return len(self._clients)
+
+    def __contains__(self, client_id):
+        return client_id in self._clients
+
+    def get(self, client_id):
+        return self._clients.get(client_id)
+
+    def add(self, client_id, outbox):
+        self._clients[client_id] = outbox
+        self._snapshot = None
+
+    def remove(self, client_id, outbox=None):
+        if client_id in self._clients and (outbox is None or self._clients[client_id] is outbox):
+            del self._clients[client_id]
+            self._snapshot = None
+            return True
+        return False
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = tuple(self._clients.items())
+                snapshot = self._snapshot
+        return snapshot
+
+
+class ChatHub:
+    """Subscriber toàn cục và index room -> members. Broadcast trong room chỉ duyệt
+    snapshot của room đó; join/leave room là O(1) (thêm / xoá trong dict)"""
+
+    def __init__(self, outbox_class=Outbox, maxsize=CHAT_QUEUE_MAX, policy=CHAT_QUEUE_POLICY):
+        self._lock = threading.Lock()  # chỉ bảo vệ thay đổi membership
+        self._clients = Subscribers(self._lock)  # mọi client đang kết nối
+        self._rooms = {}  # room_id -> Subscribers
+        self._memberships = {}  # client_id -> set room_id, để rời mọi room khi ngắt kết nối
+        self.outbox_class = outbox_class
+        self.maxsize = maxsize
+        self.policy = queue_policy(policy)
+        self.stats = QueueStats()
+
+    def __len__(self):
+        return len(self._clients)
+
+    def outbox(self):
+        return self.outbox_class(self.maxsize, self.policy, self.stats)
+
+    def subscribe(self, client_id, outbox):
+        with self._lock:
+            self._clients.add(client_id, outbox)
+
+    def unsubscribe(self, client_id, outbox):
+        """Chỉ xoá nếu client_id vẫn trỏ tới outbox này (client có thể đã reconnect)"""
+        with self._lock:
+            if self._clients.remove(client_id, outbox):
+                for room_id in self._memberships.pop(client_id, ()):
+                    self._leave(room_id, client_id)
+
+    def get(self, client_id):
+        return self._clients.get(client_id)
+
+    def subscribers(self, room_id=""):
+        """Snapshot (client_id, outbox) của room, room_id rỗng là mọi client"""
+        if not room_id:
+            return self._clients.snapshot()
+        room = self._rooms.get(room_id)
+        return room.snapshot() if room is not None else ()
+
+    def join_room(self, room_id, client_id):
+        """False nếu client chưa kết nối hoặc đã ở trong room"""
+        with self._lock:
+            outbox = self._clients.get(client_id)
+            room = self._rooms.get(room_id)
+            if outbox is None or (room is not None and client_id in room):
+                return False
+            if room is None:
+                room = self._rooms[room_id] = Subscribers(self._lock)
+            room.add(client_id, outbox)
+            self._memberships.setdefault(client_id, set()).add(room_id)
+            return True
+
+    def leave_room(self, room_id, client_id):
+        with self._lock:
+            rooms = self._memberships.get(client_id)
+            if not rooms or room_id not in rooms:
+                return False
+            rooms.discard(room_id)
+            self._leave(room_id, client_id)
+            return True
+
+    def _leave(self, room_id, client_id):
+        room = self._rooms[room_id]
+        room.remove(client_id)
+        if not room:
+            del self._rooms[room_id]
+
+    def in_room(self, room_id, client_id):
+        room = self._rooms.get(room_id)
+        return room is not None and client_id in room
+
+    def broadcast(self, data, exclude_client=None, room_id=""):
+        """data: bytes đã encode, dùng chung cho mọi subscriber của room (hoặc toàn cục)"""
+        for client_id, outbox in self.subscribers(room_id):
+            if client_id != exclude_client:
+                outbox.put_nowait(data)
+
+    def send(self, data, target_client_id):
+        outbox = self._clients.get(target_client_id)
+        if outbox is None:
+            return False
+        outbox.put_nowait(data)
+        return True
+
+    def collect(self):
+        """Samples cho MetricsRegistry.add_collector"""
+        depths = [len(outbox) for _, outbox in self.subscribers()]
+        policy = {"policy": self.policy}
+        return [
+            ("chat_subscribers", "gauge", "Number of connected chat clients", {}, len(depths)),
+            ("chat_rooms", "gauge", "Number of rooms with at least one member", {}, len(self._rooms)),
+            ("chat_queue_limit", "gauge", "Maximum queued messages per client (0 = unbounded)",
+             policy, self.maxsize),
+            ("chat_queue_depth_total", "gauge", "Messages waiting in all client queues", {}, sum(depths)),
+            ("chat_queue_depth_max", "gauge", "Messages waiting in the longest client queue", {},
+             max(depths, default=0)),
+            ("chat_messages_dropped_total", "counter", "Messages dropped because a client queue was full",
+             policy, self.stats.dropped),
+            ("chat_clients_evicted_total", "counter", "Slow clients disconnected because their queue was full",
+             policy, self.stats.evicted),
+        ]
+
+
+def add_chat_handler(servicer, server):
+    """Thay cho chat_pb2_grpc.add_ChatServiceServicer_to_server: stream trả về bytes
+    đã serialize sẵn nên bỏ response_serializer"""
+    rpc_method_handlers = {
+        'Chat': grpc.stream_stream_rpc_method_handler(
+            servicer.Chat,
+            request_deserializer=chat_pb2.ChatMessage.FromString,
+            response_serializer=None,
+        ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler('chat.ChatService', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
@@ -0,0 +1,104 @@
+"""
+Đo latency broadcast của Chat Server tới các client im lặng (không gửi gì sau khi join)
+Chạy server trong process riêng, kết nối N receiver chỉ join rồi chờ, một sender gửi
+broadcast có gắn thời điểm gửi, đo thời gian đến khi mỗi receiver nhận được
+
+Usage: python latency_test.py [receivers] [messages] [interval_ms] [server_script]
+"""
+import grpc
+import subprocess
+import sys
+import threading
+import time
+import chat_pb2
+import chat_pb2_grpc
+
+CHAT_SERVER = "localhost:50054"
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def join_message(client_id):
+    return chat_pb2.ChatMessage(client_id=client_id, timestamp=int(time.time() * 1000))
+
+
+def quiet_client(stub, client_id, done, latencies, ready):
+    """Chỉ gửi join message rồi giữ stream mở, không gửi thêm gì"""
+    def requests():
+        yield join_message(client_id)
+        done.wait()
+
+    responses = stub.Chat(requests())
+    ready.release()
+    try:
+        for response in responses:
+            if response.client_id == "sender":
+                latencies.append(time.time() - float(response.message))
+    except grpc.RpcError:
+        pass
+
+
+def run(receivers, messages, interval):
+    channel = grpc.insecure_channel(CHAT_SERVER)
+    grpc.channel_ready_future(channel).result(timeout=10)
+    stub = chat_pb2_grpc.ChatServiceStub(channel)
+
+    done = threading.Event()
+    latencies = []
+    ready = threading.Semaphore(0)
+    threads = [
+        threading.Thread(target=quiet_client, args=(stub, f"quiet{i}", done, latencies, ready), daemon=True)
+        for i in range(receivers)
+    ]
+    for thread in threads:
+        thread.start()
+    for _ in threads:
+        ready.acquire()
+    time.sleep(0.5)  # chờ các receiver join xong
+
+    def sender_requests():
+        yield join_message("sender")
+        for _ in range(messages):
+            time.sleep(interval)
+            # Thời điểm gửi nằm trong nội dung message
+            yield chat_pb2.ChatMessage(client_id="sender", message=repr(time.time()),
+                                       timestamp=int(time.time() * 1000))
+        time.sleep(1)  # chờ message cuối được phát hết
+
+    for _ in stub.Chat(sender_requests()):
+        pass
+
+    done.set()
+    for thread in threads:
+        thread.join(timeout=5)
+    channel.close()
+    return latencies
+
+
+def main():
+    receivers = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    interval = (float(sys.argv[3]) if len(sys.argv) > 3 else 10) / 1000
+    server_script = sys.argv[4] if len(sys.argv) > 4 else "server.py"
+
+    server = subprocess.Popen([sys.executable, server_script], stdout=subprocess.DEVNULL)
+    try:
+        latencies = run(receivers, messages, interval)
+    finally:
+        server.terminate()
+        server.wait()
+
+    expected = receivers * messages
+    print(f"Server: {server_script}, receivers: {receivers}, messages: {messages}")
+    print(f"Delivered: {len(latencies)}/{expected}")
+    if latencies:
+        print(f"Latency p50: {percentile(latencies, 50) * 1000:.2f} ms, "
+              f"p99: {percentile(latencies, 99) * 1000:.2f} ms, "
+              f"max: {max(latencies) * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""
+Load generator cho Chat Server: N client giả lập, mỗi client gửi broadcast với tốc độ cố định
+Với mỗi số client: chạy server trong process riêng (CHAT_PRESENCE=0), kết nối các client theo
+đợt như soak_test.py, cho mọi client gửi trong duration giây rồi chờ phát nốt. Nội dung mỗi
+message bắt đầu bằng thời điểm gửi (time.time_ns()) nên client nhận tính được latency end-to-end.
+- room_size=0: broadcast toàn cục, mỗi message tới N-1 client (tải tăng theo N^2)
+- room_size>0: client được chia vào các room room_size người, mỗi message tới room_size-1 client
+Kết quả: latency p50/p90/p99/p99.9/max, số message gửi/nhận mỗi giây, CPU và RSS của server
+(đọc từ /proc) và CPU của chính load generator; ghi ra file JSON.
+Load generator và server chạy trên cùng máy nên tranh CPU với nhau, xem load_generator_cpu.
+batch=1: client gửi supports_batch lúc join và nhận envelope BATCH (xem hub.py)
+
+Usage: python load_generator.py [client_counts] [rate] [duration] [room_size] [output] [server_script] [batch]
+       client_counts cách nhau bởi dấu phẩy, ví dụ 10,100,500; rate là message/s mỗi client
+"""
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import grpc
+import chat_pb2
+import chat_pb2_grpc
+from latency_test import percentile
+from soak_test import open_channels, rss_kb
+
+STREAMS_PER_CHANNEL = 100
+RAMP = 200
+PAYLOAD_SIZE = 100
+DRAIN_SECONDS = 5  # chờ tối đa sau khi ngừng gửi để các message cuối được phát hết
+
+
+def cpu_seconds(pid):
+    """utime + stime của process (giây), trường 14 và 15 trong /proc/<pid>/stat"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def self_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def run(server_pid, clients, rate, duration, room_size, batch):
+    channels = open_channels((clients + STREAMS_PER_CHANNEL - 1) // STREAMS_PER_CHANNEL)
+    for channel in channels:
+        await asyncio.wait_for(channel.channel_ready(), 10)
+    stubs = [chat_pb2_grpc.ChatServiceStub(channel) for channel in channels]
+
+    done = asyncio.Event()
+    sending = asyncio.Event()
+    latencies = []
+    last_delivery = 0.0
+    joined = 0
+    sent = 0
+    padding = "x" * PAYLOAD_SIZE
+
+    async def client(i):
+        nonlocal joined, sent, last_delivery
+        client_id = f"load{i}"
+        room_id = f"room{i // room_size}" if room_size else ""
+
+        async def requests():
+            nonlocal sent
+            yield chat_pb2.ChatMessage(client_id=client_id, supports_batch=batch)
+            if room_id:
+                yield chat_pb2.ChatMessage(client_id=client_id, room_id=room_id,
+                                           type=chat_pb2.MessageType.JOIN_ROOM)
+            # Nhận lại private message gửi cho chính mình nghĩa là server đã xử lý join
+            yield chat_pb2.ChatMessage(client_id=client_id, message="ready", target_client_id=client_id,
+                                       type=chat_pb2.MessageType.PRIVATE)
+            await sending.wait()
+            # Lệch pha ngẫu nhiên để các client không cùng gửi một lúc; lịch gửi tuyệt đối nên
+            # không bị trôi, client bị trễ (CPU bận) sẽ gửi bù ngay
+            interval = 1 / rate
+            next_send = time.perf_counter() + random.random() * interval
+            end = time.perf_counter() + duration
+            while next_send < end and not done.is_set():
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                yield chat_pb2.ChatMessage(client_id=client_id, room_id=room_id,
+                                           message=f"{time.time_ns()} {padding}")
+                sent += 1
+                next_send += interval
+            await done.wait()
+
+        call = stubs[i // STREAMS_PER_CHANNEL].Chat(requests())
+        try:
+            async for response in call:
+                if response.type == chat_pb2.MessageType.BATCH:
+                    messages = response.batch.messages
+                else:
+                    messages = (response,)
+                for message in messages:
+                    if message.type == chat_pb2.MessageType.PRIVATE:
+                        joined += 1
+                    elif message.client_id.startswith("load"):
+                        latencies.append(time.time_ns() - int(message.message.split(" ", 1)[0]))
+                last_delivery = time.perf_counter()
+        except grpc.aio.AioRpcError:
+            pass
+
+    tasks = []
+    for wave in range(0, clients, RAMP):
+        wave_end = min(clients, wave + RAMP)
+        tasks += [asyncio.create_task(client(i)) for i in range(wave, wave_end)]
+        deadline = time.perf_counter() + 10
+        while joined < wave_end and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+
+    # Mỗi message tới mọi người cùng room (hoặc mọi client) trừ người gửi
+    if room_size:
+        receivers = [min(room_size, clients - start) - 1 for start in range(0, clients, room_size)]
+        fanout = sum(size * (size + 1) for size in receivers) / clients
+    else:
+        fanout = clients - 1
+
+    rss_samples = [rss_kb(server_pid)]
+    server_cpu_start = cpu_seconds(server_pid)
+    self_cpu_start = self_cpu_seconds()
+    start = time.perf_counter()
+    sending.set()
+    while time.perf_counter() - start < duration:
+        await asyncio.sleep(0.5)
+        rss_samples.append(rss_kb(server_pid))
+    send_seconds = time.perf_counter() - start
+    server_cpu = cpu_seconds(server_pid) - server_cpu_start
+    self_cpu = self_cpu_seconds() - self_cpu_start
+    sent_in_window = sent
+
+    # Chờ phát nốt các message đã gửi
+    deadline = time.perf_counter() + DRAIN_SECONDS
+    while len(latencies) < sent * fanout and time.perf_counter() < deadline:
+        await asyncio.sleep(0.1)
+    rss_samples.append(rss_kb(server_pid))
+
+    done.set()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for channel in channels:
+        await channel.close()
+
+    expected = int(sent * fanout)
+    # Message cuối có thể tới sau khi ngừng gửi, tính tốc độ nhận tới lần nhận cuối cùng
+    receive_seconds = max(send_seconds, last_delivery - start)
+    result = {
+        "clients": clients,
+        "joined": joined,
+        "send_seconds": round(send_seconds, 3),
+        "sent": sent,
+        "sent_per_second": round(sent_in_window / send_seconds, 1),
+        "target_sent_per_second": clients * rate,
+        "expected_deliveries": expected,
+        "delivered": len(latencies),
+        "receive_seconds": round(receive_seconds, 3),
+        "delivered_per_second": round(len(latencies) / receive_seconds, 1),
+        "server_cpu_percent": round(server_cpu / send_seconds * 100, 1),
+        "load_generator_cpu_percent": round(self_cpu / send_seconds * 100, 1),
+        "server_rss_mb_start": round(rss_samples[0] / 1024, 1),
+        "server_rss_mb_max": round(max(rss_samples) / 1024, 1),
+    }
+    if latencies:
+        result["latency_ms"] = {
+            name: round(percentile(latencies, pct) / 1e6, 3)
+            for name, pct in (("p50", 50), ("p90", 90), ("p99", 99), ("p99.9", 99.9), ("max", 100))
+        }
+    return result
+
+
+def main():
+    client_counts = [int(n) for n in (sys.argv[1] if len(sys.argv) > 1 else "10,50,100,200").split(",")]
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 1
+    duration = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+    room_size = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+    output = sys.argv[5] if len(sys.argv) > 5 else "load_results.json"
+    server_script = sys.argv[6] if len(sys.argv) > 6 else "async_server.py"
+    batch = (sys.argv[7] if len(sys.argv) > 7 else "0") == "1"
+
+    report = {
+        "config": {
+            "server": server_script, "rate_per_client": rate, "duration_seconds": duration,
+            "room_size": room_size, "payload_bytes": PAYLOAD_SIZE, "batch": batch,
+            "cpu_count": os.cpu_count(), "python": platform.python_version(), "grpcio": grpc.__version__,
+        },
+        "results": [],
+    }
+    print(f"{'clients':>8} {'joined':>7} {'sent/s':>9} {'deliv/s':>10} {'delivered':>17} "
+          f"{'p50':>9} {'p99':>9} {'max':>9} {'srv CPU':>8} {'gen CPU':>8} {'RSS MB':>7}")
+    for clients in client_counts:
+        env = dict(os.environ, CHAT_PRESENCE="0", METRICS_PORT="0")
+        server = subprocess.Popen([sys.executable, server_script], env=env, stdout=subprocess.DEVNULL)
+        try:
+            time.sleep(1)
+            result = asyncio.run(run(server.pid, clients, rate, duration, room_size, batch))
+        finally:
+            server.terminate()
+            server.wait()
+        report["results"].append(result)
+
+        latency = result.get("latency_ms", {})
+        print(f"{clients:>8} {result['joined']:>7} {result['sent_per_second']:>9,.0f} {result['delivered_per_second']:>10,.0f} "
+              f"{result['delivered']:>8}/{result['expected_deliveries']:<8} "
+              f"{latency.get('p50', 0):>6.1f} ms {latency.get('p99', 0):>6.1f} ms {latency.get('max', 0):>6.1f} ms "
+              f"{result['server_cpu_percent']:>7.0f}% {result['load_generator_cpu_percent']:>7.0f}% "
+              f"{result['server_rss_mb_max']:>7.1f}")
+
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
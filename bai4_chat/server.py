@@ -2,100 +2,172 @@ import grpc
 from concurrent import futures
 import threading
 import time
+import os
+import sys
 import chat_pb2
 import chat_pb2_grpc
+from bus import ChatRouter, create_bus
+from chat_log import open_chat_log
+from history import HistoryStore
+from hub import (CHAT_BATCH_FLUSH_MS, CHAT_BATCH_MAX, CHAT_BATCH_MAX_BYTES, ChatHub, add_chat_handler, encode,
+                 encode_batch)
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.metrics import REGISTRY, MetricsInterceptor, start_metrics_server
 
 
 class ChatServiceServicer(chat_pb2_grpc.ChatServiceServicer):
     def __init__(self):
-        self.clients = {}  # client_id -> queue of messages
-        self.lock = threading.Lock()
+        self.hub = ChatHub()  # client_id -> Outbox (có giới hạn) các message (bytes) chờ gửi
+        self.history = HistoryStore(log=open_chat_log())  # room_id -> ring buffer, log trên đĩa nếu có CHAT_LOG_DIR
+        # Client ở node này đi qua hub, client ở process khác (CHAT_BUS) đi qua bus
+        self.router = ChatRouter(self.hub, self.history, create_bus())
     
     def Chat(self, request_iterator, context):
-        client_id = None
+        # Nhận message đầu tiên để lấy client_id
+        try:
+            first_request = next(request_iterator)
+        except (StopIteration, grpc.RpcError):
+            return
+        
+        client_id = first_request.client_id
+        outbox = self.hub.outbox()
+        self._replay(outbox, "", first_request, lambda: self.hub.subscribe(client_id, outbox))
+        self.router.announce(client_id)
+        print(f"Client {client_id} joined the chat")
+        
+        # Broadcast join message
+        join_msg = self._server_message(f"{client_id} joined the chat", chat_pb2.MessageType.JOIN)
+        self._broadcast(join_msg, exclude_client=client_id)
         
+        # Đọc stream từ client trong thread riêng, stream trả về chỉ chờ trên queue:
+        # message được gửi ngay khi có, không phụ thuộc việc client này có gửi gì hay không
+        context.add_callback(outbox.close)
+        reader = threading.Thread(
+            target=self._read_messages,
+            args=(client_id, first_request, request_iterator, outbox),
+            daemon=True
+        )
+        reader.start()
+        
+        try:
+            # Client mới (supports_batch) nhận nhiều message trong một envelope, client cũ nhận từng message
+            batching = CHAT_BATCH_MAX > 1 and first_request.supports_batch
+            while True:
+                msg = outbox.get()
+                if msg is None:  # client đóng stream hoặc bị ngắt kết nối
+                    break
+                if batching:
+                    if CHAT_BATCH_FLUSH_MS and len(outbox) < CHAT_BATCH_MAX:
+                        time.sleep(CHAT_BATCH_FLUSH_MS / 1000)  # chờ gom thêm message
+                    msg = encode_batch(outbox.drain(msg, CHAT_BATCH_MAX, CHAT_BATCH_MAX_BYTES))
+                yield msg
+            if outbox.evicted:
+                context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED,
+                              f"Client {client_id} is too slow, message queue is full")
+        finally:
+            self.router.unsubscribe(client_id, outbox)
+            
+            leave_msg = self._server_message(f"{client_id} left the chat", chat_pb2.MessageType.LEAVE)
+            self._broadcast(leave_msg, exclude_client=client_id)
+            print(f"Client {client_id} left the chat")
+    
+    def _read_messages(self, client_id, first_request, request_iterator, outbox):
         try:
-            # Nhận message đầu tiên để lấy client_id
+            self._handle_message(client_id, first_request)
             for request in request_iterator:
-                if client_id is None:
-                    client_id = request.client_id
-                    with self.lock:
-                        self.clients[client_id] = []
-                    print(f"Client {client_id} joined the chat")
-                    
-                    # Broadcast join message
-                    join_msg = chat_pb2.ChatMessage(
-                        client_id="SERVER",
-                        message=f"{client_id} joined the chat",
-                        timestamp=int(time.time() * 1000),
-                        type=chat_pb2.MessageType.JOIN
-                    )
-                    self._broadcast(join_msg, exclude_client=client_id)
-                
-                # Xử lý message từ client
-                if request.type == chat_pb2.MessageType.PRIVATE:
-                    # Private message
-                    if request.target_client_id in self.clients:
-                        self._send_private(request, request.target_client_id)
-                    else:
-                        error_msg = chat_pb2.ChatMessage(
-                            client_id="SERVER",
-                            message=f"User {request.target_client_id} not found",
-                            timestamp=int(time.time() * 1000),
-                            type=chat_pb2.MessageType.BROADCAST
-                        )
-                        self._send_private(error_msg, client_id)
-                else:
-                    # Broadcast message
-                    self._broadcast(request, exclude_client=client_id)
-                
-                # Gửi messages từ queue đến client này
-                with self.lock:
-                    if client_id in self.clients:
-                        for msg in self.clients[client_id]:
-                            yield msg
-                        self.clients[client_id] = []
-                
+                self._handle_message(client_id, request)
         except Exception as e:
             print(f"Error in chat stream: {e}")
         finally:
-            if client_id:
-                with self.lock:
-                    if client_id in self.clients:
-                        del self.clients[client_id]
-                
-                leave_msg = chat_pb2.ChatMessage(
-                    client_id="SERVER",
-                    message=f"{client_id} left the chat",
-                    timestamp=int(time.time() * 1000),
-                    type=chat_pb2.MessageType.LEAVE
-                )
-                self._broadcast(leave_msg, exclude_client=client_id)
-                print(f"Client {client_id} left the chat")
+            outbox.close()
     
-    def _broadcast(self, message, exclude_client=None):
-        with self.lock:
-            for cid, queue in self.clients.items():
-                if cid != exclude_client:
-                    queue.append(message)
+    def _handle_message(self, client_id, request):
+        if request.type == chat_pb2.MessageType.PRIVATE:
+            # Private message
+            if not self._send_private(request, request.target_client_id):
+                self._send_error(client_id, f"User {request.target_client_id} not found")
+        elif request.type == chat_pb2.MessageType.JOIN_ROOM:
+            self._join_room(client_id, request)
+        elif request.type == chat_pb2.MessageType.LEAVE_ROOM:
+            self._leave_room(client_id, request.room_id)
+        elif request.message:
+            # Broadcast message (message rỗng đầu tiên chỉ dùng để join), room_id rỗng là toàn cục
+            if request.room_id and not self.hub.in_room(request.room_id, client_id):
+                self._send_error(client_id, f"You are not in room {request.room_id}")
+            else:
+                self.router.publish(client_id, request)
+    
+    def _join_room(self, client_id, request):
+        room_id = request.room_id
+        if not room_id:
+            self._send_error(client_id, "room_id is required")
+        elif self._replay(self.hub.get(client_id), room_id, request,
+                          lambda: self.hub.join_room(room_id, client_id)):
+            # Gửi cho cả room, kể cả client vừa join (xác nhận)
+            join_msg = self._server_message(f"{client_id} joined room {room_id}",
+                                            chat_pb2.MessageType.JOIN_ROOM, room_id)
+            self._broadcast(join_msg, room_id=room_id)
+    
+    def _leave_room(self, client_id, room_id):
+        if not self.hub.in_room(room_id, client_id):
+            self._send_error(client_id, f"You are not in room {room_id}")
+            return
+        leave_msg = self._server_message(f"{client_id} left room {room_id}",
+                                         chat_pb2.MessageType.LEAVE_ROOM, room_id)
+        self._broadcast(leave_msg, room_id=room_id)
+        self.hub.leave_room(room_id, client_id)
+    
+    def _replay(self, outbox, room_id, request, subscribe):
+        """Đăng ký nhận broadcast (subscribe) rồi gửi lại các message client bỏ lỡ (since_seq /
+        since_timestamp trong message join); History đưa replay vào outbox trước mọi broadcast mới
+        nên broadcast không chen vào trước hay trùng với phần replay; False nếu subscribe không
+        thành công"""
+        items = self.history.replay(room_id, request.since_seq, request.since_timestamp, subscribe,
+                                    outbox=outbox)
+        return items is not None
+    
+    @staticmethod
+    def _server_message(text, message_type, room_id=""):
+        return chat_pb2.ChatMessage(
+            client_id="SERVER",
+            message=text,
+            timestamp=int(time.time() * 1000),
+            type=message_type,
+            room_id=room_id
+        )
+    
+    def _send_error(self, client_id, text):
+        self._send_private(self._server_message(text, chat_pb2.MessageType.BROADCAST), client_id)
+    
+    def _broadcast(self, message, exclude_client=None, room_id=""):
+        # Serialize một lần cho mọi người nhận
+        self.router.broadcast(encode(message), exclude_client, room_id)
     
     def _send_private(self, message, target_client_id):
-        with self.lock:
-            if target_client_id in self.clients:
-                self.clients[target_client_id].append(message)
+        return self.router.send(encode(message), target_client_id)
 
 
 def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    chat_pb2_grpc.add_ChatServiceServicer_to_server(
-        ChatServiceServicer(), server
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=10), interceptors=[MetricsInterceptor()]
     )
+    servicer = ChatServiceServicer()
+    add_chat_handler(servicer, server)
+    REGISTRY.add_collector(servicer.hub.collect)
+    REGISTRY.add_collector(servicer.router.bus.collect)
     server.add_insecure_port('[::]:50054')
     server.start()
-    print("Chat Server started on port 50054")
-    server.wait_for_termination()
+    servicer.router.start()
+    start_metrics_server(50054)
+    print(f"Chat Server {servicer.router.node_id} started on port 50054")
+    try:
+        server.wait_for_termination()
+    finally:
+        servicer.router.bus.close()
+        if servicer.history.log is not None:
+            servicer.history.log.close()
 
 
 if __name__ == '__main__':
     serve()
-
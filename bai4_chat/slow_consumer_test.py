@@ -0,0 +1,127 @@
+"""
+Kiểm tra backpressure của Chat Server với một client không bao giờ đọc response
+Chạy server với từng CHAT_QUEUE_POLICY, một client "stalled" join rồi không đọc gì, một
+receiver bình thường và một sender gửi liên tục. In ra số message receiver nhận được,
+RSS của server và các counter chat_* lấy từ /metrics khi client chậm vẫn còn treo; sau
+đó client chậm mới đọc hết để xem nó nhận được bao nhiêu message và kết thúc với status gì
+
+Usage: python slow_consumer_test.py [messages] [queue_max] [server_script]
+"""
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+import grpc
+import chat_pb2
+import chat_pb2_grpc
+
+CHAT_SERVER = "localhost:50054"
+METRICS_URL = "http://localhost:60054/metrics"
+POLICIES = ("none", "drop_oldest", "drop_newest", "disconnect")
+
+
+def rss_mb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def chat_metrics():
+    with urllib.request.urlopen(METRICS_URL, timeout=5) as response:
+        text = response.read().decode("utf-8")
+    return {
+        line.split("{")[0].split(" ")[0]: float(line.rsplit(" ", 1)[1])
+        for line in text.splitlines()
+        if line.startswith("chat_")
+    }
+
+
+def run(server_pid, messages):
+    channel = grpc.insecure_channel(CHAT_SERVER)
+    grpc.channel_ready_future(channel).result(timeout=10)
+    stub = chat_pb2_grpc.ChatServiceStub(channel)
+    done = threading.Event()
+
+    def join(client_id):
+        yield chat_pb2.ChatMessage(client_id=client_id)
+        done.wait()
+
+    # Client chậm: mở stream nhưng không bao giờ đọc response
+    stalled = stub.Chat(join("stalled"))
+
+    received = []
+
+    def receive():
+        try:
+            for response in stub.Chat(join("receiver")):
+                if response.client_id == "sender":
+                    received.append(response)
+        except grpc.RpcError:
+            pass
+
+    receiver = threading.Thread(target=receive, daemon=True)
+    receiver.start()
+    time.sleep(0.5)
+
+    def sender_requests():
+        yield chat_pb2.ChatMessage(client_id="sender")
+        payload = "x" * 1000
+        for _ in range(messages):
+            yield chat_pb2.ChatMessage(client_id="sender", message=payload)
+        time.sleep(2)  # chờ receiver nhận hết
+
+    for _ in stub.Chat(sender_requests()):
+        pass
+
+    result = {"received": len(received), "metrics": chat_metrics(), "rss": rss_mb(server_pid)}
+
+    # Đóng stream gửi của các client rồi để client chậm đọc nốt những gì còn trong queue
+    done.set()
+    stalled_received = 0
+    try:
+        for response in stalled:
+            if response.client_id == "sender":
+                stalled_received += 1
+        result["stalled_status"] = "OK"
+    except grpc.RpcError as e:
+        result["stalled_status"] = e.code().name
+    result["stalled_received"] = stalled_received
+
+    receiver.join(timeout=5)
+    channel.close()
+    return result
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    queue_max = sys.argv[2] if len(sys.argv) > 2 else "1000"
+    server_script = sys.argv[3] if len(sys.argv) > 3 else "server.py"
+
+    for policy in POLICIES:
+        env = dict(os.environ, CHAT_PRESENCE="0", METRICS_PORT="60054")
+        env["CHAT_QUEUE_MAX"] = "0" if policy == "none" else queue_max
+        env["CHAT_QUEUE_POLICY"] = "drop_oldest" if policy == "none" else policy
+        server = subprocess.Popen([sys.executable, server_script], env=env, stdout=subprocess.DEVNULL)
+        try:
+            time.sleep(1)
+            baseline = rss_mb(server.pid)
+            result = run(server.pid, messages)
+        finally:
+            server.terminate()
+            server.wait()
+
+        metrics = result["metrics"]
+        print(f"policy={policy:<12} receiver {result['received']}/{messages}, "
+              f"stalled client {result['stalled_received']} ({result['stalled_status']}), "
+              f"server RSS {baseline:.0f} -> {result['rss']:.0f} MB, "
+              f"dropped={metrics.get('chat_messages_dropped_total', 0):.0f} "
+              f"evicted={metrics.get('chat_clients_evicted_total', 0):.0f} "
+              f"depth_max={metrics.get('chat_queue_depth_max', 0):.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Soak test cho async Chat Server: giữ hàng chục nghìn stream kết nối đồng thời trên một process
+Chạy async_server.py trong process riêng (CHAT_PRESENCE=0 để mỗi lần join không broadcast
+tới mọi client), mở N stream, đo RSS của server trước/sau để tính bộ nhớ mỗi kết nối,
+rồi gửi một broadcast và đo thời gian đến khi mọi client nhận được.
+Client kết nối theo từng đợt (ramp): mở hàng nghìn stream trong cùng một lúc sẽ bị
+grpc core reset stream (chống stream flood), client thật cũng không join cùng một thời điểm
+
+Usage: python soak_test.py [clients] [streams_per_channel] [hold_seconds] [ramp]
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import grpc
+import chat_pb2
+import chat_pb2_grpc
+
+CHAT_SERVER = "localhost:50054"
+
+
+def rss_kb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def open_channels(count):
+    # Mỗi channel một HTTP/2 connection riêng (arg khác nhau) để chia các stream
+    return [
+        grpc.aio.insecure_channel(CHAT_SERVER, options=[("grpc.use_local_subchannel_pool", 1),
+                                                        ("grpc.soak_channel_index", i)])
+        for i in range(count)
+    ]
+
+
+async def run(server_pid, clients, streams_per_channel, hold_seconds, ramp):
+    channels = open_channels((clients + streams_per_channel - 1) // streams_per_channel)
+    for channel in channels:
+        await asyncio.wait_for(channel.channel_ready(), 10)
+    stubs = [chat_pb2_grpc.ChatServiceStub(channel) for channel in channels]
+
+    await asyncio.sleep(1)
+    baseline_kb = rss_kb(server_pid)
+
+    done = asyncio.Event()
+    received = asyncio.Event()
+    joined = 0
+    delivered = 0
+
+    async def client(i):
+        nonlocal joined, delivered
+        client_id = f"soak{i}"
+
+        async def requests():
+            yield chat_pb2.ChatMessage(client_id=client_id)
+            # Private message gửi cho chính mình: nhận lại được nghĩa là server đã đăng ký client
+            yield chat_pb2.ChatMessage(client_id=client_id, message="ready", target_client_id=client_id,
+                                       type=chat_pb2.MessageType.PRIVATE)
+            await done.wait()
+
+        call = stubs[i // streams_per_channel].Chat(requests())
+        try:
+            async for response in call:
+                if response.client_id == client_id:
+                    joined += 1
+                elif response.client_id == "sender":
+                    delivered += 1
+                    if delivered == clients:
+                        received.set()
+        except grpc.aio.AioRpcError:
+            pass
+
+    start = time.perf_counter()
+    tasks = []
+    for wave in range(0, clients, ramp):
+        wave_end = min(clients, wave + ramp)
+        tasks += [asyncio.create_task(client(i)) for i in range(wave, wave_end)]
+        deadline = time.perf_counter() + 10
+        while joined < wave_end and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+    connect_seconds = time.perf_counter() - start
+    connected_kb = rss_kb(server_pid)
+
+    async def sender_requests():
+        yield chat_pb2.ChatMessage(client_id="sender")
+        yield chat_pb2.ChatMessage(client_id="sender", message="ping")
+        await done.wait()
+
+    sender = stubs[0].Chat(sender_requests())
+    sender_task = asyncio.create_task(sender.read())
+    fanout_start = time.perf_counter()
+    try:
+        await asyncio.wait_for(received.wait(), 60)
+    except asyncio.TimeoutError:
+        pass
+    fanout_seconds = time.perf_counter() - fanout_start
+
+    await asyncio.sleep(hold_seconds)
+    held_kb = rss_kb(server_pid)
+
+    done.set()
+    sender.cancel()
+    sender_task.cancel()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, sender_task, return_exceptions=True)
+    for channel in channels:
+        await channel.close()
+
+    return {
+        "clients": clients,
+        "joined": joined,
+        "delivered": delivered,
+        "connect_seconds": connect_seconds,
+        "fanout_ms": fanout_seconds * 1000,
+        "baseline_mb": baseline_kb / 1024,
+        "connected_mb": connected_kb / 1024,
+        "held_mb": held_kb / 1024,
+        "kb_per_connection": (connected_kb - baseline_kb) / clients,
+    }
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    streams_per_channel = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    hold_seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+    ramp = int(sys.argv[4]) if len(sys.argv) > 4 else 200
+
+    env = dict(os.environ, CHAT_PRESENCE="0")
+    server = subprocess.Popen([sys.executable, "async_server.py"], env=env, stdout=subprocess.DEVNULL)
+    try:
+        result = asyncio.run(run(server.pid, clients, streams_per_channel, hold_seconds, ramp))
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"Connected clients:      {result['joined']}/{result['clients']}")
+    print(f"Connect time:           {result['connect_seconds']:.1f} s")
+    print(f"Broadcast delivered to: {result['delivered']}/{result['clients']} in {result['fanout_ms']:.0f} ms")
+    print(f"Server RSS:             {result['baseline_mb']:.1f} MB idle -> {result['connected_mb']:.1f} MB connected "
+          f"-> {result['held_mb']:.1f} MB after {hold_seconds:.0f} s")
+    print(f"Memory per connection:  {result['kb_per_connection']:.1f} KB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+User Service - chế độ async
+grpc.aio server + SQLAlchemy AsyncEngine (aiosqlite / asyncpg)
+Số RPC xử lý đồng thời chỉ bị giới hạn bởi database, không phải số thread
+"""
+import asyncio
+import grpc
+from sqlalchemy.exc import IntegrityError
+import user_pb2
+import user_pb2_grpc
+from database import create_async_session_factory, init_async_db, pool_metrics_collector
+from common.metrics import REGISTRY, AsyncMetricsInterceptor, start_metrics_server
+from common.compression import AsyncCompressionInterceptor
+from server import (
+    select_columns,
+    to_user_message,
+    create_user_stmt,
+    get_user_stmt,
+    update_user_stmt,
+    delete_user_stmt,
+    list_users_stmt,
+    count_users_stmt,
+    page_params,
+    search_page_size,
+    search_users_stmt,
+    search_users_response,
+)
+
+
+class AsyncUserServiceServicer(user_pb2_grpc.UserServiceServicer):
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+
+    async def CreateUser(self, request, context):
+        async with self.session_factory() as db:
+            try:
+                row = (await db.execute(create_user_stmt(request))).one()
+                await db.commit()
+
+                return user_pb2.UserResponse(
+                    success=True,
+                    message="User created successfully",
+                    user=to_user_message(row)
+                )
+            except IntegrityError:
+                await db.rollback()
+                return user_pb2.UserResponse(
+                    success=False,
+                    message=f"User with email {request.email} already exists"
+                )
+            except Exception as e:
+                await db.rollback()
+                return user_pb2.UserResponse(
+                    success=False,
+                    message=f"Error creating user: {str(e)}"
+                )
+
+    async def GetUser(self, request, context):
+        try:
+            columns = select_columns(request.field_mask)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+        async with self.session_factory() as db:
+            try:
+                user = (await db.execute(get_user_stmt(request.id, columns))).first()
+                if not user:
+                    return user_pb2.UserResponse(
+                        success=False,
+                        message=f"User with id {request.id} not found"
+                    )
+
+                return user_pb2.UserResponse(
+                    success=True,
+                    message="User retrieved successfully",
+                    user=to_user_message(user)
+                )
+            except Exception as e:
+                return user_pb2.UserResponse(
+                    success=False,
+                    message=f"Error retrieving user: {str(e)}"
+                )
+
+    async def UpdateUser(self, request, context):
+        async with self.session_factory() as db:
+            try:
+                row = (await db.execute(update_user_stmt(request))).first()
+                if not row:
+                    await db.rollback()
+                    return user_pb2.UserResponse(
+                        success=False,
+                        message=f"User with id {request.id} not found"
+                    )
+
+                await db.commit()
+
+                return user_pb2.UserResponse(
+                    success=True,
+                    message="User updated successfully",
+                    user=to_user_message(row)
+                )
+            except IntegrityError:
+                await db.rollback()
+                return user_pb2.UserResponse(
+                    success=False,
+                    message=f"Email {request.email} already exists"
+                )
+            except Exception as e:
+                await db.rollback()
+                return user_pb2.UserResponse(
+                    success=False,
+                    message=f"Error updating user: {str(e)}"
+                )
+
+    async def DeleteUser(self, request, context):
+        async with self.session_factory() as db:
+            try:
+                row = (await db.execute(delete_user_stmt(request.id))).first()
+                if not row:
+                    await db.rollback()
+                    return user_pb2.DeleteUserResponse(
+                        success=False,
+                        message=f"User with id {request.id} not found"
+                    )
+
+                await db.commit()
+
+                return user_pb2.DeleteUserResponse(
+                    success=True,
+                    message="User deleted successfully"
+                )
+            except Exception as e:
+                await db.rollback()
+                return user_pb2.DeleteUserResponse(
+                    success=False,
+                    message=f"Error deleting user: {str(e)}"
+                )
+
+    async def ListUsers(self, request, context):
+        try:
+            columns = select_columns(request.field_mask)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+        async with self.session_factory() as db:
+            try:
+                page, page_size = page_params(request)
+                users = (await db.execute(list_users_stmt(page, page_size, columns))).all()
+                total = (await db.execute(count_users_stmt())).scalar_one()
+
+                return user_pb2.ListUsersResponse(
+                    users=[to_user_message(user) for user in users],
+                    total=total
+                )
+            except Exception as e:
+                return user_pb2.ListUsersResponse(users=[], total=0)
+
+    async def SearchUsers(self, request, context):
+        page_size = search_page_size(request)
+        try:
+            stmt = search_users_stmt(request, page_size)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+        async with self.session_factory() as db:
+            rows = (await db.execute(stmt)).all()
+            return search_users_response(rows, request, page_size)
+
+
+async def serve():
+    async_engine, session_factory = create_async_session_factory()
+    await init_async_db(async_engine)
+
+    server = grpc.aio.server(
+        interceptors=[AsyncMetricsInterceptor(), AsyncCompressionInterceptor()]
+    )
+    user_pb2_grpc.add_UserServiceServicer_to_server(
+        AsyncUserServiceServicer(session_factory), server
+    )
+    server.add_insecure_port('[::]:50055')
+    await server.start()
+    REGISTRY.add_collector(pool_metrics_collector(async_engine))
+    start_metrics_server(50055)
+    print("Async User Service Server started on port 50055")
+    try:
+        await server.wait_for_termination()
+    finally:
+        await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(serve())
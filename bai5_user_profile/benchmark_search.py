@@ -0,0 +1,87 @@
+"""
+Benchmark SearchUsers (typeahead) trên bảng users lớn
+Seed N users vào database tạm rồi đo latency của các truy vấn prefix ngắn
+
+Usage: python benchmark_search.py [num_users] [num_queries]
+"""
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+# Dùng database tạm để không ảnh hưởng users.db
+_tmp_dir = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp_dir, 'search.db')}")
+
+from sqlalchemy import insert
+import user_pb2
+from database import User, engine, init_db
+from server import UserServiceServicer
+
+SEED_BATCH = 50000
+
+
+def random_name(rng):
+    first = rng.choice(["Nguyen", "Tran", "Le", "Pham", "Hoang", "Vu", "Dang", "Bui", "Do", "Ngo"])
+    return f"{first} {''.join(rng.choices(string.ascii_lowercase, k=8))}"
+
+
+def seed(num_users):
+    rng = random.Random(42)
+    init_db()
+    with engine.begin() as conn:
+        for start in range(0, num_users, SEED_BATCH):
+            rows = []
+            for i in range(start, min(start + SEED_BATCH, num_users)):
+                name = random_name(rng)
+                email = f"{name.split()[1]}{i}@example.com"
+                rows.append({
+                    "name": name,
+                    "email": email,
+                    "role": "user",
+                    "name_lower": name.lower(),
+                    "email_lower": email.lower(),
+                })
+            conn.execute(insert(User), rows)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def main():
+    num_users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    num_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    print(f"Seeding {num_users} users...")
+    start = time.perf_counter()
+    seed(num_users)
+    print(f"Seeded in {time.perf_counter() - start:.1f}s\n")
+
+    servicer = UserServiceServicer()
+    rng = random.Random(7)
+    prefixes = ["nguyen ", "TRAN", "le a", "pham x", "hoang q"] + [
+        "".join(rng.choices(string.ascii_lowercase, k=k)) for k in (1, 2, 3) for _ in range(5)
+    ]
+
+    for field, name in ((user_pb2.NAME, "name"), (user_pb2.EMAIL, "email")):
+        latencies = []
+        for _ in range(num_queries):
+            request = user_pb2.SearchUsersRequest(prefix=rng.choice(prefixes), field=field, page_size=10)
+            t0 = time.perf_counter()
+            response = servicer.SearchUsers(request, None)
+            # Trang thứ hai dùng keyset page token
+            if response.next_page_token:
+                request.page_token = response.next_page_token
+                servicer.SearchUsers(request, None)
+            latencies.append((time.perf_counter() - t0) / (2 if response.next_page_token else 1))
+
+        print(f"SearchUsers by {name}: p50={percentile(latencies, 50) * 1000:.3f} ms, "
+              f"p99={percentile(latencies, 99) * 1000:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
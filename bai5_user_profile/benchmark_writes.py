@@ -0,0 +1,141 @@
+"""
+Benchmark write path của User Service
+So sánh số lệnh ghi mỗi giây giữa cách cũ (SELECT + INSERT + COMMIT + refresh)
+và cách mới (một lệnh INSERT/UPDATE/DELETE ... RETURNING + COMMIT)
+
+Usage: python benchmark_writes.py [num_users]
+"""
+import os
+import sys
+import tempfile
+import time
+
+# Dùng database tạm để không ảnh hưởng users.db
+_tmp_dir = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}")
+
+import user_pb2
+from database import SessionLocal, User, Base, engine, init_db
+from server import UserServiceServicer
+
+
+class LegacyUserServiceServicer:
+    """Write path trước khi tối ưu, giữ lại để so sánh"""
+
+    def CreateUser(self, request, context):
+        db = SessionLocal()
+        try:
+            if db.query(User).filter(User.email == request.email).first():
+                return user_pb2.UserResponse(success=False)
+            user = User(
+                name=request.name,
+                email=request.email,
+                role=request.role,
+                name_lower=request.name.lower(),
+                email_lower=request.email.lower()
+            )
+            db.add(user)
+            db.commit()
+            db.refresh(user)
+            return user_pb2.UserResponse(
+                success=True,
+                user=user_pb2.User(id=user.id, name=user.name, email=user.email, role=user.role)
+            )
+        finally:
+            db.close()
+
+    def UpdateUser(self, request, context):
+        db = SessionLocal()
+        try:
+            user = db.query(User).filter(User.id == request.id).first()
+            if not user:
+                return user_pb2.UserResponse(success=False)
+            if request.email and request.email != user.email:
+                if db.query(User).filter(User.email == request.email).first():
+                    return user_pb2.UserResponse(success=False)
+            if request.name:
+                user.name = request.name
+                user.name_lower = request.name.lower()
+            if request.email:
+                user.email = request.email
+                user.email_lower = request.email.lower()
+            if request.role:
+                user.role = request.role
+            db.commit()
+            db.refresh(user)
+            return user_pb2.UserResponse(
+                success=True,
+                user=user_pb2.User(id=user.id, name=user.name, email=user.email, role=user.role)
+            )
+        finally:
+            db.close()
+
+    def DeleteUser(self, request, context):
+        db = SessionLocal()
+        try:
+            user = db.query(User).filter(User.id == request.id).first()
+            if not user:
+                return user_pb2.DeleteUserResponse(success=False)
+            db.delete(user)
+            db.commit()
+            return user_pb2.DeleteUserResponse(success=True)
+        finally:
+            db.close()
+
+
+def reset_db():
+    Base.metadata.drop_all(bind=engine)
+    init_db()
+
+
+def run_writes(servicer, num_users):
+    results = {}
+
+    start = time.perf_counter()
+    ids = []
+    for i in range(num_users):
+        response = servicer.CreateUser(
+            user_pb2.CreateUserRequest(name=f"user{i}", email=f"user{i}@example.com", role="user"),
+            None
+        )
+        assert response.success
+        ids.append(response.user.id)
+    results["create"] = num_users / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i, user_id in enumerate(ids):
+        response = servicer.UpdateUser(
+            user_pb2.UpdateUserRequest(id=user_id, name=f"renamed{i}", email=f"renamed{i}@example.com"),
+            None
+        )
+        assert response.success
+    results["update"] = num_users / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for user_id in ids:
+        response = servicer.DeleteUser(user_pb2.DeleteUserRequest(id=user_id), None)
+        assert response.success
+    results["delete"] = num_users / (time.perf_counter() - start)
+
+    return results
+
+
+def main():
+    num_users = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    print(f"Database: {engine.url}")
+    print(f"Writes per operation: {num_users}\n")
+
+    reset_db()
+    before = run_writes(LegacyUserServiceServicer(), num_users)
+    reset_db()
+    after = run_writes(UserServiceServicer(), num_users)
+
+    print(f"{'Operation':<10} {'Before (ops/s)':>16} {'After (ops/s)':>16} {'Speedup':>10}")
+    print("-" * 56)
+    for op in ("create", "update", "delete"):
+        print(f"{op:<10} {before[op]:>16.0f} {after[op]:>16.0f} {after[op] / before[op]:>9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -62,6 +62,23 @@ def list_users(stub, page=1, page_size=10):
     return response
 
 
+def search_users(stub, prefix, field="name", page_size=10):
+    request = user_pb2.SearchUsersRequest(
+        prefix=prefix,
+        field=user_pb2.EMAIL if field == "email" else user_pb2.NAME,
+        page_size=page_size
+    )
+    response = stub.SearchUsers(request)
+    print(f"\nUsers matching '{prefix}' ({field}):")
+    print("-" * 60)
+    for user in response.users:
+        print(f"ID: {user.id} | Name: {user.name} | Email: {user.email} | Role: {user.role}")
+    print("-" * 60)
+    if response.next_page_token:
+        print(f"Next page token: {response.next_page_token}")
+    return response
+
+
 def main():
     if len(sys.argv) < 2:
         print("Usage:")
@@ -70,6 +87,7 @@ def main():
         print("  python client.py update <id> [name] [email] [role]")
         print("  python client.py delete <id>")
         print("  python client.py list [page] [page_size]")
+        print("  python client.py search <prefix> [name|email]")
         sys.exit(1)
     
     channel = grpc.insecure_channel('localhost:50055')
@@ -111,6 +129,13 @@ def main():
             page_size = int(sys.argv[3]) if len(sys.argv) > 3 else 10
             list_users(stub, page, page_size)
         
+        elif command == "search":
+            if len(sys.argv) < 3:
+                print("Usage: python client.py search <prefix> [name|email]")
+                sys.exit(1)
+            field = sys.argv[3] if len(sys.argv) > 3 else "name"
+            search_users(stub, sys.argv[2], field)
+        
         else:
             print(f"Unknown command: {command}")
             sys.exit(1)
@@ -1,12 +1,17 @@
-from sqlalchemy import create_engine, Column, Integer, String
+from sqlalchemy import Column, Index, Integer, String
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.db import create_db_engine, create_async_db_engine, migrate_table, pool_collector
 
 # Sử dụng SQLite mặc định, có thể đổi sang PostgreSQL/MySQL
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./users.db")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
+# SQLite: WAL + busy timeout, PostgreSQL: pool size/overflow/pre-ping (xem common/db.py)
+engine = create_db_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -18,10 +23,32 @@ class User(Base):
     name = Column(String, nullable=False)
     email = Column(String, unique=True, index=True, nullable=False)
     role = Column(String, nullable=False)
+    # Tăng 1 mỗi lần update, dùng làm ETag ở gateway
+    version = Column(Integer, nullable=False, default=1)
+    # Bản lowercase của name/email để tìm kiếm prefix không phân biệt hoa thường,
+    # được các RPC ghi cập nhật cùng lúc với name/email
+    name_lower = Column(String, nullable=False)
+    email_lower = Column(String, nullable=False)
+    
+    # Index (key, id) phục vụ cả range scan theo prefix lẫn keyset paging
+    __table_args__ = (
+        Index("ix_users_name_lower_id", "name_lower", "id"),
+        Index("ix_users_email_lower_id", "email_lower", "id"),
+    )
+
+
+# Giá trị cho các cột mới khi nâng cấp users.db cũ (xem migrate_table)
+USER_BACKFILL = {"name_lower": ("name", str.lower), "email_lower": ("email", str.lower)}
+
+
+def migrate_users(connection):
+    migrate_table(connection, User.__table__, USER_BACKFILL)
 
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        migrate_users(connection)
 
 
 def get_db():
@@ -31,3 +58,21 @@ def get_db():
     finally:
         db.close()
 
+
+def create_async_session_factory():
+    """AsyncEngine + session factory cho server chế độ async (aiosqlite / asyncpg)"""
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    async_engine = create_async_db_engine(DATABASE_URL)
+    return async_engine, async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def init_async_db(async_engine):
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(migrate_users)
+
+
+def pool_metrics_collector(db_engine=engine):
+    """Metrics connection pool cho REGISTRY.add_collector, truyền AsyncEngine ở server async"""
+    return pool_collector(db_engine, "users")
@@ -0,0 +1,115 @@
+"""
+Load test: so sánh server sync (ThreadPoolExecutor) và server async (grpc.aio)
+Mỗi chế độ được chạy trong một process riêng trên cùng một database tạm,
+sau đó N client đồng thời gọi GetUser/UpdateUser và đo p50/p99 latency
+
+Usage: python load_test.py [concurrency] [requests_per_client]
+"""
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import grpc
+import user_pb2
+import user_pb2_grpc
+
+TARGET = 'localhost:50055'
+NUM_USERS = 1000
+WRITE_RATIO = 0.1
+
+SERVERS = {
+    "sync": "server.py",
+    "async": "async_server.py",
+}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def wait_for_server(channel, timeout=10):
+    await asyncio.wait_for(channel.channel_ready(), timeout)
+
+
+async def seed_users(stub):
+    ids = []
+    for i in range(NUM_USERS):
+        response = await stub.CreateUser(user_pb2.CreateUserRequest(
+            name=f"user{i}", email=f"load{i}@example.com", role="user"
+        ))
+        ids.append(response.user.id)
+    return ids
+
+
+async def client_worker(stub, ids, num_requests, latencies, errors):
+    for _ in range(num_requests):
+        user_id = random.choice(ids)
+        start = time.perf_counter()
+        try:
+            if random.random() < WRITE_RATIO:
+                await stub.UpdateUser(user_pb2.UpdateUserRequest(id=user_id, role="member"))
+            else:
+                await stub.GetUser(user_pb2.GetUserRequest(id=user_id))
+            latencies.append(time.perf_counter() - start)
+        except grpc.RpcError:
+            errors.append(1)
+
+
+async def run_load(concurrency, requests_per_client):
+    async with grpc.aio.insecure_channel(TARGET) as channel:
+        await wait_for_server(channel)
+        stub = user_pb2_grpc.UserServiceStub(channel)
+        ids = await seed_users(stub)
+
+        latencies, errors = [], []
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            client_worker(stub, ids, requests_per_client, latencies, errors)
+            for _ in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def run_mode(mode, concurrency, requests_per_client):
+    db_path = os.path.join(tempfile.mkdtemp(), f"load_{mode}.db")
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}")
+    process = subprocess.Popen(
+        [sys.executable, SERVERS[mode]],
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        return asyncio.run(run_load(concurrency, requests_per_client))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    requests_per_client = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    print(f"Concurrent clients: {concurrency}, requests per client: {requests_per_client}\n")
+    results = {mode: run_mode(mode, concurrency, requests_per_client) for mode in SERVERS}
+
+    print(f"{'Mode':<8} {'Requests':>10} {'Errors':>8} {'RPS':>10} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    print("-" * 60)
+    for mode, r in results.items():
+        print(f"{mode:<8} {r['requests']:>10} {r['errors']:>8} {r['rps']:>10.0f} {r['p50_ms']:>10.2f} {r['p99_ms']:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
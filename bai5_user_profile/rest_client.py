@@ -2,17 +2,71 @@
 REST API Client cho User Service
 Sử dụng FastAPI để tạo REST API gateway cho gRPC service
 """
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
 import grpc
+from google.protobuf import field_mask_pb2
+import sys
+import os
 import user_pb2
 import user_pb2_grpc
 
-app = FastAPI(title="User Profile REST API")
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.channel_pool import ChannelPool
+from common.compression import GATEWAY_GZIP_MIN_BYTES
+from common.protobuf_http import ProtobufRoute, protobuf_body, protobuf_response, wants_protobuf
 
-# gRPC connection
-channel = grpc.insecure_channel('localhost:50055')
-stub = user_pb2_grpc.UserServiceStub(channel)
+GRPC_SERVER = 'localhost:50055'
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # grpc.aio channel phải được tạo trong event loop của server, đóng khi shutdown.
+    # Nhiều channel (GRPC_CHANNEL_POOL_SIZE) để không dồn mọi request vào một HTTP/2 connection
+    channel_pool = ChannelPool(GRPC_SERVER, aio=True)
+    app.state.stub = channel_pool.stub(user_pb2_grpc.UserServiceStub)
+    yield
+    await channel_pool.aclose()
+
+
+app = FastAPI(title="User Profile REST API", lifespan=lifespan)
+# Accept / Content-Type: application/x-protobuf, phải đặt trước khi khai báo các route
+app.router.route_class = ProtobufRoute
+# Nén gzip các JSON response lớn (list, search) khi client gửi Accept-Encoding: gzip
+app.add_middleware(GZipMiddleware, minimum_size=GATEWAY_GZIP_MIN_BYTES)
+
+
+USER_FIELDS = ("id", "name", "email", "role", "version")
+SEARCH_FIELDS = {"name": user_pb2.NAME, "email": user_pb2.EMAIL}
+
+
+def parse_fields(fields):
+    """Chuyển query param fields=id,name thành FieldMask (None = tất cả các field)"""
+    if not fields:
+        return None
+    # Bỏ field trùng (giữ thứ tự client gửi)
+    paths = list(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    unknown = [path for path in paths if path not in USER_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return field_mask_pb2.FieldMask(paths=paths)
+
+
+async def call_user_service(rpc, request):
+    """INVALID_ARGUMENT (field mask, tham số sai) -> HTTP 400"""
+    try:
+        return await rpc(request)
+    except grpc.RpcError as e:
+        if e.code() == grpc.StatusCode.INVALID_ARGUMENT:
+            raise HTTPException(status_code=400, detail=e.details())
+        raise
+
+
+def user_to_dict(user, field_mask=None):
+    fields = field_mask.paths if field_mask else USER_FIELDS
+    return {field: getattr(user, field) for field in USER_FIELDS if field in fields}
 
 
 class UserCreate(BaseModel):
@@ -28,39 +82,56 @@ class UserUpdate(BaseModel):
 
 
 @app.post("/users", status_code=201)
-def create_user(user: UserCreate):
+@protobuf_body(user_pb2.CreateUserRequest)
+async def create_user(user: UserCreate, accept: str = Header(None)):
     request = user_pb2.CreateUserRequest(
         name=user.name,
         email=user.email,
         role=user.role
     )
-    response = stub.CreateUser(request)
+    response = await app.state.stub.CreateUser(request)
     if not response.success:
         raise HTTPException(status_code=400, detail=response.message)
+    if wants_protobuf(accept):
+        return protobuf_response(response, status_code=201)
+    return user_to_dict(response.user)
+
+
+@app.get("/users/search")
+async def search_users(q: str, by: str = "name", page_size: int = 10, page_token: str = "",
+                       accept: str = Header(None)):
+    if by not in SEARCH_FIELDS:
+        raise HTTPException(status_code=400, detail=f"by must be one of: {', '.join(SEARCH_FIELDS)}")
+    request = user_pb2.SearchUsersRequest(
+        prefix=q,
+        field=SEARCH_FIELDS[by],
+        page_size=page_size,
+        page_token=page_token
+    )
+    response = await call_user_service(app.state.stub.SearchUsers, request)
+    if wants_protobuf(accept):
+        return protobuf_response(response)
     return {
-        "id": response.user.id,
-        "name": response.user.name,
-        "email": response.user.email,
-        "role": response.user.role
+        "users": [user_to_dict(user) for user in response.users],
+        "next_page_token": response.next_page_token
     }
 
 
 @app.get("/users/{user_id}")
-def get_user(user_id: int):
-    request = user_pb2.GetUserRequest(id=user_id)
-    response = stub.GetUser(request)
+async def get_user(user_id: int, fields: str = None, accept: str = Header(None)):
+    field_mask = parse_fields(fields)
+    request = user_pb2.GetUserRequest(id=user_id, field_mask=field_mask)
+    response = await call_user_service(app.state.stub.GetUser, request)
     if not response.success:
         raise HTTPException(status_code=404, detail=response.message)
-    return {
-        "id": response.user.id,
-        "name": response.user.name,
-        "email": response.user.email,
-        "role": response.user.role
-    }
+    if wants_protobuf(accept):
+        return protobuf_response(response.user)
+    return user_to_dict(response.user, field_mask)
 
 
 @app.put("/users/{user_id}")
-def update_user(user_id: int, user: UserUpdate):
+@protobuf_body(user_pb2.UpdateUserRequest)
+async def update_user(user_id: int, user: UserUpdate, accept: str = Header(None)):
     request = user_pb2.UpdateUserRequest(id=user_id)
     if user.name:
         request.name = user.name
@@ -69,40 +140,34 @@ def update_user(user_id: int, user: UserUpdate):
     if user.role:
         request.role = user.role
     
-    response = stub.UpdateUser(request)
+    response = await app.state.stub.UpdateUser(request)
     if not response.success:
         raise HTTPException(status_code=400, detail=response.message)
-    return {
-        "id": response.user.id,
-        "name": response.user.name,
-        "email": response.user.email,
-        "role": response.user.role
-    }
+    if wants_protobuf(accept):
+        return protobuf_response(response)
+    return user_to_dict(response.user)
 
 
 @app.delete("/users/{user_id}")
-def delete_user(user_id: int):
+async def delete_user(user_id: int, accept: str = Header(None)):
     request = user_pb2.DeleteUserRequest(id=user_id)
-    response = stub.DeleteUser(request)
+    response = await app.state.stub.DeleteUser(request)
     if not response.success:
         raise HTTPException(status_code=404, detail=response.message)
+    if wants_protobuf(accept):
+        return protobuf_response(response)
     return {"message": "User deleted successfully"}
 
 
 @app.get("/users")
-def list_users(page: int = 1, page_size: int = 10):
-    request = user_pb2.ListUsersRequest(page=page, page_size=page_size)
-    response = stub.ListUsers(request)
+async def list_users(page: int = 1, page_size: int = 10, fields: str = None, accept: str = Header(None)):
+    field_mask = parse_fields(fields)
+    request = user_pb2.ListUsersRequest(page=page, page_size=page_size, field_mask=field_mask)
+    response = await call_user_service(app.state.stub.ListUsers, request)
+    if wants_protobuf(accept):
+        return protobuf_response(response)
     return {
-        "users": [
-            {
-                "id": user.id,
-                "name": user.name,
-                "email": user.email,
-                "role": user.role
-            }
-            for user in response.users
-        ],
+        "users": [user_to_dict(user, field_mask) for user in response.users],
         "total": response.total,
         "page": page,
         "page_size": page_size
@@ -0,0 +1,103 @@
+"""
+Benchmark gRPC channel pool: throughput GetUser theo số channel (HTTP/2 connection)
+Chạy async gRPC User Service trong process riêng, rồi gửi GetUser với nhiều call
+đồng thời qua pool 1, 2, 4, 8 channel để thấy điểm một channel bị bão hoà
+
+Usage: python benchmark_channel_pool.py [concurrency] [total_calls]
+"""
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import grpc
+import user_pb2
+import user_pb2_grpc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.channel_pool import ChannelPool
+
+GRPC_SERVER = "localhost:50056"
+NUM_USERS = 200
+POOL_SIZES = (1, 2, 4, 8)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+async def seed_users():
+    async with grpc.aio.insecure_channel(GRPC_SERVER) as channel:
+        await asyncio.wait_for(channel.channel_ready(), 10)
+        stub = user_pb2_grpc.UserServiceStub(channel)
+        ids = []
+        for i in range(NUM_USERS):
+            response = await stub.CreateUser(user_pb2.CreateUserRequest(
+                name=f"user{i}", email=f"pool{i}@example.com", role="user"
+            ))
+            ids.append(response.user.id)
+        return ids
+
+
+async def run_pool(pool_size, ids, concurrency, total_calls):
+    pool = ChannelPool(GRPC_SERVER, size=pool_size, aio=True)
+    stub = pool.stub(user_pb2_grpc.UserServiceStub)
+    latencies = []
+    remaining = total_calls
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            await stub.GetUser(user_pb2.GetUserRequest(id=random.choice(ids)))
+            latencies.append(time.perf_counter() - start)
+
+    try:
+        # Warm-up để mọi channel đã kết nối
+        await asyncio.gather(*[stub.GetUser(user_pb2.GetUserRequest(id=ids[0])) for _ in range(pool_size * 4)])
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+    finally:
+        await pool.aclose()
+
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def run_all(concurrency, total_calls):
+    ids = await seed_users()
+    return {size: await run_pool(size, ids, concurrency, total_calls) for size in POOL_SIZES}
+
+
+def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    total_calls = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+    db_path = os.path.join(tempfile.mkdtemp(), "pool_bench.db")
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}")
+    service = subprocess.Popen(
+        [sys.executable, "grpc_service/async_user_service.py"], env=env, stdout=subprocess.DEVNULL
+    )
+    try:
+        results = asyncio.run(run_all(concurrency, total_calls))
+    finally:
+        service.terminate()
+        service.wait()
+
+    print(f"Concurrency: {concurrency}, total calls: {total_calls}\n")
+    print(f"{'Channels':>8} {'RPS':>10} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    print("-" * 42)
+    for size, r in results.items():
+        print(f"{size:>8} {r['rps']:>10.0f} {r['p50_ms']:>10.2f} {r['p99_ms']:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
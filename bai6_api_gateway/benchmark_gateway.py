@@ -0,0 +1,142 @@
+"""
+Benchmark REST API Gateway: handler sync (threadpool của Starlette) và handler async (grpc.aio)
+Chạy gRPC User Service + gateway trong các process riêng, sau đó bắn
+GET /api/users/{id} với nhiều request đồng thời và đo RPS, p50/p99 latency
+
+Usage: python benchmark_gateway.py [concurrency] [total_requests]
+"""
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import grpc
+import httpx
+from fastapi import FastAPI, HTTPException
+import user_pb2
+import user_pb2_grpc
+
+GRPC_SERVER = "localhost:50056"
+GATEWAY_PORT = 8101
+NUM_USERS = 200
+
+# Gateway kiểu cũ: handler sync + một blocking stub, chạy trong threadpool của Starlette
+sync_app = FastAPI()
+_sync_stub = None
+
+
+@sync_app.get("/api/users/{user_id}")
+def sync_get_user(user_id: int):
+    global _sync_stub
+    if _sync_stub is None:
+        _sync_stub = user_pb2_grpc.UserServiceStub(grpc.insecure_channel(GRPC_SERVER))
+    response = _sync_stub.GetUser(user_pb2.GetUserRequest(id=user_id))
+    if not response.success:
+        raise HTTPException(status_code=404, detail=response.message)
+    return {"id": response.user.id, "name": response.user.name,
+            "email": response.user.email, "role": response.user.role}
+
+
+GATEWAYS = {
+    "sync": ["--app-dir", ".", "benchmark_gateway:sync_app"],
+    "async": ["--app-dir", "rest_gateway", "main:app"],
+}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def seed_users():
+    with grpc.insecure_channel(GRPC_SERVER) as channel:
+        grpc.channel_ready_future(channel).result(timeout=10)
+        stub = user_pb2_grpc.UserServiceStub(channel)
+        return [
+            stub.CreateUser(user_pb2.CreateUserRequest(
+                name=f"user{i}", email=f"bench{i}@example.com", role="user"
+            )).user.id
+            for i in range(NUM_USERS)
+        ]
+
+
+async def wait_for_gateway(client, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            await client.get("/docs")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Gateway did not start")
+
+
+async def run_load(ids, concurrency, total_requests):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{GATEWAY_PORT}", limits=limits, timeout=60) as client:
+        await wait_for_gateway(client)
+        latencies, errors = [], 0
+        remaining = total_requests
+
+        async def worker():
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                response = await client.get(f"/api/users/{random.choice(ids)}")
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def run_gateway(mode, ids, concurrency, total_requests):
+    env = dict(os.environ, GRPC_SERVER=GRPC_SERVER)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", *GATEWAYS[mode], "--port", str(GATEWAY_PORT), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        return asyncio.run(run_load(ids, concurrency, total_requests))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    total_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+
+    db_path = os.path.join(tempfile.mkdtemp(), "gateway_bench.db")
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}")
+    service = subprocess.Popen([sys.executable, "grpc_service/user_service.py"], env=env, stdout=subprocess.DEVNULL)
+    try:
+        ids = seed_users()
+        print(f"Concurrency: {concurrency}, total requests: {total_requests}\n")
+        results = {mode: run_gateway(mode, ids, concurrency, total_requests) for mode in GATEWAYS}
+    finally:
+        service.terminate()
+        service.wait()
+
+    print(f"{'Gateway':<8} {'Requests':>10} {'Errors':>8} {'RPS':>10} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    print("-" * 60)
+    for mode, r in results.items():
+        print(f"{mode:<8} {r['requests']:>10} {r['errors']:>8} {r['rps']:>10.0f} {r['p50_ms']:>10.2f} {r['p99_ms']:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Kiểm tra batch write của User Service (sync và async) trên SQLite là một transaction:
+- Lỗi không phải IntegrityError ở phần tử thứ 3: RPC trả INTERNAL và không dòng nào được ghi
+  (trước đây mỗi RELEASE SAVEPOINT commit luôn phần tử đó vì driver chưa BEGIN)
+- Email trùng chỉ làm hỏng phần tử đó, các phần tử khác vẫn được commit
+Dùng database SQLite tạm, không cần chạy server
+
+Usage: python check_batch_transaction.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "batch_check.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "grpc_service"))
+from sqlalchemy import func, select, text
+import user_pb2
+from database import SessionLocal, User, create_async_session_factory, engine, init_db
+from user_service import BATCH_CREATE, UserServiceServicer
+from async_user_service import AsyncUserServiceServicer
+
+
+class Aborted(Exception):
+    pass
+
+
+class Context:
+    def abort(self, code, details):
+        raise Aborted(code, details)
+
+
+class AsyncContext:
+    async def abort(self, code, details):
+        raise Aborted(code, details)
+
+
+def failing_create(item):
+    """Phần tử có email boom@... lỗi khi chạy (OperationalError, không phải IntegrityError)"""
+    if item.email.startswith("boom"):
+        return text("SELECT * FROM no_such_table")
+    return BATCH_CREATE[0](item)
+
+
+FAILING_CREATE = (failing_create, *BATCH_CREATE[1:])
+
+
+def users(*emails):
+    return [user_pb2.CreateUserRequest(name=email.split("@")[0], email=email, role="user") for email in emails]
+
+
+def count_users():
+    with SessionLocal() as db:
+        return db.execute(select(func.count()).select_from(User)).scalar_one()
+
+
+def clear_users():
+    with engine.begin() as connection:
+        connection.execute(User.__table__.delete())
+
+
+def check(name, condition):
+    print(f"{'OK  ' if condition else 'FAIL'} {name}")
+    return condition
+
+
+def check_sync():
+    servicer = UserServiceServicer()
+    ok = True
+
+    clear_users()
+    try:
+        servicer._write_batch(users("a@x.com", "b@x.com", "boom@x.com", "c@x.com"), FAILING_CREATE, Context())
+        aborted = None
+    except Aborted as e:
+        aborted = e.args[0]
+    ok &= check("sync: failed batch aborts with INTERNAL", aborted is not None and aborted.name == "INTERNAL")
+    ok &= check("sync: failed batch leaves no rows", count_users() == 0)
+
+    clear_users()
+    response = servicer._write_batch(users("a@x.com", "a@x.com", "b@x.com"), BATCH_CREATE, Context())
+    ok &= check("sync: duplicate email fails only that item",
+                (response.succeeded, response.failed) == (2, 1) and count_users() == 2)
+    return ok
+
+
+async def check_async():
+    async_engine, session_factory = create_async_session_factory()
+    servicer = AsyncUserServiceServicer(session_factory)
+    ok = True
+    try:
+        clear_users()
+        try:
+            await servicer._write_batch(users("a@x.com", "b@x.com", "boom@x.com", "c@x.com"),
+                                        FAILING_CREATE, AsyncContext())
+            aborted = None
+        except Aborted as e:
+            aborted = e.args[0]
+        ok &= check("async: failed batch aborts with INTERNAL", aborted is not None and aborted.name == "INTERNAL")
+        ok &= check("async: failed batch leaves no rows", count_users() == 0)
+
+        clear_users()
+        response = await servicer._write_batch(users("a@x.com", "a@x.com", "b@x.com"), BATCH_CREATE, AsyncContext())
+        ok &= check("async: duplicate email fails only that item",
+                    (response.succeeded, response.failed) == (2, 1) and count_users() == 2)
+    finally:
+        await async_engine.dispose()
+    return ok
+
+
+def main():
+    init_db()
+    ok = check_sync()
+    ok &= asyncio.run(check_async())
+    engine.dispose()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""
+gRPC User Service - chế độ async
+grpc.aio server + SQLAlchemy AsyncEngine (aiosqlite / asyncpg)
+Số RPC xử lý đồng thời chỉ bị giới hạn bởi database, không phải số thread
+"""
+import asyncio
+import grpc
+from sqlalchemy.exc import IntegrityError
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import user_pb2
+import user_pb2_grpc
+from database import create_async_session_factory, init_async_db, pool_metrics_collector
+from common.metrics import REGISTRY, AsyncMetricsInterceptor, start_metrics_server
+from common.compression import AsyncCompressionInterceptor
+from user_service import (
+    select_columns,
+    to_user_message,
+    create_user_stmt,
+    get_user_stmt,
+    batch_get_users_stmt,
+    update_user_stmt,
+    delete_user_stmt,
+    list_users_stmt,
+    count_users_stmt,
+    page_params,
+    search_page_size,
+    search_users_stmt,
+    search_users_response,
+    check_batch_size,
+    batch_write_response,
+    BATCH_CREATE,
+    BATCH_UPDATE,
+    BATCH_DELETE,
+)
+
+
+class AsyncUserServiceServicer(user_pb2_grpc.UserServiceServicer):
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+
+    async def CreateUser(self, request, context):
+        async with self.session_factory() as db:
+            try:
+                row = (await db.execute(create_user_stmt(request))).one()
+                await db.commit()
+
+                return user_pb2.UserResponse(
+                    success=True,
+                    message="User created successfully",
+                    user=to_user_message(row)
+                )
+            except IntegrityError:
+                await db.rollback()
+                return user_pb2.UserResponse(
+                    success=False,
+                    message=f"User with email {request.email} already exists"
+                )
+            except Exception as e:
+                await db.rollback()
+                return user_pb2.UserResponse(
+                    success=False,
+                    message=f"Error creating user: {str(e)}"
+                )
+
+    async def GetUser(self, request, context):
+        try:
+            columns = select_columns(request.field_mask)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+        async with self.session_factory() as db:
+            try:
+                user = (await db.execute(get_user_stmt(request.id, columns))).first()
+                if not user:
+                    return user_pb2.UserResponse(
+                        success=False,
+                        message=f"User with id {request.id} not found"
+                    )
+
+                return user_pb2.UserResponse(
+                    success=True,
+                    message="User retrieved successfully",
+                    user=to_user_message(user)
+                )
+            except Exception as e:
+                return user_pb2.UserResponse(
+                    success=False,
+                    message=f"Error retrieving user: {str(e)}"
+                )
+
+    async def BatchGetUsers(self, request, context):
+        try:
+            columns = select_columns(request.field_mask)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+        if not request.ids:
+            return user_pb2.BatchGetUsersResponse(users=[])
+
+        async with self.session_factory() as db:
+            users = (await db.execute(batch_get_users_stmt(request.ids, columns))).all()
+            return user_pb2.BatchGetUsersResponse(users=[to_user_message(user) for user in users])
+
+    async def UpdateUser(self, request, context):
+        async with self.session_factory() as db:
+            try:
+                row = (await db.execute(update_user_stmt(request))).first()
+                if not row:
+                    await db.rollback()
+                    return user_pb2.UserResponse(
+                        success=False,
+                        message=f"User with id {request.id} not found"
+                    )
+
+                await db.commit()
+
+                return user_pb2.UserResponse(
+                    success=True,
+                    message="User updated successfully",
+                    user=to_user_message(row)
+                )
+            except IntegrityError:
+                await db.rollback()
+                return user_pb2.UserResponse(
+                    success=False,
+                    message=f"Email {request.email} already exists"
+                )
+            except Exception as e:
+                await db.rollback()
+                return user_pb2.UserResponse(
+                    success=False,
+                    message=f"Error updating user: {str(e)}"
+                )
+
+    async def DeleteUser(self, request, context):
+        async with self.session_factory() as db:
+            try:
+                row = (await db.execute(delete_user_stmt(request.id))).first()
+                if not row:
+                    await db.rollback()
+                    return user_pb2.DeleteUserResponse(
+                        success=False,
+                        message=f"User with id {request.id} not found"
+                    )
+
+                await db.commit()
+
+                return user_pb2.DeleteUserResponse(
+                    success=True,
+                    message="User deleted successfully"
+                )
+            except Exception as e:
+                await db.rollback()
+                return user_pb2.DeleteUserResponse(
+                    success=False,
+                    message=f"Error deleting user: {str(e)}"
+                )
+
+    async def BatchCreateUsers(self, request, context):
+        return await self._write_batch(request.users, BATCH_CREATE, context)
+
+    async def BatchUpdateUsers(self, request, context):
+        return await self._write_batch(request.users, BATCH_UPDATE, context)
+
+    async def BatchDeleteUsers(self, request, context):
+        return await self._write_batch(request.ids, BATCH_DELETE, context)
+
+    async def _write_batch(self, items, operation, context):
+        try:
+            check_batch_size(items)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+        statement, missing_message, conflict_message = operation
+        async with self.session_factory() as db:
+            try:
+                results = []
+                for index, item in enumerate(items):
+                    savepoint = await db.begin_nested()
+                    try:
+                        row = (await db.execute(statement(item))).first()
+                        if row:
+                            await savepoint.commit()
+                            results.append(user_pb2.BatchWriteResult(index=index, success=True, user=to_user_message(row)))
+                        else:
+                            await savepoint.rollback()
+                            results.append(user_pb2.BatchWriteResult(index=index, message=missing_message(item)))
+                    except IntegrityError:
+                        await savepoint.rollback()
+                        results.append(user_pb2.BatchWriteResult(index=index, message=conflict_message(item)))
+
+                await db.commit()
+                return batch_write_response(results)
+            except Exception as e:
+                await db.rollback()
+                await context.abort(grpc.StatusCode.INTERNAL, f"Error writing users: {str(e)}")
+
+    async def ListUsers(self, request, context):
+        try:
+            columns = select_columns(request.field_mask)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+        async with self.session_factory() as db:
+            try:
+                page, page_size = page_params(request)
+                users = (await db.execute(list_users_stmt(page, page_size, columns))).all()
+                total = (await db.execute(count_users_stmt())).scalar_one()
+
+                return user_pb2.ListUsersResponse(
+                    users=[to_user_message(user) for user in users],
+                    total=total
+                )
+            except Exception as e:
+                return user_pb2.ListUsersResponse(users=[], total=0)
+
+    async def SearchUsers(self, request, context):
+        page_size = search_page_size(request)
+        try:
+            stmt = search_users_stmt(request, page_size)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+        async with self.session_factory() as db:
+            rows = (await db.execute(stmt)).all()
+            return search_users_response(rows, request, page_size)
+
+
+async def serve():
+    async_engine, session_factory = create_async_session_factory()
+    await init_async_db(async_engine)
+
+    server = grpc.aio.server(
+        interceptors=[AsyncMetricsInterceptor(), AsyncCompressionInterceptor()]
+    )
+    user_pb2_grpc.add_UserServiceServicer_to_server(
+        AsyncUserServiceServicer(session_factory), server
+    )
+    server.add_insecure_port('[::]:50056')
+    await server.start()
+    REGISTRY.add_collector(pool_metrics_collector(async_engine))
+    start_metrics_server(50056)
+    print("Async gRPC User Service started on port 50056")
+    try:
+        await server.wait_for_termination()
+    finally:
+        await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(serve())
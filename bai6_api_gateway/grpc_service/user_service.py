@@ -2,8 +2,12 @@
 gRPC User Service
 Microservice xử lý user operations
 """
+import base64
+import json
 import grpc
 from concurrent import futures
+from sqlalchemy import insert, update, delete, select, func, tuple_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 import sys
 import os
@@ -12,38 +16,212 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import user_pb2
 import user_pb2_grpc
-from database import SessionLocal, User, init_db
+from database import SessionLocal, User, init_db, pool_metrics_collector
+from common.metrics import REGISTRY, MetricsInterceptor, start_metrics_server
+from common.compression import CompressionInterceptor
+
+
+# Các cột trả về sau mỗi lệnh ghi (INSERT/UPDATE ... RETURNING)
+USER_COLUMNS = (User.id, User.name, User.email, User.role, User.version)
+
+# Field mask path -> cột trong bảng users
+USER_FIELDS = {column.key: column for column in USER_COLUMNS}
+
+
+def select_columns(field_mask):
+    """Trả về các cột cần SELECT theo field mask (rỗng = tất cả các cột)"""
+    if not field_mask.paths:
+        return USER_COLUMNS
+    unknown = [path for path in field_mask.paths if path not in USER_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return tuple(column for key, column in USER_FIELDS.items() if key in field_mask.paths)
+
+
+def to_user_message(row):
+    # Chỉ điền các field có trong row (hỗ trợ kết quả đã projection)
+    return user_pb2.User(**row._mapping)
+
+
+# Các câu lệnh SQL dùng chung cho server sync và async (async_user_service.py)
+def create_user_stmt(request):
+    # Một lệnh INSERT ... RETURNING, unique index trên email sẽ chặn trùng lặp
+    return (
+        insert(User)
+        .values(
+            name=request.name,
+            email=request.email,
+            role=request.role,
+            name_lower=request.name.lower(),
+            email_lower=request.email.lower()
+        )
+        .returning(*USER_COLUMNS)
+    )
+
+
+def get_user_stmt(user_id, columns=USER_COLUMNS):
+    return select(*columns).where(User.id == user_id)
+
+
+def batch_get_users_stmt(ids, columns=USER_COLUMNS):
+    # Luôn lấy id để gateway ghép kết quả về đúng request
+    if "id" not in (column.key for column in columns):
+        columns = (User.id, *columns)
+    return select(*columns).where(User.id.in_(set(ids)))
+
+
+def update_user_stmt(request):
+    values = {}
+    if request.name:
+        values["name"] = request.name
+        values["name_lower"] = request.name.lower()
+    if request.email:
+        values["email"] = request.email
+        values["email_lower"] = request.email.lower()
+    if request.role:
+        values["role"] = request.role
+    
+    if not values:
+        # Không có gì để cập nhật, chỉ đọc lại user
+        return get_user_stmt(request.id)
+    
+    return (
+        update(User)
+        .where(User.id == request.id)
+        .values(**values, version=User.version + 1)
+        .returning(*USER_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def delete_user_stmt(user_id):
+    return (
+        delete(User)
+        .where(User.id == user_id)
+        .returning(User.id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def list_users_stmt(page, page_size, columns=USER_COLUMNS):
+    return select(*columns).offset((page - 1) * page_size).limit(page_size)
+
+
+def count_users_stmt():
+    return select(func.count()).select_from(User)
+
+
+# SearchField -> (cột lowercase được index, hàm lấy key từ row)
+SEARCH_COLUMNS = {
+    user_pb2.NAME: (User.name_lower, lambda row: row.name.lower()),
+    user_pb2.EMAIL: (User.email_lower, lambda row: row.email.lower()),
+}
+MAX_SEARCH_PAGE_SIZE = 100
+
+
+def encode_page_token(key, user_id):
+    return base64.urlsafe_b64encode(json.dumps([key, user_id]).encode()).decode()
+
+
+def decode_page_token(token):
+    try:
+        key, user_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return str(key), int(user_id)
+    except Exception:
+        raise ValueError("Invalid page token")
+
+
+def search_users_stmt(request, page_size):
+    """Range scan trên index (key_lower, id): key >= prefix AND key < prefix_end,
+    keyset paging bằng (key, id) > (key, id) của phần tử cuối trang trước"""
+    column, _ = SEARCH_COLUMNS[request.field]
+    stmt = select(*USER_COLUMNS)
+    
+    prefix = request.prefix.lower()
+    if prefix:
+        prefix_end = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        stmt = stmt.where(column >= prefix, column < prefix_end)
+    
+    if request.page_token:
+        key, user_id = decode_page_token(request.page_token)
+        stmt = stmt.where(tuple_(column, User.id) > tuple_(key, user_id))
+    
+    # Lấy thêm 1 dòng để biết còn trang tiếp theo hay không
+    return stmt.order_by(column, User.id).limit(page_size + 1)
+
+
+def search_users_response(rows, request, page_size):
+    _, sort_key = SEARCH_COLUMNS[request.field]
+    next_page_token = ""
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_page_token = encode_page_token(sort_key(last), last.id)
+    
+    return user_pb2.SearchUsersResponse(
+        users=[to_user_message(row) for row in rows],
+        next_page_token=next_page_token
+    )
+
+
+def search_page_size(request):
+    if request.page_size <= 0:
+        return 10
+    return min(request.page_size, MAX_SEARCH_PAGE_SIZE)
+
+
+# Số phần tử tối đa trong một batch ghi
+USER_MAX_BATCH_SIZE = int(os.getenv("USER_MAX_BATCH_SIZE", "1000"))
+
+
+def check_batch_size(items):
+    if len(items) > USER_MAX_BATCH_SIZE:
+        raise ValueError(f"Batch has {len(items)} items, the maximum is {USER_MAX_BATCH_SIZE}")
+
+
+def batch_write_response(results):
+    succeeded = sum(1 for result in results if result.success)
+    return user_pb2.BatchWriteResponse(
+        results=results,
+        succeeded=succeeded,
+        failed=len(results) - succeeded
+    )
+
+
+def user_not_found(user_id):
+    return f"User with id {user_id} not found"
+
+
+# Batch create / update / delete:
+# (câu lệnh cho một phần tử, thông báo khi không có dòng nào, thông báo khi trùng email)
+BATCH_CREATE = (create_user_stmt, None, lambda item: f"User with email {item.email} already exists")
+BATCH_UPDATE = (update_user_stmt, lambda item: user_not_found(item.id), lambda item: f"Email {item.email} already exists")
+BATCH_DELETE = (delete_user_stmt, user_not_found, None)
+
+
+def page_params(request):
+    page = request.page if request.page > 0 else 1
+    page_size = request.page_size if request.page_size > 0 else 10
+    return page, page_size
 
 
 class UserServiceServicer(user_pb2_grpc.UserServiceServicer):
     def CreateUser(self, request, context):
         db = SessionLocal()
         try:
-            existing_user = db.query(User).filter(User.email == request.email).first()
-            if existing_user:
-                return user_pb2.UserResponse(
-                    success=False,
-                    message=f"User with email {request.email} already exists"
-                )
-            
-            user = User(
-                name=request.name,
-                email=request.email,
-                role=request.role
-            )
-            db.add(user)
+            row = db.execute(create_user_stmt(request)).one()
             db.commit()
-            db.refresh(user)
             
             return user_pb2.UserResponse(
                 success=True,
                 message="User created successfully",
-                user=user_pb2.User(
-                    id=user.id,
-                    name=user.name,
-                    email=user.email,
-                    role=user.role
-                )
+                user=to_user_message(row)
+            )
+        except IntegrityError:
+            db.rollback()
+            return user_pb2.UserResponse(
+                success=False,
+                message=f"User with email {request.email} already exists"
             )
         except Exception as e:
             db.rollback()
@@ -55,9 +233,14 @@ class UserServiceServicer(user_pb2_grpc.UserServiceServicer):
             db.close()
     
     def GetUser(self, request, context):
+        try:
+            columns = select_columns(request.field_mask)
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        
         db = SessionLocal()
         try:
-            user = db.query(User).filter(User.id == request.id).first()
+            user = db.execute(get_user_stmt(request.id, columns)).first()
             if not user:
                 return user_pb2.UserResponse(
                     success=False,
@@ -67,12 +250,7 @@ class UserServiceServicer(user_pb2_grpc.UserServiceServicer):
             return user_pb2.UserResponse(
                 success=True,
                 message="User retrieved successfully",
-                user=user_pb2.User(
-                    id=user.id,
-                    name=user.name,
-                    email=user.email,
-                    role=user.role
-                )
+                user=to_user_message(user)
             )
         except Exception as e:
             return user_pb2.UserResponse(
@@ -82,43 +260,45 @@ class UserServiceServicer(user_pb2_grpc.UserServiceServicer):
         finally:
             db.close()
     
+    def BatchGetUsers(self, request, context):
+        try:
+            columns = select_columns(request.field_mask)
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        
+        if not request.ids:
+            return user_pb2.BatchGetUsersResponse(users=[])
+        
+        db = SessionLocal()
+        try:
+            users = db.execute(batch_get_users_stmt(request.ids, columns)).all()
+            return user_pb2.BatchGetUsersResponse(users=[to_user_message(user) for user in users])
+        finally:
+            db.close()
+    
     def UpdateUser(self, request, context):
         db = SessionLocal()
         try:
-            user = db.query(User).filter(User.id == request.id).first()
-            if not user:
+            row = db.execute(update_user_stmt(request)).first()
+            if not row:
+                db.rollback()
                 return user_pb2.UserResponse(
                     success=False,
                     message=f"User with id {request.id} not found"
                 )
             
-            if request.email and request.email != user.email:
-                existing_user = db.query(User).filter(User.email == request.email).first()
-                if existing_user:
-                    return user_pb2.UserResponse(
-                        success=False,
-                        message=f"Email {request.email} already exists"
-                    )
-            
-            if request.name:
-                user.name = request.name
-            if request.email:
-                user.email = request.email
-            if request.role:
-                user.role = request.role
-            
             db.commit()
-            db.refresh(user)
             
             return user_pb2.UserResponse(
                 success=True,
                 message="User updated successfully",
-                user=user_pb2.User(
-                    id=user.id,
-                    name=user.name,
-                    email=user.email,
-                    role=user.role
-                )
+                user=to_user_message(row)
+            )
+        except IntegrityError:
+            db.rollback()
+            return user_pb2.UserResponse(
+                success=False,
+                message=f"Email {request.email} already exists"
             )
         except Exception as e:
             db.rollback()
@@ -132,14 +312,14 @@ class UserServiceServicer(user_pb2_grpc.UserServiceServicer):
     def DeleteUser(self, request, context):
         db = SessionLocal()
         try:
-            user = db.query(User).filter(User.id == request.id).first()
-            if not user:
+            row = db.execute(delete_user_stmt(request.id)).first()
+            if not row:
+                db.rollback()
                 return user_pb2.DeleteUserResponse(
                     success=False,
                     message=f"User with id {request.id} not found"
                 )
             
-            db.delete(user)
             db.commit()
             
             return user_pb2.DeleteUserResponse(
@@ -155,25 +335,62 @@ class UserServiceServicer(user_pb2_grpc.UserServiceServicer):
         finally:
             db.close()
     
-    def ListUsers(self, request, context):
+    def BatchCreateUsers(self, request, context):
+        return self._write_batch(request.users, BATCH_CREATE, context)
+    
+    def BatchUpdateUsers(self, request, context):
+        return self._write_batch(request.users, BATCH_UPDATE, context)
+    
+    def BatchDeleteUsers(self, request, context):
+        return self._write_batch(request.ids, BATCH_DELETE, context)
+    
+    def _write_batch(self, items, operation, context):
+        """Mỗi phần tử chạy trong một SAVEPOINT: phần tử lỗi chỉ rollback chính nó,
+        các phần tử còn lại được commit cùng nhau một lần ở cuối"""
+        try:
+            check_batch_size(items)
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        
+        statement, missing_message, conflict_message = operation
         db = SessionLocal()
         try:
-            page = request.page if request.page > 0 else 1
-            page_size = request.page_size if request.page_size > 0 else 10
+            results = []
+            for index, item in enumerate(items):
+                savepoint = db.begin_nested()
+                try:
+                    row = db.execute(statement(item)).first()
+                    if row:
+                        savepoint.commit()
+                        results.append(user_pb2.BatchWriteResult(index=index, success=True, user=to_user_message(row)))
+                    else:
+                        savepoint.rollback()
+                        results.append(user_pb2.BatchWriteResult(index=index, message=missing_message(item)))
+                except IntegrityError:
+                    savepoint.rollback()
+                    results.append(user_pb2.BatchWriteResult(index=index, message=conflict_message(item)))
             
-            offset = (page - 1) * page_size
-            users = db.query(User).offset(offset).limit(page_size).all()
-            total = db.query(User).count()
+            db.commit()
+            return batch_write_response(results)
+        except Exception as e:
+            db.rollback()
+            context.abort(grpc.StatusCode.INTERNAL, f"Error writing users: {str(e)}")
+        finally:
+            db.close()
+    
+    def ListUsers(self, request, context):
+        try:
+            columns = select_columns(request.field_mask)
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        
+        db = SessionLocal()
+        try:
+            page, page_size = page_params(request)
+            users = db.execute(list_users_stmt(page, page_size, columns)).all()
+            total = db.execute(count_users_stmt()).scalar_one()
             
-            user_list = [
-                user_pb2.User(
-                    id=user.id,
-                    name=user.name,
-                    email=user.email,
-                    role=user.role
-                )
-                for user in users
-            ]
+            user_list = [to_user_message(user) for user in users]
             
             return user_pb2.ListUsersResponse(
                 users=user_list,
@@ -183,16 +400,34 @@ class UserServiceServicer(user_pb2_grpc.UserServiceServicer):
             return user_pb2.ListUsersResponse(users=[], total=0)
         finally:
             db.close()
+    
+    def SearchUsers(self, request, context):
+        page_size = search_page_size(request)
+        try:
+            stmt = search_users_stmt(request, page_size)
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        
+        db = SessionLocal()
+        try:
+            rows = db.execute(stmt).all()
+            return search_users_response(rows, request, page_size)
+        finally:
+            db.close()
 
 
 def serve():
     init_db()
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=10), interceptors=[MetricsInterceptor(), CompressionInterceptor()]
+    )
     user_pb2_grpc.add_UserServiceServicer_to_server(
         UserServiceServicer(), server
     )
     server.add_insecure_port('[::]:50056')
     server.start()
+    REGISTRY.add_collector(pool_metrics_collector())
+    start_metrics_server(50056)
     print("gRPC User Service started on port 50056")
     server.wait_for_termination()
 
@@ -0,0 +1,90 @@
+"""
+DataLoader-style micro-batching cho gateway
+Gom các lookup đồng thời trong một cửa sổ ngắn (hoặc đến khi đủ max_batch_size key)
+thành một lời gọi batch, rồi trả kết quả về cho từng request đang chờ
+"""
+import asyncio
+import os
+
+USER_BATCH_WINDOW_MS = float(os.getenv("USER_BATCH_WINDOW_MS", "2"))
+USER_BATCH_MAX_SIZE = int(os.getenv("USER_BATCH_MAX_SIZE", "64"))
+
+# Biên trên của các bucket histogram kích thước batch
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class BatchSizeHistogram:
+    def __init__(self, buckets=BATCH_SIZE_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # phần tử cuối là +Inf
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, size):
+        self.count += 1
+        self.sum += size
+        for i, bound in enumerate(self.buckets):
+            if size <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def snapshot(self):
+        # Dạng cumulative giống Prometheus histogram
+        cumulative, total = {}, 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            total += count
+            cumulative[str(bound)] = total
+        return {
+            "buckets": cumulative,
+            "count": self.count,
+            "sum": self.sum,
+            "avg": self.sum / self.count if self.count else 0.0,
+        }
+
+
+class BatchLoader:
+    """
+    batch_fn(keys) là coroutine nhận list key và trả về dict key -> value,
+    key không có trong dict sẽ nhận None
+    """
+
+    def __init__(self, batch_fn, window_ms=USER_BATCH_WINDOW_MS, max_batch_size=USER_BATCH_MAX_SIZE):
+        self.batch_fn = batch_fn
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.histogram = BatchSizeHistogram()
+        self._pending = {}  # key -> future, các request cùng key dùng chung một future
+        self._timer = None
+
+    async def load(self, key):
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[key] = future
+            if len(self._pending) >= self.max_batch_size:
+                self._flush()
+            elif self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            self.histogram.observe(len(batch))
+            asyncio.ensure_future(self._dispatch(batch))
+
+    async def _dispatch(self, batch):
+        try:
+            results = await self.batch_fn(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(results.get(key))
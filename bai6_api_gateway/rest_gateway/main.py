@@ -2,23 +2,55 @@
 REST API Gateway
 Client chỉ gọi REST API, REST API gọi nội bộ gRPC service
 """
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 import grpc
+from google.protobuf import field_mask_pb2
 import sys
 import os
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 import user_pb2
 import user_pb2_grpc
+from common.channel_pool import ChannelPool
+from common.compression import GATEWAY_GZIP_MIN_BYTES
+from common.etag import VersionCache, etag_matches, make_etag
+from common.rate_limit import RateLimiter, RateLimitMiddleware
+from common.protobuf_http import ProtobufRoute, protobuf_body, protobuf_response, wants_protobuf
+from batching import BatchLoader
+
+# gRPC connection
+GRPC_SERVER = os.getenv("GRPC_SERVER", "localhost:50056")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # grpc.aio channel phải được tạo trong event loop của server, đóng khi shutdown.
+    # Nhiều channel (GRPC_CHANNEL_POOL_SIZE) để không dồn mọi request vào một HTTP/2 connection
+    app.state.channel_pool = ChannelPool(GRPC_SERVER, aio=True)
+    app.state.stub = app.state.channel_pool.stub(user_pb2_grpc.UserServiceStub)
+    yield
+    await app.state.channel_pool.aclose()
+
 
 app = FastAPI(
     title="REST API Gateway",
     description="REST API Gateway that communicates with gRPC User Service",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
+# Accept / Content-Type: application/x-protobuf, phải đặt trước khi khai báo các route
+app.router.route_class = ProtobufRoute
+
+# Rate limit theo client + giới hạn số request đang xử lý, đặt trong CORS để 429 vẫn có CORS headers
+rate_limiter = RateLimiter()
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
 
 # CORS middleware
 app.add_middleware(
@@ -29,10 +61,68 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# gRPC connection
-GRPC_SERVER = os.getenv("GRPC_SERVER", "localhost:50056")
-channel = grpc.insecure_channel(GRPC_SERVER)
-stub = user_pb2_grpc.UserServiceStub(channel)
+# Nén gzip các JSON response lớn (list, search) khi client gửi Accept-Encoding: gzip
+app.add_middleware(GZipMiddleware, minimum_size=GATEWAY_GZIP_MIN_BYTES)
+
+
+USER_FIELDS = ("id", "name", "email", "role", "version")
+SEARCH_FIELDS = {"name": user_pb2.NAME, "email": user_pb2.EMAIL}
+
+
+def parse_fields(fields):
+    """Chuyển query param fields=id,name thành FieldMask (None = tất cả các field)"""
+    if not fields:
+        return None
+    # Bỏ field trùng (giữ thứ tự client gửi)
+    paths = list(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    unknown = [path for path in paths if path not in USER_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return field_mask_pb2.FieldMask(paths=paths)
+
+
+def user_to_dict(user, field_mask=None):
+    fields = field_mask.paths if field_mask else USER_FIELDS
+    return {field: getattr(user, field) for field in USER_FIELDS if field in fields}
+
+
+# user_id -> version mới nhất gateway đã thấy, cho phép trả 304 mà không gọi gRPC
+user_versions = VersionCache()
+
+
+def user_etag(user_id, version, field_mask=None, protobuf=False):
+    # Mỗi cách chọn fields / định dạng (JSON, protobuf) là một representation khác nhau nên có ETag riêng
+    parts = ["user", user_id, version]
+    if field_mask:
+        parts.append(".".join(sorted(field_mask.paths)))
+    if protobuf:
+        parts.append("pb")
+    return make_etag(*parts)
+
+
+def with_version(field_mask):
+    """Luôn lấy version từ backend để tính ETag, kể cả khi client chỉ chọn vài field"""
+    if not field_mask or "version" in field_mask.paths:
+        return field_mask
+    return field_mask_pb2.FieldMask(paths=[*field_mask.paths, "version"])
+
+
+# Tập field -> BatchLoader: các GET /api/users/{id} đồng thời được gom thành một BatchGetUsers.
+# Key là tập field đã sắp xếp nên số loader không vượt quá số tập con của USER_FIELDS
+user_loaders = {}
+
+
+def get_user_loader(field_mask):
+    key = tuple(sorted(set(field_mask.paths))) if field_mask else ()
+    loader = user_loaders.get(key)
+    if loader is None:
+        async def fetch_users(ids):
+            request = user_pb2.BatchGetUsersRequest(ids=ids, field_mask=field_mask)
+            response = await app.state.stub.BatchGetUsers(request)
+            return {user.id: user for user in response.users}
+        
+        loader = user_loaders[key] = BatchLoader(fetch_users)
+    return loader
 
 
 class UserCreate(BaseModel):
@@ -47,22 +137,63 @@ class UserUpdate(BaseModel):
     role: str = None
 
 
+class UserBatchUpdate(UserUpdate):
+    id: int
+
+
+class UserBatchDelete(BaseModel):
+    ids: list[int]
+
+
+def batch_response_to_dict(response, field_mask=None):
+    """Kết quả từng phần tử theo thứ tự request, kèm số phần tử thành công / thất bại"""
+    results = []
+    for result in response.results:
+        item = {"index": result.index, "success": result.success}
+        if result.success:
+            item["user"] = user_to_dict(result.user, field_mask)
+        else:
+            item["error"] = result.message
+        results.append(item)
+    return {"succeeded": response.succeeded, "failed": response.failed, "results": results}
+
+
+def grpc_http_error(e):
+    """INVALID_ARGUMENT (field mask, tham số sai) -> 400, lỗi gRPC khác -> 500"""
+    if e.code() == grpc.StatusCode.INVALID_ARGUMENT:
+        return HTTPException(status_code=400, detail=e.details())
+    return HTTPException(status_code=500, detail=f"gRPC Error: {e.code()}")
+
+
+async def write_batch(rpc, request):
+    try:
+        return await rpc(request)
+    except grpc.RpcError as e:
+        raise grpc_http_error(e)
+
+
 @app.get("/")
-def root():
+async def root():
     return {
         "message": "REST API Gateway for gRPC User Service",
         "endpoints": {
             "POST /api/users": "Create a new user",
-            "GET /api/users/{id}": "Get user by ID",
+            "POST /api/users/batch": "Create many users in one call (partial failures reported per item)",
+            "PATCH /api/users/batch": "Update many users in one call",
+            "DELETE /api/users/batch": "Delete many users in one call",
+            "GET /api/users/{id}?fields=id,name": "Get user by ID (ETag / If-None-Match)",
             "PUT /api/users/{id}": "Update user",
             "DELETE /api/users/{id}": "Delete user",
-            "GET /api/users": "List all users with pagination"
+            "GET /api/users?fields=id,name": "List all users with pagination",
+            "GET /api/users/search?q={prefix}&by=name|email": "Search users by name or email prefix",
+            "GET /stats/batching": "Batch size histogram of GetUser micro-batching"
         }
     }
 
 
 @app.post("/api/users", status_code=201)
-def create_user(user: UserCreate):
+@protobuf_body(user_pb2.CreateUserRequest)
+async def create_user(user: UserCreate, accept: str = Header(None)):
     """Create a new user via gRPC"""
     try:
         request = user_pb2.CreateUserRequest(
@@ -70,39 +201,124 @@ def create_user(user: UserCreate):
             email=user.email,
             role=user.role
         )
-        response = stub.CreateUser(request)
+        response = await app.state.stub.CreateUser(request)
         if not response.success:
             raise HTTPException(status_code=400, detail=response.message)
-        return {
-            "id": response.user.id,
-            "name": response.user.name,
-            "email": response.user.email,
-            "role": response.user.role
-        }
+        user_versions.set(response.user.id, response.user.version)
+        if wants_protobuf(accept):
+            return protobuf_response(response, status_code=201)
+        return user_to_dict(response.user)
     except grpc.RpcError as e:
         raise HTTPException(status_code=500, detail=f"gRPC Error: {e.code()}")
 
 
-@app.get("/api/users/{user_id}")
-def get_user(user_id: int):
-    """Get user by ID via gRPC"""
+@app.post("/api/users/batch")
+@protobuf_body(user_pb2.BatchCreateUsersRequest, field="users")
+async def batch_create_users(users: list[UserCreate], accept: str = Header(None)):
+    """Create many users via one BatchCreateUsers call, committed together"""
+    request = user_pb2.BatchCreateUsersRequest(users=[
+        user_pb2.CreateUserRequest(name=user.name, email=user.email, role=user.role)
+        for user in users
+    ])
+    response = await write_batch(app.state.stub.BatchCreateUsers, request)
+    for result in response.results:
+        if result.success:
+            user_versions.set(result.user.id, result.user.version)
+    if wants_protobuf(accept):
+        return protobuf_response(response)
+    return batch_response_to_dict(response)
+
+
+@app.patch("/api/users/batch")
+@protobuf_body(user_pb2.BatchUpdateUsersRequest, field="users")
+async def batch_update_users(users: list[UserBatchUpdate], accept: str = Header(None)):
+    """Update many users via one BatchUpdateUsers call, only the given fields change"""
+    request = user_pb2.BatchUpdateUsersRequest(users=[
+        user_pb2.UpdateUserRequest(id=user.id, name=user.name or "", email=user.email or "", role=user.role or "")
+        for user in users
+    ])
+    response = await write_batch(app.state.stub.BatchUpdateUsers, request)
+    for result in response.results:
+        if result.success:
+            user_versions.set(result.user.id, result.user.version)
+    if wants_protobuf(accept):
+        return protobuf_response(response)
+    return batch_response_to_dict(response)
+
+
+@app.delete("/api/users/batch")
+@protobuf_body(user_pb2.BatchDeleteUsersRequest)
+async def batch_delete_users(batch: UserBatchDelete, accept: str = Header(None)):
+    """Delete many users via one BatchDeleteUsers call"""
+    request = user_pb2.BatchDeleteUsersRequest(ids=batch.ids)
+    response = await write_batch(app.state.stub.BatchDeleteUsers, request)
+    for user_id in batch.ids:
+        user_versions.invalidate(user_id)
+    if wants_protobuf(accept):
+        return protobuf_response(response)
+    return batch_response_to_dict(response, field_mask_pb2.FieldMask(paths=["id"]))
+
+
+@app.get("/api/users/search")
+async def search_users(q: str, by: str = "name", page_size: int = 10, page_token: str = "",
+                       accept: str = Header(None)):
+    """Case-insensitive prefix search on name or email via gRPC, keyset paged"""
+    if by not in SEARCH_FIELDS:
+        raise HTTPException(status_code=400, detail=f"by must be one of: {', '.join(SEARCH_FIELDS)}")
     try:
-        request = user_pb2.GetUserRequest(id=user_id)
-        response = stub.GetUser(request)
-        if not response.success:
-            raise HTTPException(status_code=404, detail=response.message)
+        request = user_pb2.SearchUsersRequest(
+            prefix=q,
+            field=SEARCH_FIELDS[by],
+            page_size=page_size,
+            page_token=page_token
+        )
+        response = await app.state.stub.SearchUsers(request)
+        if wants_protobuf(accept):
+            return protobuf_response(response)
         return {
-            "id": response.user.id,
-            "name": response.user.name,
-            "email": response.user.email,
-            "role": response.user.role
+            "users": [user_to_dict(user) for user in response.users],
+            "next_page_token": response.next_page_token
         }
     except grpc.RpcError as e:
-        raise HTTPException(status_code=500, detail=f"gRPC Error: {e.code()}")
+        raise grpc_http_error(e)
+
+
+@app.get("/api/users/{user_id}")
+async def get_user(user_id: int, fields: str = None, if_none_match: str = Header(None),
+                   accept: str = Header(None)):
+    """Get user by ID via gRPC, optionally only the given comma-separated fields.
+    Returns 304 when If-None-Match matches the current ETag"""
+    field_mask = parse_fields(fields)
+    protobuf = wants_protobuf(accept)
+    
+    # Version đã cache: trả 304 ngay, không cần gọi gRPC
+    cached_version = user_versions.get(user_id)
+    if cached_version is not None:
+        etag = user_etag(user_id, cached_version, field_mask, protobuf)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+    
+    try:
+        user = await get_user_loader(with_version(field_mask)).load(user_id)
+        if user is None:
+            user_versions.invalidate(user_id)
+            raise HTTPException(status_code=404, detail=f"User with id {user_id} not found")
+        
+        user_versions.set(user_id, user.version)
+        etag = user_etag(user_id, user.version, field_mask, protobuf)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        headers = {"ETag": etag, "Vary": "Accept"}
+        if protobuf:
+            return protobuf_response(user, headers=headers)
+        return JSONResponse(user_to_dict(user, field_mask), headers=headers)
+    except grpc.RpcError as e:
+        raise grpc_http_error(e)
 
 
 @app.put("/api/users/{user_id}")
-def update_user(user_id: int, user: UserUpdate):
+@protobuf_body(user_pb2.UpdateUserRequest)
+async def update_user(user_id: int, user: UserUpdate, accept: str = Header(None)):
     """Update user via gRPC"""
     try:
         request = user_pb2.UpdateUserRequest(id=user_id)
@@ -113,64 +329,74 @@ def update_user(user_id: int, user: UserUpdate):
         if user.role:
             request.role = user.role
         
-        response = stub.UpdateUser(request)
+        response = await app.state.stub.UpdateUser(request)
         if not response.success:
             raise HTTPException(status_code=400, detail=response.message)
-        return {
-            "id": response.user.id,
-            "name": response.user.name,
-            "email": response.user.email,
-            "role": response.user.role
-        }
+        user_versions.set(user_id, response.user.version)
+        if wants_protobuf(accept):
+            return protobuf_response(response)
+        return user_to_dict(response.user)
     except grpc.RpcError as e:
         raise HTTPException(status_code=500, detail=f"gRPC Error: {e.code()}")
 
 
 @app.delete("/api/users/{user_id}")
-def delete_user(user_id: int):
+async def delete_user(user_id: int, accept: str = Header(None)):
     """Delete user via gRPC"""
     try:
         request = user_pb2.DeleteUserRequest(id=user_id)
-        response = stub.DeleteUser(request)
+        response = await app.state.stub.DeleteUser(request)
+        user_versions.invalidate(user_id)
         if not response.success:
             raise HTTPException(status_code=404, detail=response.message)
+        if wants_protobuf(accept):
+            return protobuf_response(response)
         return {"message": "User deleted successfully"}
     except grpc.RpcError as e:
         raise HTTPException(status_code=500, detail=f"gRPC Error: {e.code()}")
 
 
 @app.get("/api/users")
-def list_users(page: int = 1, page_size: int = 10):
-    """List users with pagination via gRPC"""
+async def list_users(page: int = 1, page_size: int = 10, fields: str = None, accept: str = Header(None)):
+    """List users with pagination via gRPC, optionally only the given comma-separated fields"""
+    field_mask = parse_fields(fields)
     try:
-        request = user_pb2.ListUsersRequest(page=page, page_size=page_size)
-        response = stub.ListUsers(request)
+        request = user_pb2.ListUsersRequest(page=page, page_size=page_size, field_mask=field_mask)
+        response = await app.state.stub.ListUsers(request)
+        if wants_protobuf(accept):
+            return protobuf_response(response)
         return {
-            "users": [
-                {
-                    "id": user.id,
-                    "name": user.name,
-                    "email": user.email,
-                    "role": user.role
-                }
-                for user in response.users
-            ],
+            "users": [user_to_dict(user, field_mask) for user in response.users],
             "total": response.total,
             "page": page,
             "page_size": page_size
         }
     except grpc.RpcError as e:
-        raise HTTPException(status_code=500, detail=f"gRPC Error: {e.code()}")
+        raise grpc_http_error(e)
+
+
+@app.get("/stats/batching")
+async def batching_stats():
+    """Batch size histogram of the GetUser micro-batching, per field selection"""
+    return {
+        ",".join(key) or "*": loader.histogram.snapshot()
+        for key, loader in user_loaders.items()
+    }
 
 
 @app.get("/health")
-def health_check():
+async def health_check():
     """Health check endpoint"""
     try:
         # Test gRPC connection
         request = user_pb2.ListUsersRequest(page=1, page_size=1)
-        stub.ListUsers(request)
-        return {"status": "healthy", "grpc_service": "connected"}
+        await app.state.stub.ListUsers(request)
+        return {
+            "status": "healthy",
+            "grpc_service": "connected",
+            "channel_pool": app.state.channel_pool.stats(),
+            "rate_limiter": rate_limiter.stats()
+        }
     except Exception as e:
         return {"status": "unhealthy", "error": str(e)}
 
@@ -2,26 +2,40 @@
 REST API Gateway cho E-Commerce Product Service
 Tích hợp Product Service, Price Service và Inventory Service
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 import grpc
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 import product_pb2
 import product_pb2_grpc
 import price_pb2
 import price_pb2_grpc
 import inventory_pb2
 import inventory_pb2_grpc
+from common.channel_pool import ChannelPool
+from common.compression import GATEWAY_GZIP_MIN_BYTES
+from common.etag import VersionCache, etag_matches, make_etag
+from common.rate_limit import RateLimiter, RateLimitMiddleware
+from common.protobuf_http import ProtobufRoute, protobuf_body, protobuf_response, wants_protobuf
 
 app = FastAPI(
     title="E-Commerce Product API Gateway",
     description="REST API Gateway integrating Product, Price, and Inventory Services",
     version="1.0.0"
 )
+# Accept / Content-Type: application/x-protobuf, phải đặt trước khi khai báo các route
+app.router.route_class = ProtobufRoute
+
+# Rate limit theo client + giới hạn số request đang xử lý, đặt trong CORS để 429 vẫn có CORS headers
+rate_limiter = RateLimiter()
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
 
 app.add_middleware(
     CORSMiddleware,
@@ -31,19 +45,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Nén gzip các JSON response lớn (list, search) khi client gửi Accept-Encoding: gzip
+app.add_middleware(GZipMiddleware, minimum_size=GATEWAY_GZIP_MIN_BYTES)
+
 # gRPC connections
 PRODUCT_SERVICE = os.getenv("PRODUCT_SERVICE", "localhost:50061")
 PRICE_SERVICE = os.getenv("PRICE_SERVICE", "localhost:50062")
 INVENTORY_SERVICE = os.getenv("INVENTORY_SERVICE", "localhost:50063")
 
-product_channel = grpc.insecure_channel(PRODUCT_SERVICE)
-product_stub = product_pb2_grpc.ProductServiceStub(product_channel)
+# Mỗi backend dùng một pool GRPC_CHANNEL_POOL_SIZE channel (connection) riêng biệt
+product_pool = ChannelPool(PRODUCT_SERVICE)
+product_stub = product_pool.stub(product_pb2_grpc.ProductServiceStub)
 
-price_channel = grpc.insecure_channel(PRICE_SERVICE)
-price_stub = price_pb2_grpc.PriceServiceStub(price_channel)
+price_pool = ChannelPool(PRICE_SERVICE)
+price_stub = price_pool.stub(price_pb2_grpc.PriceServiceStub)
 
-inventory_channel = grpc.insecure_channel(INVENTORY_SERVICE)
-inventory_stub = inventory_pb2_grpc.InventoryServiceStub(inventory_channel)
+inventory_pool = ChannelPool(INVENTORY_SERVICE)
+inventory_stub = inventory_pool.stub(inventory_pb2_grpc.InventoryServiceStub)
 
 
 class ProductCreate(BaseModel):
@@ -61,22 +79,40 @@ class ProductUpdate(BaseModel):
 
 
 def enrich_product_with_details(product):
-    """Lấy thêm thông tin price và inventory từ các services khác"""
+    """Lấy thêm thông tin price và inventory từ các services khác.
+    Trả về (price_version, inventory_version), 0 nếu không lấy được"""
+    price_version = inventory_version = 0
     try:
         # Get price
         price_request = price_pb2.GetPriceRequest(product_id=product.id)
         price_response = price_stub.GetPrice(price_request)
         if price_response.success:
             product.price = price_response.price.price
+            price_version = price_response.price.version
         
         # Get inventory
         inv_request = inventory_pb2.GetInventoryRequest(product_id=product.id)
         inv_response = inventory_stub.GetInventory(inv_request)
         if inv_response.success:
             product.inventory = inv_response.inventory.quantity
+            inventory_version = inv_response.inventory.version
     except:
         pass  # Ignore errors, use default values
-    return product
+    return price_version, inventory_version
+
+
+# product_id -> (product, price, inventory version) mới nhất gateway đã thấy,
+# cho phép trả 304 mà không gọi gRPC
+product_versions = VersionCache()
+
+
+def product_etag(product_id, versions, protobuf=False):
+    # Product được ghép từ 3 service nên ETag gồm version của cả 3 bản ghi,
+    # JSON và protobuf là hai representation khác nhau nên có ETag riêng
+    parts = ["product", product_id, *versions]
+    if protobuf:
+        parts.append("pb")
+    return make_etag(*parts)
 
 
 @app.get("/")
@@ -89,7 +125,7 @@ def root():
             "inventory": INVENTORY_SERVICE
         },
         "endpoints": {
-            "GET /api/products/{id}": "Get product details",
+            "GET /api/products/{id}": "Get product details (ETag / If-None-Match)",
             "GET /api/products": "List products",
             "POST /api/products": "Create product",
             "GET /api/products/search?q={query}": "Search products",
@@ -100,30 +136,48 @@ def root():
 
 
 @app.get("/api/products/{product_id}")
-def get_product(product_id: int):
-    """Get product with price and inventory"""
+def get_product(product_id: int, if_none_match: str = Header(None), accept: str = Header(None)):
+    """Get product with price and inventory. Returns 304 when If-None-Match matches the current ETag"""
+    protobuf = wants_protobuf(accept)
+    
+    # Version đã cache: trả 304 ngay, không cần gọi gRPC
+    cached_versions = product_versions.get(product_id)
+    if cached_versions is not None:
+        etag = product_etag(product_id, cached_versions, protobuf)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+    
     try:
         request = product_pb2.GetProductRequest(id=product_id)
         response = product_stub.GetProduct(request)
         if not response.success:
+            product_versions.invalidate(product_id)
             raise HTTPException(status_code=404, detail=response.message)
         
-        product = enrich_product_with_details(response.product)
+        product = response.product
+        versions = (product.version, *enrich_product_with_details(product))
+        product_versions.set(product_id, versions)
+        etag = product_etag(product_id, versions, protobuf)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
         
-        return {
+        headers = {"ETag": etag, "Vary": "Accept"}
+        if protobuf:
+            return protobuf_response(product, headers=headers)
+        return JSONResponse({
             "id": product.id,
             "name": product.name,
             "description": product.description,
             "category": product.category,
             "price": product.price,
             "inventory": product.inventory
-        }
+        }, headers=headers)
     except grpc.RpcError as e:
         raise HTTPException(status_code=500, detail=f"gRPC Error: {e.code()}")
 
 
 @app.get("/api/products")
-def list_products(page: int = 1, page_size: int = 10, category: str = None):
+def list_products(page: int = 1, page_size: int = 10, category: str = None, accept: str = Header(None)):
     """List products with pagination"""
     try:
         request = product_pb2.ListProductsRequest(
@@ -133,17 +187,23 @@ def list_products(page: int = 1, page_size: int = 10, category: str = None):
         )
         response = product_stub.ListProducts(request)
         
+        if wants_protobuf(accept):
+            # Enrich ghi thẳng vào message, trả nguyên ListProductsResponse
+            for product in response.products:
+                enrich_product_with_details(product)
+            return protobuf_response(response)
+        
         # Enrich with price and inventory
         enriched_products = []
         for product in response.products:
-            enriched_product = enrich_product_with_details(product)
+            enrich_product_with_details(product)
             enriched_products.append({
-                "id": enriched_product.id,
-                "name": enriched_product.name,
-                "description": enriched_product.description,
-                "category": enriched_product.category,
-                "price": enriched_product.price,
-                "inventory": enriched_product.inventory
+                "id": product.id,
+                "name": product.name,
+                "description": product.description,
+                "category": product.category,
+                "price": product.price,
+                "inventory": product.inventory
             })
         
         return {
@@ -157,7 +217,8 @@ def list_products(page: int = 1, page_size: int = 10, category: str = None):
 
 
 @app.post("/api/products", status_code=201)
-def create_product(product: ProductCreate):
+@protobuf_body(product_pb2.CreateProductRequest)
+def create_product(product: ProductCreate, accept: str = Header(None)):
     """Create a new product"""
     try:
         request = product_pb2.CreateProductRequest(
@@ -185,6 +246,8 @@ def create_product(product: ProductCreate):
         )
         inventory_stub.UpdateInventory(inv_request)
         
+        if wants_protobuf(accept):
+            return protobuf_response(response, status_code=201)
         return {
             "id": response.product.id,
             "name": response.product.name,
@@ -198,7 +261,7 @@ def create_product(product: ProductCreate):
 
 
 @app.get("/api/products/search")
-def search_products(q: str, page: int = 1, page_size: int = 10):
+def search_products(q: str, page: int = 1, page_size: int = 10, accept: str = Header(None)):
     """Search products"""
     try:
         request = product_pb2.SearchProductRequest(
@@ -208,17 +271,22 @@ def search_products(q: str, page: int = 1, page_size: int = 10):
         )
         response = product_stub.SearchProduct(request)
         
+        if wants_protobuf(accept):
+            for product in response.products:
+                enrich_product_with_details(product)
+            return protobuf_response(response)
+        
         # Enrich with price and inventory
         enriched_products = []
         for product in response.products:
-            enriched_product = enrich_product_with_details(product)
+            enrich_product_with_details(product)
             enriched_products.append({
-                "id": enriched_product.id,
-                "name": enriched_product.name,
-                "description": enriched_product.description,
-                "category": enriched_product.category,
-                "price": enriched_product.price,
-                "inventory": enriched_product.inventory
+                "id": product.id,
+                "name": product.name,
+                "description": product.description,
+                "category": product.category,
+                "price": product.price,
+                "inventory": product.inventory
             })
         
         return {
@@ -233,7 +301,7 @@ def search_products(q: str, page: int = 1, page_size: int = 10):
 
 
 @app.put("/api/products/{product_id}/price")
-def update_price(product_id: int, price: float, currency: str = "VND"):
+def update_price(product_id: int, price: float, currency: str = "VND", accept: str = Header(None)):
     """Update product price"""
     try:
         request = price_pb2.UpdatePriceRequest(
@@ -242,9 +310,12 @@ def update_price(product_id: int, price: float, currency: str = "VND"):
             currency=currency
         )
         response = price_stub.UpdatePrice(request)
+        product_versions.invalidate(product_id)
         if not response.success:
             raise HTTPException(status_code=400, detail=response.message)
         
+        if wants_protobuf(accept):
+            return protobuf_response(response)
         return {
             "product_id": response.price.product_id,
             "price": response.price.price,
@@ -256,7 +327,7 @@ def update_price(product_id: int, price: float, currency: str = "VND"):
 
 
 @app.put("/api/products/{product_id}/inventory")
-def update_inventory(product_id: int, quantity: int):
+def update_inventory(product_id: int, quantity: int, accept: str = Header(None)):
     """Update product inventory"""
     try:
         request = inventory_pb2.UpdateInventoryRequest(
@@ -264,9 +335,12 @@ def update_inventory(product_id: int, quantity: int):
             quantity=quantity
         )
         response = inventory_stub.UpdateInventory(request)
+        product_versions.invalidate(product_id)
         if not response.success:
             raise HTTPException(status_code=400, detail=response.message)
         
+        if wants_protobuf(accept):
+            return protobuf_response(response)
         return {
             "product_id": response.inventory.product_id,
             "quantity": response.inventory.quantity,
@@ -311,6 +385,12 @@ def health_check():
         status["services"]["inventory"] = "disconnected"
         status["status"] = "unhealthy"
     
+    status["channel_pools"] = {
+        "product": product_pool.stats(),
+        "price": price_pool.stats(),
+        "inventory": inventory_pool.stats()
+    }
+    status["rate_limiter"] = rate_limiter.stats()
     return status
 
 
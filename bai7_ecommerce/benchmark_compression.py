@@ -0,0 +1,148 @@
+"""
+Benchmark nén response ListProducts: số byte trên đường truyền so với chi phí CPU
+1. Offline: serialize ListProductsResponse theo từng page size, đo kích thước và thời gian
+   nén / giải nén với gzip và deflate (đúng thuật toán gRPC dùng cho message compression)
+2. End-to-end: chạy Product Service với GRPC_COMPRESSION=none/gzip/deflate và đo latency
+   ListProducts qua localhost (trên mạng thật, phần byte tiết kiệm được sẽ quan trọng hơn)
+
+Usage: python benchmark_compression.py [num_products] [calls_per_page_size]
+"""
+import gzip
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+import grpc
+
+DATA_DIR = tempfile.mkdtemp()
+os.environ["PRODUCT_DB_URL"] = f"sqlite:///{os.path.join(DATA_DIR, 'products.db')}"
+os.environ["PRICE_DB_URL"] = f"sqlite:///{os.path.join(DATA_DIR, 'prices.db')}"
+os.environ["INVENTORY_DB_URL"] = f"sqlite:///{os.path.join(DATA_DIR, 'inventories.db')}"
+
+import product_pb2
+import product_pb2_grpc
+from database import ProductSessionLocal, Product, init_product_db
+
+PRODUCT_SERVICE = "localhost:50061"
+PAGE_SIZES = (10, 50, 100, 500)
+ALGORITHMS = ("none", "gzip", "deflate")
+CATEGORIES = ("Electronics", "Books", "Clothing", "Home", "Sports")
+WORDS = (
+    "sản phẩm chính hãng bảo hành 12 tháng giao hàng nhanh toàn quốc chất liệu cao cấp "
+    "thiết kế hiện đại phù hợp gia đình văn phòng màu sắc đa dạng kích thước nhỏ gọn "
+    "high quality durable lightweight wireless battery warranty compatible premium "
+    "stainless steel cotton ergonomic adjustable waterproof portable energy efficient"
+).split()
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def seed_products(num_products):
+    init_product_db()
+    db = ProductSessionLocal()
+    try:
+        db.bulk_insert_mappings(Product, [
+            {
+                "name": f"Product {i}",
+                # Mô tả dài 80-160 từ giống mô tả sản phẩm thật
+                "description": " ".join(random.choices(WORDS, k=random.randint(80, 160))),
+                "category": random.choice(CATEGORIES),
+                "price": round(random.uniform(10000, 5000000), -3),
+                "inventory": random.randint(0, 500),
+            }
+            for i in range(num_products)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def measure_cpu(compress, decompress, payload, repeat=50):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        compressed = compress(payload)
+    compress_ms = (time.perf_counter() - start) / repeat * 1000
+    start = time.perf_counter()
+    for _ in range(repeat):
+        decompress(compressed)
+    decompress_ms = (time.perf_counter() - start) / repeat * 1000
+    return len(compressed), compress_ms, decompress_ms
+
+
+def offline_results(stub):
+    codecs = {
+        # Cùng mức nén mặc định của zlib (6) cho cả hai
+        "gzip": (lambda data: gzip.compress(data, compresslevel=6), gzip.decompress),
+        "deflate": (zlib.compress, zlib.decompress),
+    }
+    results = []
+    for page_size in PAGE_SIZES:
+        response = stub.ListProducts(product_pb2.ListProductsRequest(page=1, page_size=page_size))
+        payload = response.SerializeToString()
+        for name, (compress, decompress) in codecs.items():
+            size, compress_ms, decompress_ms = measure_cpu(compress, decompress, payload)
+            results.append((page_size, name, len(payload), size, compress_ms, decompress_ms))
+    return results
+
+
+def run_server(algorithm, calls):
+    env = dict(os.environ, GRPC_COMPRESSION=algorithm, GRPC_COMPRESS_MIN_BYTES="0", METRICS_PORT="0")
+    service = subprocess.Popen(
+        [sys.executable, "services/product_service.py"], env=env, stdout=subprocess.DEVNULL
+    )
+    try:
+        with grpc.insecure_channel(PRODUCT_SERVICE) as channel:
+            grpc.channel_ready_future(channel).result(timeout=10)
+            stub = product_pb2_grpc.ProductServiceStub(channel)
+            offline = offline_results(stub) if algorithm == "none" else None
+            latencies = {}
+            for page_size in PAGE_SIZES:
+                request = product_pb2.ListProductsRequest(page=1, page_size=page_size)
+                stub.ListProducts(request)  # warm-up
+                samples = []
+                for _ in range(calls):
+                    start = time.perf_counter()
+                    stub.ListProducts(request)
+                    samples.append(time.perf_counter() - start)
+                latencies[page_size] = (percentile(samples, 50) * 1000, percentile(samples, 99) * 1000)
+            return offline, latencies
+    finally:
+        service.terminate()
+        service.wait()
+
+
+def main():
+    num_products = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    calls = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    print(f"Seeding {num_products} products...")
+    seed_products(num_products)
+
+    offline = None
+    latencies = {}
+    for algorithm in ALGORITHMS:
+        result, latencies[algorithm] = run_server(algorithm, calls)
+        offline = offline or result
+
+    print("\nBytes on the wire vs CPU (per message)\n")
+    print(f"{'Page':>6} {'Codec':<8} {'Raw (B)':>10} {'Wire (B)':>10} {'Ratio':>7} {'Compress (ms)':>14} {'Decompress (ms)':>16}")
+    print("-" * 76)
+    for page_size, name, raw, size, compress_ms, decompress_ms in offline:
+        print(f"{page_size:>6} {name:<8} {raw:>10} {size:>10} {raw / size:>6.1f}x {compress_ms:>14.3f} {decompress_ms:>16.3f}")
+
+    print(f"\nListProducts latency over localhost, {calls} calls per page size\n")
+    print(f"{'Page':>6} " + " ".join(f"{a + ' p50/p99 (ms)':>24}" for a in ALGORITHMS))
+    print("-" * (7 + 25 * len(ALGORITHMS)))
+    for page_size in PAGE_SIZES:
+        cells = " ".join(f"{'%.2f / %.2f' % latencies[a][page_size]:>24}" for a in ALGORITHMS)
+        print(f"{page_size:>6} {cells}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,25 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Text
+from sqlalchemy import Column, Integer, String, Float, Text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.db import create_db_engine, migrate_table, pool_collector
 
 # Product database
 PRODUCT_DB_URL = os.getenv("PRODUCT_DB_URL", "sqlite:///./products.db")
-product_engine = create_engine(
-    PRODUCT_DB_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in PRODUCT_DB_URL else {}
-)
+product_engine = create_db_engine(PRODUCT_DB_URL)
 ProductSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=product_engine)
 
 # Price database
 PRICE_DB_URL = os.getenv("PRICE_DB_URL", "sqlite:///./prices.db")
-price_engine = create_engine(
-    PRICE_DB_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in PRICE_DB_URL else {}
-)
+price_engine = create_db_engine(PRICE_DB_URL)
 PriceSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=price_engine)
 
 # Inventory database
 INVENTORY_DB_URL = os.getenv("INVENTORY_DB_URL", "sqlite:///./inventories.db")
-inventory_engine = create_engine(
-    INVENTORY_DB_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in INVENTORY_DB_URL else {}
-)
+inventory_engine = create_db_engine(INVENTORY_DB_URL)
 InventorySessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=inventory_engine)
 
 Base = declarative_base()
@@ -39,6 +34,7 @@ class Product(Base):
     category = Column(String, nullable=False)
     price = Column(Float, nullable=False)
     inventory = Column(Integer, default=0)
+    version = Column(Integer, nullable=False, default=1)
 
 
 class Price(Base):
@@ -48,6 +44,7 @@ class Price(Base):
     price = Column(Float, nullable=False)
     currency = Column(String, default="VND")
     updated_at = Column(Float)
+    version = Column(Integer, nullable=False, default=1)
 
 
 class Inventory(Base):
@@ -56,16 +53,23 @@ class Inventory(Base):
     product_id = Column(Integer, primary_key=True, index=True)
     quantity = Column(Integer, default=0)
     updated_at = Column(Float)
+    version = Column(Integer, nullable=False, default=1)
+
 
+def _init_table(db_engine, table):
+    Base.metadata.create_all(bind=db_engine, tables=[table])
+    # Database tạo từ phiên bản cũ: thêm cột version (DEFAULT 1) cùng các cột mới khác
+    with db_engine.begin() as connection:
+        migrate_table(connection, table)
 
 def init_product_db():
-    Base.metadata.create_all(bind=product_engine, tables=[Product.__table__])
+    _init_table(product_engine, Product.__table__)
 
 def init_price_db():
-    Base.metadata.create_all(bind=price_engine, tables=[Price.__table__])
+    _init_table(price_engine, Price.__table__)
 
 def init_inventory_db():
-    Base.metadata.create_all(bind=inventory_engine, tables=[Inventory.__table__])
+    _init_table(inventory_engine, Inventory.__table__)
 
 def init_db():
     # Initialize all databases (for convenience)
@@ -98,3 +102,8 @@ def get_inventory_db():
     finally:
         db.close()
 
+
+def pool_metrics_collector(name):
+    """Metrics connection pool của một database (product / price / inventory) cho REGISTRY.add_collector"""
+    engines = {"product": product_engine, "price": price_engine, "inventory": inventory_engine}
+    return pool_collector(engines[name], name)
@@ -12,7 +12,9 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import inventory_pb2
 import inventory_pb2_grpc
-from database import InventorySessionLocal, Inventory, init_inventory_db
+from database import InventorySessionLocal, Inventory, init_inventory_db, pool_metrics_collector
+from common.metrics import REGISTRY, MetricsInterceptor, start_metrics_server
+from common.compression import CompressionInterceptor
 
 
 class InventoryServiceServicer(inventory_pb2_grpc.InventoryServiceServicer):
@@ -32,7 +34,8 @@ class InventoryServiceServicer(inventory_pb2_grpc.InventoryServiceServicer):
                 inventory=inventory_pb2.Inventory(
                     product_id=inv.product_id,
                     quantity=inv.quantity,
-                    updated_at=int(inv.updated_at * 1000)
+                    updated_at=int(inv.updated_at * 1000),
+                    version=inv.version
                 )
             )
         except Exception as e:
@@ -51,6 +54,7 @@ class InventoryServiceServicer(inventory_pb2_grpc.InventoryServiceServicer):
             if inv:
                 inv.quantity = request.quantity
                 inv.updated_at = time.time()
+                inv.version = Inventory.version + 1
             else:
                 inv = Inventory(
                     product_id=request.product_id,
@@ -68,7 +72,8 @@ class InventoryServiceServicer(inventory_pb2_grpc.InventoryServiceServicer):
                 inventory=inventory_pb2.Inventory(
                     product_id=inv.product_id,
                     quantity=inv.quantity,
-                    updated_at=int(inv.updated_at * 1000)
+                    updated_at=int(inv.updated_at * 1000),
+                    version=inv.version
                 )
             )
         except Exception as e:
@@ -91,7 +96,8 @@ class InventoryServiceServicer(inventory_pb2_grpc.InventoryServiceServicer):
                 inventory_pb2.Inventory(
                     product_id=inv.product_id,
                     quantity=inv.quantity,
-                    updated_at=int(inv.updated_at * 1000)
+                    updated_at=int(inv.updated_at * 1000),
+                    version=inv.version
                 )
                 for inv in inventories
             ]
@@ -105,12 +111,16 @@ class InventoryServiceServicer(inventory_pb2_grpc.InventoryServiceServicer):
 
 def serve():
     init_inventory_db()
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=10), interceptors=[MetricsInterceptor(), CompressionInterceptor()]
+    )
     inventory_pb2_grpc.add_InventoryServiceServicer_to_server(
         InventoryServiceServicer(), server
     )
     server.add_insecure_port('[::]:50063')
     server.start()
+    REGISTRY.add_collector(pool_metrics_collector("inventory"))
+    start_metrics_server(50063)
     print("Inventory Service started on port 50063")
     server.wait_for_termination()
 
@@ -12,7 +12,9 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import price_pb2
 import price_pb2_grpc
-from database import PriceSessionLocal, Price, init_price_db
+from database import PriceSessionLocal, Price, init_price_db, pool_metrics_collector
+from common.metrics import REGISTRY, MetricsInterceptor, start_metrics_server
+from common.compression import CompressionInterceptor
 
 
 class PriceServiceServicer(price_pb2_grpc.PriceServiceServicer):
@@ -33,7 +35,8 @@ class PriceServiceServicer(price_pb2_grpc.PriceServiceServicer):
                     product_id=price_obj.product_id,
                     price=price_obj.price,
                     currency=price_obj.currency,
-                    updated_at=int(price_obj.updated_at.timestamp() * 1000)
+                    updated_at=int(price_obj.updated_at * 1000),
+                    version=price_obj.version
                 )
             )
         except Exception as e:
@@ -53,6 +56,7 @@ class PriceServiceServicer(price_pb2_grpc.PriceServiceServicer):
                 price_obj.price = request.price
                 price_obj.currency = request.currency
                 price_obj.updated_at = time.time()
+                price_obj.version = Price.version + 1
             else:
                 price_obj = Price(
                     product_id=request.product_id,
@@ -72,7 +76,8 @@ class PriceServiceServicer(price_pb2_grpc.PriceServiceServicer):
                     product_id=price_obj.product_id,
                     price=price_obj.price,
                     currency=price_obj.currency,
-                    updated_at=int(price_obj.updated_at * 1000)
+                    updated_at=int(price_obj.updated_at * 1000),
+                    version=price_obj.version
                 )
             )
         except Exception as e:
@@ -94,7 +99,8 @@ class PriceServiceServicer(price_pb2_grpc.PriceServiceServicer):
                     product_id=p.product_id,
                     price=p.price,
                     currency=p.currency,
-                    updated_at=int(p.updated_at * 1000)
+                    updated_at=int(p.updated_at * 1000),
+                    version=p.version
                 )
                 for p in prices
             ]
@@ -108,12 +114,16 @@ class PriceServiceServicer(price_pb2_grpc.PriceServiceServicer):
 
 def serve():
     init_price_db()
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=10), interceptors=[MetricsInterceptor(), CompressionInterceptor()]
+    )
     price_pb2_grpc.add_PriceServiceServicer_to_server(
         PriceServiceServicer(), server
     )
     server.add_insecure_port('[::]:50062')
     server.start()
+    REGISTRY.add_collector(pool_metrics_collector("price"))
+    start_metrics_server(50062)
     print("Price Service started on port 50062")
     server.wait_for_termination()
 
@@ -11,7 +11,9 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import product_pb2
 import product_pb2_grpc
-from database import ProductSessionLocal, Product, init_product_db
+from database import ProductSessionLocal, Product, init_product_db, pool_metrics_collector
+from common.metrics import REGISTRY, MetricsInterceptor, start_metrics_server
+from common.compression import CompressionInterceptor
 
 
 class ProductServiceServicer(product_pb2_grpc.ProductServiceServicer):
@@ -34,7 +36,8 @@ class ProductServiceServicer(product_pb2_grpc.ProductServiceServicer):
                     description=product.description,
                     category=product.category,
                     price=product.price,
-                    inventory=product.inventory
+                    inventory=product.inventory,
+                    version=product.version
                 )
             )
         except Exception as e:
@@ -67,7 +70,8 @@ class ProductServiceServicer(product_pb2_grpc.ProductServiceServicer):
                     description=p.description,
                     category=p.category,
                     price=p.price,
-                    inventory=p.inventory
+                    inventory=p.inventory,
+                    version=p.version
                 )
                 for p in products
             ]
@@ -104,7 +108,8 @@ class ProductServiceServicer(product_pb2_grpc.ProductServiceServicer):
                     description=product.description,
                     category=product.category,
                     price=product.price,
-                    inventory=product.inventory
+                    inventory=product.inventory,
+                    version=product.version
                 )
             )
         except Exception as e:
@@ -144,7 +149,8 @@ class ProductServiceServicer(product_pb2_grpc.ProductServiceServicer):
                     description=p.description,
                     category=p.category,
                     price=p.price,
-                    inventory=p.inventory
+                    inventory=p.inventory,
+                    version=p.version
                 )
                 for p in products
             ]
@@ -161,12 +167,16 @@ class ProductServiceServicer(product_pb2_grpc.ProductServiceServicer):
 
 def serve():
     init_product_db()
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=10), interceptors=[MetricsInterceptor(), CompressionInterceptor()]
+    )
     product_pb2_grpc.add_ProductServiceServicer_to_server(
         ProductServiceServicer(), server
     )
     server.add_insecure_port('[::]:50061')
     server.start()
+    REGISTRY.add_collector(pool_metrics_collector("product"))
+    start_metrics_server(50061)
     print("Product Service started on port 50061")
     server.wait_for_termination()
 
@@ -0,0 +1,3 @@
+"""
+Các module dùng chung cho nhiều bài tập (database, metrics, ...)
+"""
@@ -0,0 +1,124 @@
+"""
+Pool nhiều gRPC channel tới cùng một target
+Mỗi channel có channel args riêng nên là một TCP/HTTP2 connection riêng,
+tránh giới hạn số stream đồng thời của một connection duy nhất.
+Mỗi call chọn channel theo round-robin hoặc channel có ít call đang chạy nhất.
+"""
+import asyncio
+import itertools
+import os
+import threading
+import grpc
+from common.compression import GRPC_CHANNEL_COMPRESSION, compression_algorithm
+
+GRPC_CHANNEL_POOL_SIZE = int(os.getenv("GRPC_CHANNEL_POOL_SIZE", "4"))
+# "least_inflight" hoặc "round_robin"
+GRPC_CHANNEL_POOL_POLICY = os.getenv("GRPC_CHANNEL_POOL_POLICY", "least_inflight")
+GRPC_KEEPALIVE_TIME_MS = int(os.getenv("GRPC_KEEPALIVE_TIME_MS", "30000"))
+GRPC_KEEPALIVE_TIMEOUT_MS = int(os.getenv("GRPC_KEEPALIVE_TIMEOUT_MS", "10000"))
+
+
+def channel_options(index):
+    return [
+        # Subchannel pool riêng + một arg khác nhau cho mỗi channel,
+        # nếu không gRPC sẽ dùng chung một connection cho các channel giống nhau
+        ("grpc.use_local_subchannel_pool", 1),
+        ("grpc.channel_pool_index", index),
+        # Keepalive: phát hiện connection chết khi không có traffic
+        ("grpc.keepalive_time_ms", GRPC_KEEPALIVE_TIME_MS),
+        ("grpc.keepalive_timeout_ms", GRPC_KEEPALIVE_TIMEOUT_MS),
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.max_pings_without_data", 0),
+    ]
+
+
+class ChannelPool:
+    def __init__(self, target, size=GRPC_CHANNEL_POOL_SIZE, policy=GRPC_CHANNEL_POOL_POLICY,
+                 aio=False, options=None, compression=GRPC_CHANNEL_COMPRESSION):
+        if policy not in ("least_inflight", "round_robin"):
+            raise ValueError(f"Unknown channel pool policy: {policy}")
+
+        create_channel = grpc.aio.insecure_channel if aio else grpc.insecure_channel
+        self.target = target
+        self.policy = policy
+        self.aio = aio
+        self.channels = [
+            create_channel(target, options=channel_options(i) + list(options or []),
+                           compression=compression_algorithm(compression))
+            for i in range(max(size, 1))
+        ]
+        self.inflight = [0] * len(self.channels)
+        self.lock = threading.Lock()
+        self._next = itertools.count()
+
+    def acquire(self):
+        """Chọn channel cho một call và tăng số call đang chạy của channel đó"""
+        with self.lock:
+            size = len(self.channels)
+            start = next(self._next) % size
+            if self.policy == "round_robin":
+                index = start
+            else:
+                # Bắt đầu từ vị trí xoay vòng để các channel rảnh được chia đều
+                index = min(((start + i) % size for i in range(size)), key=self.inflight.__getitem__)
+            self.inflight[index] += 1
+            return index
+
+    def release(self, index):
+        with self.lock:
+            self.inflight[index] -= 1
+
+    def stub(self, stub_class):
+        return PooledStub(self, [stub_class(channel) for channel in self.channels])
+
+    def stats(self):
+        with self.lock:
+            return {
+                "target": self.target,
+                "policy": self.policy,
+                "size": len(self.channels),
+                "inflight": list(self.inflight),
+            }
+
+    def close(self):
+        for channel in self.channels:
+            channel.close()
+
+    async def aclose(self):
+        await asyncio.gather(*(channel.close() for channel in self.channels))
+
+
+class PooledStub:
+    """Có cùng các method với stub gốc, mỗi call được gửi qua một channel trong pool"""
+
+    def __init__(self, pool, stubs):
+        self._pool = pool
+        self._stubs = stubs
+
+    def __getattr__(self, name):
+        method = PooledMethod(self._pool, [getattr(stub, name) for stub in self._stubs])
+        setattr(self, name, method)
+        return method
+
+
+class PooledMethod:
+    # Số call đang chạy chỉ chính xác với unary call; streaming call được tính
+    # đến khi call object được tạo ra
+    def __init__(self, pool, methods):
+        self.pool = pool
+        self.methods = methods
+
+    def __call__(self, request, **kwargs):
+        index = self.pool.acquire()
+        if self.pool.aio:
+            return self._call_async(index, request, kwargs)
+        try:
+            return self.methods[index](request, **kwargs)
+        finally:
+            self.pool.release(index)
+
+    async def _call_async(self, index, request, kwargs):
+        try:
+            return await self.methods[index](request, **kwargs)
+        finally:
+            self.pool.release(index)
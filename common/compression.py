@@ -0,0 +1,135 @@
+"""
+Nén response gRPC (gzip / deflate) theo method hoặc theo kích thước message
+CompressionInterceptor (sync) và AsyncCompressionInterceptor (grpc.aio) chỉ bật nén
+cho response của các method trong GRPC_COMPRESS_METHODS, hoặc (nếu không cấu hình method)
+cho các response có kích thước >= GRPC_COMPRESS_MIN_BYTES. Response nhỏ gửi không nén
+vì tốn CPU mà gần như không giảm được byte nào.
+"""
+import functools
+import os
+import grpc
+
+GRPC_COMPRESSION = os.getenv("GRPC_COMPRESSION", "gzip")  # gzip, deflate hoặc none
+GRPC_COMPRESS_MIN_BYTES = int(os.getenv("GRPC_COMPRESS_MIN_BYTES", "1024"))
+# Ví dụ "ListProducts,SearchProduct": luôn nén các method này, bỏ qua ngưỡng kích thước
+GRPC_COMPRESS_METHODS = os.getenv("GRPC_COMPRESS_METHODS", "")
+# Nén request phía client (channel), mặc định không nén vì request thường nhỏ
+GRPC_CHANNEL_COMPRESSION = os.getenv("GRPC_CHANNEL_COMPRESSION", "none")
+# Ngưỡng nén gzip cho HTTP response của các REST gateway (GZipMiddleware)
+GATEWAY_GZIP_MIN_BYTES = int(os.getenv("GATEWAY_GZIP_MIN_BYTES", "1024"))
+
+ALGORITHMS = {
+    "none": grpc.Compression.NoCompression,
+    "gzip": grpc.Compression.Gzip,
+    "deflate": grpc.Compression.Deflate,
+}
+
+
+def compression_algorithm(name):
+    try:
+        return ALGORITHMS[name.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown compression algorithm: {name}") from None
+
+
+class CompressionPolicy:
+    def __init__(self, algorithm=GRPC_COMPRESSION, min_bytes=GRPC_COMPRESS_MIN_BYTES,
+                 methods=GRPC_COMPRESS_METHODS):
+        self.algorithm = compression_algorithm(algorithm)
+        self.min_bytes = min_bytes
+        if isinstance(methods, str):
+            methods = [name.strip() for name in methods.split(",") if name.strip()]
+        self.methods = set(methods)
+
+    @property
+    def enabled(self):
+        return self.algorithm != grpc.Compression.NoCompression
+
+    def applies_to(self, full_method):
+        """None = quyết định theo kích thước từng message"""
+        if not self.methods:
+            return None
+        return full_method.rpartition("/")[2] in self.methods
+
+    def should_compress(self, method_selected, message):
+        if method_selected is not None:
+            return method_selected
+        return message.ByteSize() >= self.min_bytes
+
+
+class CompressionInterceptor(grpc.ServerInterceptor):
+    def __init__(self, policy=None):
+        self.policy = policy or CompressionPolicy()
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None or not self.policy.enabled:
+            return handler
+
+        policy = self.policy
+        selected = policy.applies_to(handler_call_details.method)
+        if selected is False:
+            return handler
+
+        def call(behavior, request_or_iterator, context):
+            response = behavior(request_or_iterator, context)
+            if policy.should_compress(selected, response):
+                context.set_compression(policy.algorithm)
+            return response
+
+        def stream_call(behavior, request_or_iterator, context):
+            # Bật nén cho cả stream, message nhỏ được gửi không nén
+            context.set_compression(policy.algorithm)
+            for response in behavior(request_or_iterator, context):
+                if not policy.should_compress(selected, response):
+                    context.disable_next_message_compression()
+                yield response
+
+        return wrap_handler(handler, call, stream_call)
+
+
+class AsyncCompressionInterceptor(grpc.aio.ServerInterceptor):
+    def __init__(self, policy=None):
+        self.policy = policy or CompressionPolicy()
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None or not self.policy.enabled:
+            return handler
+
+        policy = self.policy
+        selected = policy.applies_to(handler_call_details.method)
+        if selected is False:
+            return handler
+
+        async def call(behavior, request_or_iterator, context):
+            response = await behavior(request_or_iterator, context)
+            if policy.should_compress(selected, response):
+                context.set_compression(policy.algorithm)
+            return response
+
+        async def stream_call(behavior, request_or_iterator, context):
+            context.set_compression(policy.algorithm)
+            async for response in behavior(request_or_iterator, context):
+                if not policy.should_compress(selected, response):
+                    context.disable_next_message_compression()
+                yield response
+
+        return wrap_handler(handler, call, stream_call)
+
+
+def wrap_handler(handler, call, stream_call):
+    # functools.partial giữ được kiểu coroutine / async generator của hàm gốc
+    if handler.unary_unary:
+        behavior, factory = functools.partial(call, handler.unary_unary), grpc.unary_unary_rpc_method_handler
+    elif handler.stream_unary:
+        behavior, factory = functools.partial(call, handler.stream_unary), grpc.stream_unary_rpc_method_handler
+    elif handler.unary_stream:
+        behavior, factory = functools.partial(stream_call, handler.unary_stream), grpc.unary_stream_rpc_method_handler
+    else:
+        behavior, factory = functools.partial(stream_call, handler.stream_stream), grpc.stream_stream_rpc_method_handler
+    return factory(
+        behavior,
+        request_deserializer=handler.request_deserializer,
+        response_serializer=handler.response_serializer,
+    )
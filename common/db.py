@@ -0,0 +1,270 @@
+"""
+Engine factory dùng chung cho các database module
+- SQLite: WAL, synchronous=NORMAL, memory-mapped I/O, busy timeout; transaction do SQLAlchemy
+  tự BEGIN (pysqlite / aiosqlite mặc định chỉ BEGIN trước DML nên SAVEPOINT nằm ngoài transaction)
+- PostgreSQL/MySQL: pool size, overflow, pre-ping lấy từ biến môi trường
+- Metrics của connection pool: thời gian chờ checkout, độ bão hoà pool, xuất ở /metrics qua
+  pool_collector (REGISTRY.add_collector của common/metrics.py)
+- AsyncEngine (aiosqlite / asyncpg) cho các server grpc.aio
+- migrate_table: thêm cột / index mới vào bảng của database tạo từ phiên bản cũ
+"""
+import os
+import threading
+import time
+from sqlalchemy import bindparam, create_engine, event, exc, inspect, literal, select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Cấu hình connection pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# Cấu hình SQLite
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+
+class PoolMetrics:
+    """Đếm số lần checkout, thời gian chờ và số lần timeout của một pool"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def observe_wait(self, seconds):
+        with self.lock:
+            self.checkouts += 1
+            self.wait_seconds_total += seconds
+            if seconds > self.wait_seconds_max:
+                self.wait_seconds_max = seconds
+
+    def observe_timeout(self):
+        with self.lock:
+            self.timeouts += 1
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool ghi lại thời gian chờ lấy connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.observe_timeout()
+            raise
+        finally:
+            self.metrics.observe_wait(time.perf_counter() - start)
+
+
+class TimedAsyncQueuePool(TimedQueuePool, AsyncAdaptedQueuePool):
+    """Phiên bản asyncio của TimedQueuePool"""
+
+
+# Driver async tương ứng với driver sync
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+
+def is_sqlite(url):
+    return str(url).startswith("sqlite")
+
+
+def is_sqlite_memory(url):
+    url = str(url)
+    return url in ("sqlite://", "sqlite:///:memory:") or ":memory:" in url
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL cho phép nhiều reader đọc song song với một writer
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+    # Tắt BEGIN tự động của driver: SAVEPOINT được chạy khi chưa có BEGIN, RELEASE SAVEPOINT
+    # sẽ commit luôn phần đó. BEGIN do _sqlite_begin phát ra khi SQLAlchemy mở transaction
+    dbapi_connection.isolation_level = None
+
+
+def _sqlite_begin(connection):
+    connection.exec_driver_sql("BEGIN")
+
+
+def _listen_sqlite(engine):
+    """Pragmas + BEGIN tường minh, theo cách SQLAlchemy hướng dẫn cho pysqlite / aiosqlite"""
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    event.listen(engine, "begin", _sqlite_begin)
+
+
+def engine_options(url):
+    """Tham số cho create_engine/create_async_engine tuỳ theo loại database"""
+    if is_sqlite(url):
+        options = {
+            "connect_args": {
+                "check_same_thread": False,
+                "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+            }
+        }
+        if not is_sqlite_memory(url):
+            options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+        return options
+
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def create_db_engine(url):
+    options = engine_options(url)
+    if "pool_size" in options:
+        options["poolclass"] = TimedQueuePool
+    engine = create_engine(url, **options)
+    if is_sqlite(url):
+        _listen_sqlite(engine)
+    return engine
+
+
+# Số dòng mỗi lần đọc + ghi khi backfill cột mới (migrate_table)
+BACKFILL_BATCH = 1000
+
+
+def migrate_table(connection, table, backfill=None):
+    """create_all không sửa bảng đã có: thêm các cột model có mà bảng chưa có bằng
+    ALTER TABLE ... ADD COLUMN, điền giá trị cho các dòng cũ bằng backfill {cột: (cột nguồn, hàm)}
+    rồi tạo các index còn thiếu. Hàm chạy bằng Python, giống hệt lúc ghi (ví dụ str.lower, lower()
+    của SQLite chỉ đổi ký tự ASCII). connection là Connection sync (server async dùng run_sync)"""
+    inspector = inspect(connection)
+    if not inspector.has_table(table.name):
+        return
+    existing = {column["name"] for column in inspector.get_columns(table.name)}
+    preparer = connection.dialect.identifier_preparer
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        ddl = f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} " \
+              f"{column.type.compile(dialect=connection.dialect)}"
+        if not column.nullable:
+            # Dòng cũ cần giá trị ngay lúc thêm cột NOT NULL, backfill ghi giá trị thật sau đó
+            default = column.default.arg if column.default is not None and column.default.is_scalar else ""
+            default = literal(default).compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True})
+            ddl += f" NOT NULL DEFAULT {default}"
+        connection.execute(text(ddl))
+        if backfill and column.name in backfill:
+            source, function = backfill[column.name]
+            _backfill(connection, table, column, table.c[source], function)
+    for index in table.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def _backfill(connection, table, column, source, function):
+    """column = function(source) cho mọi dòng, đọc theo khoá chính từng BACKFILL_BATCH dòng"""
+    key = table.primary_key.columns[0]
+    update = table.update().where(key == bindparam("_key")).values({column.name: bindparam("_value")})
+    last = None
+    while True:
+        query = select(key, source).order_by(key).limit(BACKFILL_BATCH)
+        if last is not None:
+            query = query.where(key > last)
+        rows = connection.execute(query).all()
+        if not rows:
+            return
+        connection.execute(update, [{"_key": row[0], "_value": function(row[1])} for row in rows])
+        last = rows[-1][0]
+
+
+def to_async_url(url):
+    """sqlite:///x.db -> sqlite+aiosqlite:///x.db, postgresql://... -> postgresql+asyncpg://..."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def create_async_db_engine(url):
+    # Import ở đây để server sync không cần cài sqlalchemy[asyncio]
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    async_url = to_async_url(url)
+    options = engine_options(url)
+    if "pool_size" in options:
+        options["poolclass"] = TimedAsyncQueuePool
+    engine = create_async_engine(async_url, **options)
+    if is_sqlite(url):
+        _listen_sqlite(engine.sync_engine)
+    return engine
+
+
+def pool_metrics(engine):
+    """Snapshot metrics của connection pool (rỗng nếu pool không hỗ trợ)"""
+    pool = getattr(engine, "sync_engine", engine).pool
+    metrics = getattr(pool, "metrics", None)
+    if metrics is None:
+        return {}
+
+    capacity = pool.size() + max(pool._max_overflow, 0)
+    checked_out = pool.checkedout()
+    with metrics.lock:
+        checkouts = metrics.checkouts
+        return {
+            "pool_size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "checked_out": checked_out,
+            "overflow": max(pool.overflow(), 0),
+            "saturation": checked_out / capacity if capacity else 0.0,
+            "checkouts_total": checkouts,
+            "checkout_timeouts_total": metrics.timeouts,
+            "checkout_wait_seconds_total": metrics.wait_seconds_total,
+            "checkout_wait_seconds_avg": metrics.wait_seconds_total / checkouts if checkouts else 0.0,
+            "checkout_wait_seconds_max": metrics.wait_seconds_max,
+        }
+
+
+# Key của pool_metrics() -> (metric Prometheus, type, help)
+POOL_METRIC_TYPES = {
+    "pool_size": ("db_pool_size", "gauge", "Configured connection pool size"),
+    "max_overflow": ("db_pool_max_overflow", "gauge", "Connections allowed above pool_size"),
+    "checked_out": ("db_pool_checked_out", "gauge", "Connections currently checked out"),
+    "overflow": ("db_pool_overflow", "gauge", "Overflow connections currently open"),
+    "saturation": ("db_pool_saturation", "gauge", "Checked out connections / (pool_size + max_overflow)"),
+    "checkouts_total": ("db_pool_checkouts_total", "counter", "Connection checkouts"),
+    "checkout_timeouts_total": ("db_pool_checkout_timeouts_total", "counter",
+                                "Checkouts that timed out waiting for a connection"),
+    "checkout_wait_seconds_total": ("db_pool_checkout_wait_seconds_total", "counter",
+                                    "Total time spent waiting for a connection"),
+    "checkout_wait_seconds_avg": ("db_pool_checkout_wait_seconds_avg", "gauge",
+                                  "Average time spent waiting for a connection"),
+    "checkout_wait_seconds_max": ("db_pool_checkout_wait_seconds_max", "gauge",
+                                  "Longest time spent waiting for a connection"),
+}
+
+
+def pool_collector(engine, database):
+    """Collector cho MetricsRegistry.add_collector: pool_metrics(engine) với label database"""
+    labels = {"database": database}
+
+    def collect():
+        return [
+            (*POOL_METRIC_TYPES[key], labels, value)
+            for key, value in pool_metrics(engine).items()
+        ]
+    return collect
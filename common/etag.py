@@ -0,0 +1,65 @@
+"""
+ETag / conditional GET dùng chung cho các REST gateway
+ETag được tạo từ version của bản ghi (tăng mỗi lần update), gateway có thể
+cache version theo id để trả 304 mà không cần gọi backend
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+ETAG_CACHE_TTL = float(os.getenv("ETAG_CACHE_TTL", "5"))
+ETAG_CACHE_SIZE = int(os.getenv("ETAG_CACHE_SIZE", "100000"))
+
+
+def make_etag(*parts):
+    """Strong ETag, ví dụ make_etag("u", 1, 3) -> '"u-1-3"'"""
+    return '"' + "-".join(str(part) for part in parts) + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """So sánh header If-None-Match với ETag hiện tại (weak comparison theo RFC 9110)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class VersionCache:
+    """LRU cache có TTL: key -> version mới nhất mà gateway đã thấy"""
+
+    def __init__(self, ttl=ETAG_CACHE_TTL, max_size=ETAG_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            version, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return version
+
+    def set(self, key, version):
+        with self.lock:
+            self.entries[key] = (version, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
@@ -0,0 +1,349 @@
+"""
+Metrics phía server cho mọi gRPC service
+MetricsInterceptor (sync) và AsyncMetricsInterceptor (grpc.aio) ghi lại theo từng method:
+số request, status code, histogram latency, số call đang chạy, kích thước message
+và số message của streaming call. Dữ liệu được xuất dạng Prometheus text qua HTTP.
+"""
+import bisect
+import functools
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import grpc
+
+# Mặc định metrics port = gRPC port + 10000 (ví dụ 50056 -> 60056), METRICS_PORT=0 để tắt
+METRICS_PORT_OFFSET = 10000
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # phần tử cuối là +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = {}       # (service, method, type) -> count
+        self.handled = {}       # (service, method, type, code) -> count
+        self.in_flight = {}     # (service, method, type) -> gauge
+        self.msg_received = {}  # (service, method, type) -> count
+        self.msg_sent = {}
+        self.latency = {}       # (service, method, type) -> Histogram
+        self.request_bytes = {}
+        self.response_bytes = {}
+        self.collectors = []    # callable trả về [(name, type, help, labels dict, value)]
+
+    def add_collector(self, collector):
+        """Metrics riêng của service (ví dụ độ sâu queue của chat hub), gọi lại mỗi lần scrape"""
+        self.collectors.append(collector)
+
+    def start(self, key):
+        with self.lock:
+            self.started[key] = self.started.get(key, 0) + 1
+            self.in_flight[key] = self.in_flight.get(key, 0) + 1
+
+    def finish(self, key, code, seconds):
+        with self.lock:
+            self.in_flight[key] -= 1
+            handled_key = (*key, code.name)
+            self.handled[handled_key] = self.handled.get(handled_key, 0) + 1
+            self._histogram(self.latency, key, LATENCY_BUCKETS).observe(seconds)
+
+    def received(self, key, message):
+        with self.lock:
+            self.msg_received[key] = self.msg_received.get(key, 0) + 1
+            self._histogram(self.request_bytes, key, SIZE_BUCKETS).observe(message_size(message))
+
+    def sent(self, key, message):
+        with self.lock:
+            self.msg_sent[key] = self.msg_sent.get(key, 0) + 1
+            self._histogram(self.response_bytes, key, SIZE_BUCKETS).observe(message_size(message))
+
+    @staticmethod
+    def _histogram(histograms, key, buckets):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(buckets)
+        return histogram
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            self._render_values(lines, "grpc_server_started_total", "counter",
+                                "Total number of RPCs started on the server", self.started)
+            self._render_values(lines, "grpc_server_handled_total", "counter",
+                                "Total number of RPCs completed on the server, by status code", self.handled)
+            self._render_values(lines, "grpc_server_in_flight", "gauge",
+                                "Number of RPCs currently being handled", self.in_flight)
+            self._render_values(lines, "grpc_server_msg_received_total", "counter",
+                                "Total number of messages received from clients", self.msg_received)
+            self._render_values(lines, "grpc_server_msg_sent_total", "counter",
+                                "Total number of messages sent to clients", self.msg_sent)
+            self._render_histograms(lines, "grpc_server_handling_seconds",
+                                    "Latency of RPCs handled by the server", self.latency)
+            self._render_histograms(lines, "grpc_server_msg_received_bytes",
+                                    "Size of messages received from clients", self.request_bytes)
+            self._render_histograms(lines, "grpc_server_msg_sent_bytes",
+                                    "Size of messages sent to clients", self.response_bytes)
+        for collector in self.collectors:
+            self._render_samples(lines, collector())
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_samples(lines, samples):
+        described = set()
+        for name, metric_type, help_text, sample_labels, value in samples:
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+            label_text = ",".join(f'{key}="{label}"' for key, label in sample_labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    @staticmethod
+    def _render_values(lines, name, metric_type, help_text, values):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for key, value in sorted(values.items()):
+            lines.append(f"{name}{{{labels(*key)}}} {value}")
+
+    @staticmethod
+    def _render_histograms(lines, name, help_text, histograms):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for key, histogram in sorted(histograms.items()):
+            label_text = labels(*key)
+            cumulative = 0
+            for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{label_text}}} {histogram.sum}")
+            lines.append(f"{name}_count{{{label_text}}} {cumulative}")
+
+
+REGISTRY = MetricsRegistry()
+
+
+def labels(service, method, rpc_type, code=None):
+    text = f'grpc_service="{service}",grpc_method="{method}",grpc_type="{rpc_type}"'
+    if code is not None:
+        text += f',grpc_code="{code}"'
+    return text
+
+
+def message_size(message):
+    if isinstance(message, bytes):  # response đã serialize sẵn (chat hub)
+        return len(message)
+    byte_size = getattr(message, "ByteSize", None)
+    return byte_size() if byte_size else 0
+
+
+def method_key(full_method, handler):
+    # "/user.UserService/GetUser" -> ("user.UserService", "GetUser", "unary")
+    service, _, method = full_method.lstrip("/").rpartition("/")
+    if handler.request_streaming and handler.response_streaming:
+        rpc_type = "bidi_stream"
+    elif handler.request_streaming:
+        rpc_type = "client_stream"
+    elif handler.response_streaming:
+        rpc_type = "server_stream"
+    else:
+        rpc_type = "unary"
+    return service or "unknown", method, rpc_type
+
+
+def status_code(context, error=None):
+    """Status code của call: code do handler set (set_code/abort), nếu không thì suy ra từ exception"""
+    code = context.code()
+    if code is not None:
+        return code
+    if isinstance(error, GeneratorExit):
+        return grpc.StatusCode.CANCELLED
+    return grpc.StatusCode.UNKNOWN if error is not None else grpc.StatusCode.OK
+
+
+def _wrap_handler(handler, behavior, factory):
+    return factory(
+        behavior,
+        request_deserializer=handler.request_deserializer,
+        response_serializer=handler.response_serializer,
+    )
+
+
+class MetricsInterceptor(grpc.ServerInterceptor):
+    def __init__(self, registry=REGISTRY):
+        self.registry = registry
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None:
+            return None
+
+        key = method_key(handler_call_details.method, handler)
+        registry = self.registry
+
+        def count_requests(request_iterator):
+            for request in request_iterator:
+                registry.received(key, request)
+                yield request
+
+        def call(behavior, request_or_iterator, context):
+            start = time.perf_counter()
+            registry.start(key)
+            error = None
+            try:
+                if handler.request_streaming:
+                    request_or_iterator = count_requests(request_or_iterator)
+                else:
+                    registry.received(key, request_or_iterator)
+                response = behavior(request_or_iterator, context)
+                if not handler.response_streaming:
+                    registry.sent(key, response)
+                return response
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                registry.finish(key, status_code(context, error), time.perf_counter() - start)
+
+        def stream_call(behavior, request_or_iterator, context):
+            # Response stream: call chỉ kết thúc khi generator của handler chạy hết
+            start = time.perf_counter()
+            registry.start(key)
+            error = None
+            try:
+                if handler.request_streaming:
+                    request_or_iterator = count_requests(request_or_iterator)
+                else:
+                    registry.received(key, request_or_iterator)
+                for response in behavior(request_or_iterator, context):
+                    registry.sent(key, response)
+                    yield response
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                registry.finish(key, status_code(context, error), time.perf_counter() - start)
+
+        if handler.unary_unary:
+            return _wrap_handler(handler, functools.partial(call, handler.unary_unary),
+                                 grpc.unary_unary_rpc_method_handler)
+        if handler.stream_unary:
+            return _wrap_handler(handler, functools.partial(call, handler.stream_unary),
+                                 grpc.stream_unary_rpc_method_handler)
+        if handler.unary_stream:
+            return _wrap_handler(handler, functools.partial(stream_call, handler.unary_stream),
+                                 grpc.unary_stream_rpc_method_handler)
+        return _wrap_handler(handler, functools.partial(stream_call, handler.stream_stream),
+                             grpc.stream_stream_rpc_method_handler)
+
+
+class AsyncMetricsInterceptor(grpc.aio.ServerInterceptor):
+    def __init__(self, registry=REGISTRY):
+        self.registry = registry
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return None
+
+        key = method_key(handler_call_details.method, handler)
+        registry = self.registry
+
+        async def count_requests(request_iterator):
+            async for request in request_iterator:
+                registry.received(key, request)
+                yield request
+
+        async def call(behavior, request_or_iterator, context):
+            start = time.perf_counter()
+            registry.start(key)
+            error = None
+            try:
+                if handler.request_streaming:
+                    request_or_iterator = count_requests(request_or_iterator)
+                else:
+                    registry.received(key, request_or_iterator)
+                response = await behavior(request_or_iterator, context)
+                registry.sent(key, response)
+                return response
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                registry.finish(key, status_code(context, error), time.perf_counter() - start)
+
+        async def stream_call(behavior, request_or_iterator, context):
+            start = time.perf_counter()
+            registry.start(key)
+            error = None
+            try:
+                if handler.request_streaming:
+                    request_or_iterator = count_requests(request_or_iterator)
+                else:
+                    registry.received(key, request_or_iterator)
+                async for response in behavior(request_or_iterator, context):
+                    registry.sent(key, response)
+                    yield response
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                registry.finish(key, status_code(context, error), time.perf_counter() - start)
+
+        # functools.partial giữ được kiểu coroutine / async generator của hàm gốc,
+        # grpc.aio dựa vào đó để biết cách gọi handler
+        if handler.unary_unary:
+            return _wrap_handler(handler, functools.partial(call, handler.unary_unary),
+                                 grpc.unary_unary_rpc_method_handler)
+        if handler.stream_unary:
+            return _wrap_handler(handler, functools.partial(call, handler.stream_unary),
+                                 grpc.stream_unary_rpc_method_handler)
+        if handler.unary_stream:
+            return _wrap_handler(handler, functools.partial(stream_call, handler.unary_stream),
+                                 grpc.unary_stream_rpc_method_handler)
+        return _wrap_handler(handler, functools.partial(stream_call, handler.stream_stream),
+                             grpc.stream_stream_rpc_method_handler)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(grpc_port, registry=REGISTRY):
+    """Chạy HTTP endpoint /metrics trong một daemon thread, trả về port (None nếu bị tắt)"""
+    port = int(os.getenv("METRICS_PORT", grpc_port + METRICS_PORT_OFFSET))
+    if port == 0:
+        return None
+
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    http_server = ThreadingHTTPServer(("", port), handler)
+    http_server.daemon_threads = True
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    print(f"Metrics available at http://localhost:{port}/metrics")
+    return port
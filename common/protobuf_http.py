@@ -0,0 +1,78 @@
+"""
+Content negotiation application/x-protobuf cho các REST gateway
+- Response: client gửi Accept: application/x-protobuf thì gateway trả thẳng message
+  của backend dưới dạng bytes đã serialize, không qua dict / JSON
+- Request: body Content-Type: application/x-protobuf được parse bằng message class
+  khai báo qua @protobuf_body, rồi đi tiếp qua validation của pydantic model như JSON
+"""
+import json
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from google.protobuf import json_format
+from google.protobuf.message import DecodeError
+
+PROTOBUF_MEDIA_TYPE = "application/x-protobuf"
+
+
+def is_protobuf(content_type):
+    return bool(content_type) and content_type.split(";")[0].strip().lower() == PROTOBUF_MEDIA_TYPE
+
+
+def wants_protobuf(accept):
+    """True nếu header Accept có application/x-protobuf (không xét q-value)"""
+    return bool(accept) and any(is_protobuf(media_type) for media_type in accept.split(","))
+
+
+def protobuf_response(message, status_code=200, headers=None):
+    return Response(
+        content=message.SerializeToString(),
+        status_code=status_code,
+        media_type=PROTOBUF_MEDIA_TYPE,
+        headers=headers
+    )
+
+
+def protobuf_body(message_class, field=None):
+    """Khai báo message class của request body dạng protobuf cho một endpoint.
+    field: chỉ lấy một field của message làm body (ví dụ list users của batch request)"""
+    def decorator(endpoint):
+        endpoint.protobuf_body = (message_class, field)
+        return endpoint
+    return decorator
+
+
+class ProtobufRoute(APIRoute):
+    """Route class chuyển body protobuf thành JSON tương đương trước khi FastAPI parse body"""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        message_class, field = getattr(self.endpoint, "protobuf_body", (None, None))
+        if message_class is None:
+            return handler
+
+        async def route_handler(request: Request):
+            if is_protobuf(request.headers.get("content-type")):
+                message = message_class()
+                try:
+                    message.ParseFromString(await request.body())
+                except DecodeError:
+                    return Response(
+                        content=json.dumps({"detail": "Invalid protobuf body"}),
+                        status_code=400,
+                        media_type="application/json"
+                    )
+                body = json_format.MessageToDict(message, preserving_proto_field_name=True)
+                if field:
+                    body = body.get(field, [])
+                request = json_request(request, body)
+            return await handler(request)
+
+        return route_handler
+
+
+def json_request(request, body):
+    headers = [(name, value) for name, value in request.scope["headers"] if name != b"content-type"]
+    headers.append((b"content-type", b"application/json"))
+    new_request = Request({**request.scope, "headers": headers}, request.receive)
+    new_request._body = json.dumps(body).encode("utf-8")
+    return new_request
@@ -0,0 +1,142 @@
+"""
+Rate limiting và load shedding cho các REST gateway
+Mỗi client có một token bucket riêng: theo header X-API-Key nếu key nằm trong RATE_LIMIT_API_KEYS,
+còn lại theo IP (key tự đặt không được tin, nếu không đổi key mỗi request là có bucket mới),
+ngoài ra có giới hạn tổng số request đang xử lý của cả gateway.
+Request vượt giới hạn bị trả 429 + Retry-After ngay trong middleware, trước khi gọi gRPC.
+"""
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+RATE_LIMIT_RPS = float(os.getenv("RATE_LIMIT_RPS", "50"))        # token nạp lại mỗi giây, 0 = tắt
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "100"))   # dung lượng bucket
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+# Các API key hợp lệ, cách nhau bởi dấu phẩy; rỗng = mọi client tính theo IP
+RATE_LIMIT_API_KEYS = frozenset(key for key in os.getenv("RATE_LIMIT_API_KEYS", "").split(",") if key)
+GATEWAY_MAX_IN_FLIGHT = int(os.getenv("GATEWAY_MAX_IN_FLIGHT", "256"))  # 0 = không giới hạn
+API_KEY_HEADER = b"x-api-key"
+
+
+class RateLimiter:
+    """
+    Token bucket theo client trong một LRU có kích thước tối đa max_clients.
+    Client mới bắt đầu với bucket đầy, trừ khi LRU vừa phải bỏ một bucket chưa nạp đầy: không
+    phân biệt được client đó quay lại với client mới nên client mới bắt đầu với bucket rỗng cho
+    tới lúc bucket bị bỏ lẽ ra đã đầy (nhiều client hơn max_clients không reset được giới hạn)
+    """
+
+    def __init__(self, rate=RATE_LIMIT_RPS, burst=RATE_LIMIT_BURST,
+                 max_clients=RATE_LIMIT_MAX_CLIENTS, max_in_flight=GATEWAY_MAX_IN_FLIGHT):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_clients = max_clients
+        self.max_in_flight = max_in_flight
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()  # client -> (tokens, last_refill)
+        self.fresh_after = 0.0  # trước thời điểm này (monotonic) client mới bắt đầu với bucket rỗng
+        self.in_flight = 0
+        self.rejected_rate = 0
+        self.rejected_in_flight = 0
+
+    def take(self, client):
+        """Lấy một token, trả về 0 nếu được phép, ngược lại số giây client nên đợi"""
+        if self.rate <= 0:
+            return 0
+        now = time.monotonic()
+        with self.lock:
+            new_tokens = self.burst if now >= self.fresh_after else 0.0
+            tokens, last = self.buckets.pop(client, (new_tokens, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / self.rate
+                self.rejected_rate += 1
+            self.buckets[client] = (tokens, now)
+            if len(self.buckets) > self.max_clients:
+                _, (old_tokens, old_last) = self.buckets.popitem(last=False)
+                self.fresh_after = max(self.fresh_after, old_last + (self.burst - old_tokens) / self.rate)
+            return wait
+
+    def enter(self):
+        with self.lock:
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                self.rejected_in_flight += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "tracked_clients": len(self.buckets),
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "rejected_rate_limit": self.rejected_rate,
+                "rejected_in_flight": self.rejected_in_flight,
+            }
+
+
+def client_key(scope, api_keys=RATE_LIMIT_API_KEYS):
+    """Client của request: API key nếu là key đã cấu hình, ngược lại là IP"""
+    if api_keys:
+        for name, value in scope.get("headers", ()):
+            if name == API_KEY_HEADER:
+                key = value.decode("latin-1")
+                if key in api_keys:
+                    return "key:" + key
+                break
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+class RateLimitMiddleware:
+    """ASGI middleware, dùng: app.add_middleware(RateLimitMiddleware, limiter=RateLimiter())"""
+
+    def __init__(self, app, limiter=None, exempt_paths=("/health",), api_keys=RATE_LIMIT_API_KEYS):
+        self.app = app
+        self.limiter = limiter or RateLimiter()
+        self.exempt_paths = set(exempt_paths)
+        self.api_keys = frozenset(api_keys)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        wait = self.limiter.take(client_key(scope, self.api_keys))
+        if wait:
+            await reject(send, "Rate limit exceeded", wait)
+            return
+        if not self.limiter.enter():
+            await reject(send, "Gateway overloaded, too many requests in flight", 1)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.leave()
+
+
+async def reject(send, detail, retry_after):
+    body = json.dumps({"detail": detail}).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": 429,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})